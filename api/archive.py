@@ -0,0 +1,130 @@
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import ArchiveCount, Category, Post
+
+# Post counts per month and category for the archive sidebar (`/api/archive/`).
+#
+# ArchiveCount holds one row per month and category (category null for posts
+# without one), so the sidebar sums a few hundred rows instead of grouping
+# every post by month. Months are calendar months in TIME_ZONE, the same ones
+# the posts list's `?year=&month=` ranges cover.
+#
+# api.signals moves a post's count when it is created, deleted, or saved with
+# a different month or category. Bulk writes skip those signals: the importer
+# recounts the months it touched with refresh_months(), one range query each
+# on the created_at index, and `manage.py rebuild_archive` recounts every
+# month, after seed_posts or a change made in SQL.
+
+
+def month_of(value):
+    """The first day of `value`'s month, in the current time zone."""
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date().replace(day=1)
+
+
+def month_range(year, month):
+    """The [start, end) datetimes of a month, in the current time zone."""
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    if settings.USE_TZ:
+        start, end = timezone.make_aware(start), timezone.make_aware(end)
+    return start, end
+
+
+def add_counts(changes, using="default"):
+    """Add `changes` ({(month, category_id): n}, n may be negative) to ArchiveCount."""
+    changes = {key: n for key, n in changes.items() if n}
+    if not changes:
+        return
+    manager = ArchiveCount.objects.using(using)
+    with transaction.atomic(using=using):
+        manager.bulk_create(
+            [ArchiveCount(month=month, category_id=category_id) for month, category_id in changes], ignore_conflicts=True
+        )
+        for (month, category_id), n in changes.items():
+            manager.filter(month=month, category_id=category_id).update(count=F("count") + n)
+
+
+def count_months(months, using="default"):
+    posts = Post.objects.using(using).order_by()
+    counts = Counter()
+    for month in months:
+        start, end = month_range(month.year, month.month)
+        rows = posts.filter(created_at__gte=start, created_at__lt=end).values_list("category_id").annotate(n=Count("id"))
+        for category_id, n in rows:
+            counts[month, category_id] = n
+    return counts
+
+
+def count_all(using="default"):
+    rows = (
+        Post.objects.using(using).order_by().annotate(month=TruncMonth("created_at"))
+        .values_list("month", "category_id").annotate(n=Count("id"))
+    )
+    counts = Counter()
+    for month, category_id, n in rows:
+        counts[month_of(month), category_id] += n
+    return counts
+
+
+def replace_counts(counts, months=None, using="default"):
+    manager = ArchiveCount.objects.using(using)
+    with transaction.atomic(using=using):
+        (manager.filter(month__in=months) if months is not None else manager.all()).delete()
+        manager.bulk_create(
+            [ArchiveCount(month=month, category_id=category_id, count=n) for (month, category_id), n in counts.items()],
+            batch_size=500,
+        )
+
+
+def refresh_months(months, using="default"):
+    """Recount `months` (dates on their first day) from the posts."""
+    months = sorted(set(months))
+    if months:
+        replace_counts(count_months(months, using), months, using)
+
+
+def rebuild(using="default"):
+    """Recount every month. Returns the number of posts counted."""
+    counts = count_all(using)
+    replace_counts(counts, using=using)
+    return sum(counts.values())
+
+
+def get_archive(category=None, using="default"):
+    """
+    Post counts, newest month first: per month, per category and per month
+    and category. `category` (a slug) counts only that category's posts.
+    """
+    rows = ArchiveCount.objects.using(using).filter(count__gt=0)
+    if category is not None:
+        rows = rows.filter(category__slug=category)
+    rows = list(rows.order_by("-month", "category_id").values_list("month", "category_id", "count"))
+    categories = Category.objects.using(using).in_bulk({category_id for _, category_id, _ in rows} - {None})
+
+    def describe(category_id):
+        category = categories.get(category_id)
+        return {"slug": category.slug, "name": category.name} if category else {"slug": None, "name": None}
+
+    months, by_category = Counter(), Counter()
+    for month, category_id, n in rows:
+        months[month] += n
+        by_category[category_id] += n
+    return {
+        "months": [{"year": month.year, "month": month.month, "count": n} for month, n in months.items()],
+        "categories": [
+            {**describe(category_id), "count": n} for category_id, n in by_category.most_common()
+        ],
+        "months_by_category": [
+            {"year": month.year, "month": month.month, "category": describe(category_id)["slug"], "count": n}
+            for month, category_id, n in rows
+        ],
+    }
@@ -0,0 +1,57 @@
+import re
+
+from asgiref.sync import sync_to_async
+from django.urls import re_path
+from django.views import View
+
+from core.db_router import replica_reads
+
+# Async read endpoints for ASGI deployments (`API_ASYNC_VIEWS`).
+#
+# Each route wraps a read-only viewset and calls its `alist`/`aretrieve`
+# (see `AsyncReadOnlyMixin`), so a request waiting on the database or a slow
+# client holds a coroutine rather than a whole worker. The URLs, filters,
+# pagination, response cache and JSON are the same as the DRF routes; other
+# renderers (the browsable API) are handed to the sync viewset.
+
+
+class AsyncViewSetView(View):
+    viewset_class = None
+    http_method_names = ["get", "head", "options"]
+
+    async def get(self, request, *args, **kwargs):
+        action = "retrieve" if kwargs else "list"
+        view = self.viewset_class(action_map={"get": action, "head": action})
+        view.get = view.head = getattr(view, action)   # for the `Allow` header, as in ViewSetMixin.as_view
+        view.args, view.kwargs = args, kwargs
+        view.request = drf_request = view.initialize_request(request, *args, **kwargs)
+        view.headers = view.default_response_headers
+        try:
+            view.format_kwarg = view.get_format_suffix(**kwargs)
+            renderer, media_type = view.perform_content_negotiation(drf_request)
+            drf_request.accepted_renderer, drf_request.accepted_media_type = renderer, media_type
+            if renderer.format != "json":
+                sync_view = self.viewset_class.as_view({"get": action, "head": action})
+                return await sync_to_async(sync_view)(request, *args, **kwargs)
+            # authentication stays lazy: the read-only viewsets are AllowAny and
+            # never look at request.user, which could hit the session table
+            view.check_permissions(drf_request)
+            view.check_throttles(drf_request)
+            handler = view.aretrieve if kwargs else view.alist
+            with replica_reads(action in getattr(view, 'replica_actions', ())):
+                response = await handler(drf_request, *args, **kwargs)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+        return view.finalize_response(drf_request, response, *args, **kwargs)
+
+
+def async_urlpatterns(prefix, viewset, basename):
+    """`<prefix>/` and `<prefix>/<pk>/`, named like the router's routes."""
+    view = AsyncViewSetView.as_view(viewset_class=viewset)
+    # list-level actions (posts/facets/) stay with the router
+    reserved = [re.escape(action.url_path) for action in viewset.get_extra_actions() if not action.detail]
+    lookup = "(?!(?:%s)/)" % "|".join(reserved) if reserved else ""
+    return [
+        re_path(r"^%s/$" % prefix, view, name="%s-list" % basename),
+        re_path(r"^%s/(?P<pk>%s[^/.]+)/$" % (prefix, lookup), view, name="%s-detail" % basename),
+    ]
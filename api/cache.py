@@ -0,0 +1,331 @@
+import asyncio
+import hashlib
+import math
+import threading
+import time
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from core.db_router import replica_used
+
+from .singleflight import SingleFlight
+
+# Versioned response cache for the read-only endpoints.
+#
+# Every cached response is keyed on a global content version, so a write never
+# has to find and delete the entries it affects: `bump_content_version()` (called
+# from `api.signals` once the write commits) just moves every reader onto a
+# fresh set of keys and the old ones age out. Bumping before the commit would
+# let a reader store the old rows under the new version. Works with any Django
+# cache backend, but locmem keeps the version per process: with several
+# workers the cache has to be shared (CACHE_DIR, Redis, Memcached).
+#
+# Misses are single-flight: identical requests arriving while the first one
+# renders wait (up to API_COALESCE_WAIT seconds) and share its bytes instead
+# of running the same queries. API_COALESCE_LOCK extends that across worker
+# processes with a lock in the cache, for caches the workers share. The lock is
+# only as good as the backend's add(): atomic on Redis, Memcached and the
+# database cache, best-effort on the file cache.
+
+VERSION_KEY = "api:content-version"
+CHANGED_AT_KEY = "api:content-changed-at"
+LOCK_POLL_INTERVAL = 0.01
+
+
+def get_cache():
+    return caches[getattr(settings, "API_CACHE_ALIAS", "default")]
+
+
+def get_content_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # seed from the clock so an evicted version key can never come back
+        # as a value that older cached entries were stored under
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_content_version():
+    cache = get_cache()
+    cache.set(CHANGED_AT_KEY, time.time(), timeout=None)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(VERSION_KEY, version, timeout=None)
+        return version
+
+
+def changed_within(seconds):
+    changed_at = get_cache().get(CHANGED_AT_KEY)
+    return changed_at is not None and time.time() - changed_at < seconds
+
+
+class CacheStats:
+    """In-process hit/miss counters for the response cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.not_modified = 0
+            self.coalesced = 0
+            self.coalesce_timeouts = 0
+
+    def incr(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def as_dict(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "coalesced": self.coalesced,
+                "coalesce_timeouts": self.coalesce_timeouts,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+stats = CacheStats()
+flights = SingleFlight()
+
+
+def normalized_query(request):
+    # sorted params with blank values dropped: ?b=1&a=2 and ?a=2&b=1&search= share a key
+    items = []
+    for key in sorted(request.query_params):
+        values = sorted(v for v in request.query_params.getlist(key) if v != "")
+        items.extend((key, v) for v in values)
+    return urlencode(items)
+
+
+def make_etag(content):
+    return '"%s"' % hashlib.sha1(content).hexdigest()
+
+
+def etag_matches(request, etag):
+    header = request.META.get("HTTP_IF_NONE_MATCH")
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return "*" in etags or etag in etags
+
+
+class CachedResponseMixin:
+    """
+    Serves `list`/`retrieve` (and the async `alist`/`aretrieve`) from the
+    response cache and answers `If-None-Match` with 304. Only JSON responses
+    are cached; the browsable API always renders fresh.
+    """
+    cache_timeout = None   # falls back to settings.API_CACHE_TIMEOUT
+
+    def get_response_cache_key(self, request):
+        raw = "|".join([
+            request.scheme,
+            request.get_host(),
+            request.path,
+            request.accepted_media_type or "",
+            normalized_query(request),
+        ])
+        digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        return "api:response:%s:%s" % (get_content_version(), digest)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if getattr(request.accepted_renderer, "format", None) != "json":
+            return handler(request, *args, **kwargs)
+
+        key, entry = self.get_cached_entry(request)
+        if entry is not None:
+            stats.incr("hits")
+            return self.entry_response(request, entry, "HIT")
+
+        stats.incr("misses")
+        if not getattr(settings, "API_COALESCE", True):
+            return self.fill_entry(handler, request, key, *args, **kwargs)[0]
+
+        flight, leader = flights.join(key)
+        if not leader:
+            entry = flight.wait(self.get_coalesce_wait())
+            if entry is not None:
+                stats.incr("coalesced")
+                return self.entry_response(request, entry, "COALESCED")
+            if not flight.done:
+                stats.incr("coalesce_timeouts")
+            return self.fill_entry(handler, request, key, *args, **kwargs)[0]
+
+        entry, locked = None, False
+        try:
+            if getattr(settings, "API_COALESCE_LOCK", False):
+                entry, locked = self.wait_for_fill_lock(key)
+                if entry is not None:
+                    stats.incr("coalesced")
+                    return self.entry_response(request, entry, "COALESCED")
+            response, entry = self.fill_entry(handler, request, key, *args, **kwargs)
+            return response
+        finally:
+            flights.finish(key, flight, entry)
+            if locked:
+                get_cache().delete(key + ":lock")
+
+    async def acached_response(self, handler, request, *args, **kwargs):
+        """`cached_response` for async handlers (`alist`/`aretrieve`)."""
+        if getattr(request.accepted_renderer, "format", None) != "json":
+            return await handler(request, *args, **kwargs)
+
+        # version + entry in one hop to a worker thread (the cache's own a* methods take one each)
+        key, entry = await sync_to_async(self.get_cached_entry)(request)
+        if entry is not None:
+            stats.incr("hits")
+            return self.entry_response(request, entry, "HIT")
+
+        stats.incr("misses")
+        if not getattr(settings, "API_COALESCE", True):
+            return (await self.afill_entry(handler, request, key, *args, **kwargs))[0]
+
+        flight, leader = flights.join(key)
+        if not leader:
+            entry = await flight.await_result(self.get_coalesce_wait())
+            if entry is not None:
+                stats.incr("coalesced")
+                return self.entry_response(request, entry, "COALESCED")
+            if not flight.done:
+                stats.incr("coalesce_timeouts")
+            return (await self.afill_entry(handler, request, key, *args, **kwargs))[0]
+
+        entry, locked = None, False
+        try:
+            if getattr(settings, "API_COALESCE_LOCK", False):
+                entry, locked = await self.await_fill_lock(key)
+                if entry is not None:
+                    stats.incr("coalesced")
+                    return self.entry_response(request, entry, "COALESCED")
+            response, entry = await self.afill_entry(handler, request, key, *args, **kwargs)
+            return response
+        finally:
+            flights.finish(key, flight, entry)
+            if locked:
+                await get_cache().adelete(key + ":lock")
+
+    def fill_entry(self, handler, request, key, *args, **kwargs):
+        """
+        Run `handler` for a miss and cache its response. Returns the response
+        and the cache entry (None unless it was a 200).
+        """
+        response = handler(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response, None
+        entry = self.render_entry(request, response)
+        if self.can_store_response():
+            get_cache().set(key, entry, self.get_cache_timeout())
+        return self.entry_response(request, entry, "MISS"), entry
+
+    async def afill_entry(self, handler, request, key, *args, **kwargs):
+        response = await handler(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response, None
+        entry = self.render_entry(request, response)
+        if not replica_used() or await sync_to_async(self.can_store_response)():
+            await get_cache().aset(key, entry, self.get_cache_timeout())
+        return self.entry_response(request, entry, "MISS"), entry
+
+    def wait_for_fill_lock(self, key):
+        """
+        Cross-process single flight through the cache: (None, True) once this
+        process holds `key`'s fill lock, (entry, False) if another process
+        filled it meanwhile, (None, False) when the wait runs out.
+        """
+        cache = get_cache()
+        wait = self.get_coalesce_wait()
+        deadline = time.monotonic() + wait
+        while True:
+            locked = cache.add(key + ":lock", 1, timeout=max(1, math.ceil(wait)))
+            # checked after taking the lock too: its last holder may have just filled the key
+            entry = cache.get(key)
+            if entry is not None:
+                if locked:
+                    cache.delete(key + ":lock")
+                return entry, False
+            if locked:
+                return None, True
+            if time.monotonic() >= deadline:
+                stats.incr("coalesce_timeouts")
+                return None, False
+            time.sleep(LOCK_POLL_INTERVAL)
+
+    async def await_fill_lock(self, key):
+        cache = get_cache()
+        wait = self.get_coalesce_wait()
+        deadline = time.monotonic() + wait
+        while True:
+            locked = await cache.aadd(key + ":lock", 1, timeout=max(1, math.ceil(wait)))
+            entry = await cache.aget(key)
+            if entry is not None:
+                if locked:
+                    await cache.adelete(key + ":lock")
+                return entry, False
+            if locked:
+                return None, True
+            if time.monotonic() >= deadline:
+                stats.incr("coalesce_timeouts")
+                return None, False
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+    def can_store_response(self):
+        # a replica read soon after a write may predate it, yet would be
+        # cached under the version that write moved to
+        lag = getattr(settings, "DATABASE_REPLICA_LAG", 0)
+        return not (lag and replica_used() and changed_within(lag))
+
+    def get_coalesce_wait(self):
+        return getattr(settings, "API_COALESCE_WAIT", 2.0)
+
+    def get_cache_timeout(self):
+        return self.cache_timeout or getattr(settings, "API_CACHE_TIMEOUT", 300)
+
+    def get_cached_entry(self, request):
+        key = self.get_response_cache_key(request)
+        return key, get_cache().get(key)
+
+    def render_entry(self, request, response):
+        response.accepted_renderer = request.accepted_renderer
+        response.accepted_media_type = request.accepted_media_type
+        response.renderer_context = self.get_renderer_context()
+        response.render()
+        return make_etag(response.content), response["Content-Type"], response.content
+
+    def entry_response(self, request, entry, cache_status):
+        etag, content_type, content = entry
+        if etag_matches(request, etag):
+            stats.incr("not_modified")
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type=content_type)
+        response["ETag"] = etag
+        response["X-Cache"] = cache_status
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        return await self.acached_response(super().alist, request, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await self.acached_response(super().aretrieve, request, *args, **kwargs)
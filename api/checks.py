@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_response_cache(app_configs, **kwargs):
+    # the content version lives in the cache: in locmem, each worker process has its own
+    alias = getattr(settings, "API_CACHE_ALIAS", "default")
+    if not isinstance(caches[alias], LocMemCache):
+        return []
+    return [Warning(
+        "The API response cache (API_CACHE_ALIAS=%r) is an in-process LocMemCache." % alias,
+        hint=(
+            "Each worker keeps its own content version, so a write handled by one worker leaves the "
+            "others serving their cached responses until API_CACHE_TIMEOUT. Set CACHE_DIR, or point "
+            "API_CACHE_ALIAS at Redis or Memcached, when running more than one worker process."
+        ),
+        id="api.W001",
+    )]
@@ -0,0 +1,130 @@
+import atexit
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Greatest, Least, Log, Power
+from django.utils import timezone
+
+from .models import Post, PostStats
+
+# Write-behind view counts and the trending score (PostStats).
+#
+# A detail view only bumps an in-memory counter. Each process flushes its
+# counters every VIEW_FLUSH_INTERVAL seconds from a background thread, and on
+# exit: one INSERT of the missing PostStats rows, then one UPDATE per distinct
+# count, incrementing in SQL so concurrent flushes from other workers add up.
+#
+# A view at time t weighs 2 ** ((t - TRENDING_EPOCH) / half-life), and
+# `PostStats.trending` is log2 of the sum of a post's weights. Every weight
+# grows at the same rate, so sorting by the column sorts by views decayed to
+# any one moment, and rows never need rewriting as time passes. The log keeps
+# the value finite. `decayed_views()` turns it back into a view count.
+
+logger = logging.getLogger(__name__)
+
+TRENDING_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def get_trending_limit():
+    return getattr(settings, "TRENDING_POSTS_LIMIT", 20)
+
+
+def get_half_life():
+    return getattr(settings, "TRENDING_HALF_LIFE_HOURS", 24) * 3600
+
+
+def trending_age(now=None):
+    """Half-lives from TRENDING_EPOCH to `now`: log2 of a view's weight at that time."""
+    return ((now or timezone.now()) - TRENDING_EPOCH).total_seconds() / get_half_life()
+
+
+def decayed_views(trending, now=None):
+    return 2 ** (trending - trending_age(now))
+
+
+def add_views(trending, log_weight):
+    """SQL for log2(2 ** trending + 2 ** log_weight), without overflowing."""
+    log_weight = Value(log_weight, output_field=FloatField())
+    high, low = Greatest(trending, log_weight), Least(trending, log_weight)
+    return high + Log(2, 1 + Power(2, low - high))
+
+
+def flush_counts(counts, using="default"):
+    """Add `counts` ({post_id: views}) to PostStats."""
+    age = trending_age()
+    with transaction.atomic(using=using):
+        # posts deleted since they were viewed have nothing to count against
+        post_ids = list(Post.objects.using(using).filter(pk__in=list(counts)).values_list("id", flat=True))
+        PostStats.objects.using(using).bulk_create(
+            [PostStats(post_id=post_id) for post_id in post_ids], batch_size=500, ignore_conflicts=True
+        )
+        groups = {}
+        for post_id in post_ids:
+            groups.setdefault(counts[post_id], []).append(post_id)
+        for views, ids in groups.items():
+            for start in range(0, len(ids), 500):
+                PostStats.objects.using(using).filter(post_id__in=ids[start:start + 500]).update(
+                    views=F("views") + views,
+                    trending=add_views(F("trending"), math.log2(views) + age),
+                )
+
+
+class ViewCounter:
+    """Per-process view counts waiting to be flushed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._pid = None
+
+    def record(self, post_id):
+        with self._lock:
+            if self._pid != os.getpid():
+                # first view in this process; anything inherited over a fork is the parent's to flush
+                self._pid = os.getpid()
+                self._counts = Counter()
+                self.start()
+            self._counts[post_id] += 1
+
+    def start(self):
+        interval = getattr(settings, "VIEW_FLUSH_INTERVAL", 10)
+        if interval:
+            threading.Thread(target=self.run, args=(interval,), name="view-counts", daemon=True).start()
+        atexit.register(self.flush)
+
+    def run(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+                connections.close_all()
+            except Exception:
+                # an unexpected error mustn't end the thread: later views would never be flushed
+                logger.exception("View count flush failed")
+
+    def take(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        return counts
+
+    def flush(self, using="default"):
+        counts = self.take()
+        if not counts:
+            return
+        try:
+            flush_counts(counts, using)
+        except DatabaseError:
+            logger.exception("Flushing %d view counts failed; keeping them for the next flush", len(counts))
+            with self._lock:
+                self._counts.update(counts)
+
+
+view_counter = ViewCounter()
@@ -0,0 +1,153 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import Post, PostTombstone
+from .serializers import PostListFastSerializer, PostListSerializer, post_columns
+
+try:
+    import orjson
+except ImportError:  # optional speedup; falls back to the stdlib encoder
+    orjson = None
+
+# Bulk export and change feed for posts (`/api/posts/export/`, `manage.py export_posts`).
+#
+# Posts are read with one `.values()` query through `.iterator(chunk_size=...)`
+# and serialized a chunk at a time (tags fetched per chunk), so memory stays
+# flat however many posts there are. Without `since` the export is every post
+# by id. With `since` it is a change feed: posts whose `updated_at` falls in
+# (since, until], then tombstones for posts deleted in that window. A mirror
+# passes `until` back as the next `since`.
+#
+# `updated_at` is stamped when a row is written, not when its transaction
+# commits, so a write can become visible with a time the export has already
+# passed. `until` therefore trails the export's start by EXPORT_COMMIT_MARGIN
+# seconds, which has to be longer than any write transaction: a write stamped
+# before `until` has committed by the time the export reads. Rows changed
+# within the margin come again in the next run, so mirrors apply records as
+# upserts by id.
+
+EXPORT_FIELDS = PostListSerializer.Meta.fields
+FORMATS = ("ndjson", "csv")
+CHUNK_SIZE = 1000
+
+timestamp_field = serializers.DateTimeField()
+
+
+def parse_since(value):
+    """`since` as an aware datetime (ISO 8601), or None when absent."""
+    if not value:
+        return None
+    try:
+        return timestamp_field.to_internal_value(value)
+    except serializers.ValidationError as exc:
+        raise serializers.ValidationError({"since": exc.detail})
+
+
+def get_commit_margin():
+    return getattr(settings, "EXPORT_COMMIT_MARGIN", 60)
+
+
+def encode_json(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class PostExport:
+    def __init__(self, fields=EXPORT_FIELDS, since=None, request=None, using=None, chunk_size=CHUNK_SIZE):
+        self.fields = list(fields)
+        self.since = since
+        self.until = timezone.now() - timedelta(seconds=get_commit_margin())
+        self.request = request
+        self.using = using
+        self.chunk_size = chunk_size
+        self.counts = {"posts": 0, "deleted": 0}
+
+    @property
+    def until_value(self):
+        return timestamp_field.to_representation(self.until)
+
+    def get_posts(self):
+        posts = Post.objects.db_manager(self.using).all()
+        if self.since is None:
+            return posts.order_by("id")
+        return posts.filter(updated_at__gt=self.since, updated_at__lte=self.until).order_by("updated_at", "id")
+
+    def get_tombstones(self):
+        if self.since is None:
+            return PostTombstone.objects.none()
+        return (
+            PostTombstone.objects.db_manager(self.using)
+            .filter(deleted_at__gt=self.since, deleted_at__lte=self.until)
+            .order_by("deleted_at", "post_id")
+        )
+
+    def records(self):
+        """Lists of output records, one per chunk: posts, then deletions."""
+        serializer = PostListFastSerializer(None, context={"fields": self.fields, "request": self.request})
+        rows = self.get_posts().values(*post_columns(self.fields)).iterator(chunk_size=self.chunk_size)
+        while chunk := list(islice(rows, self.chunk_size)):
+            self.counts["posts"] += len(chunk)
+            yield serializer.to_representation(chunk)
+
+        tombstones = self.get_tombstones().values_list("post_id", "deleted_at").iterator(chunk_size=self.chunk_size)
+        while chunk := list(islice(tombstones, self.chunk_size)):
+            self.counts["deleted"] += len(chunk)
+            yield [
+                {"id": post_id, "updated_at": timestamp_field.to_representation(deleted_at), "deleted": True}
+                for post_id, deleted_at in chunk
+            ]
+
+    def ndjson(self):
+        for records in self.records():
+            yield b"".join(encode_json(record) + b"\n" for record in records)
+
+    def csv(self):
+        # lists and objects (tags, image renditions) go in as JSON text
+        columns = self.fields + (["deleted"] if self.since is not None else [])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def cell(value):
+            if value is None:
+                return ""
+            if isinstance(value, (bool, list, dict)):
+                return encode_json(value).decode()
+            return value
+
+        writer.writerow(columns)
+        for records in self.records():
+            writer.writerows(
+                [cell(record.get(column, False if column == "deleted" else None)) for column in columns]
+                for record in records
+            )
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+
+    def stream(self, format):
+        return getattr(self, format)()
+
+
+async def aiterate(iterator):
+    """
+    Drive a sync, database-reading iterator from an async response (ASGI),
+    one thread hop per chunk. Django would otherwise buffer it whole.
+    """
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(iterator, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(iterator.close)()
@@ -1,10 +1,108 @@
+from datetime import MAXYEAR
+
 import django_filters
-from .models import Post
+from django.db import connections
+from django.db.models import Exists, OuterRef
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter, SearchFilter
+from .archive import month_range
+from .models import Category, Post
+from .search import get_search_backend
+
 
 class PostFilter(django_filters.FilterSet):
-    category = django_filters.CharFilter(field_name="category__slug", lookup_expr="iexact")
-    tag = django_filters.CharFilter(field_name="tags__slug", lookup_expr="iexact")
+    """
+    `?category=slug`, `?tag=a,b` (any of the tags), `?tag=a,b&tag_mode=all`,
+    and `?year=2025` or `?year=2025&month=3` for an archive page.
+
+    The category and tag filters are semi-joins (IN/EXISTS subqueries, or jsonb
+    containment on `tag_slugs` where the database supports it), so they never
+    multiply rows and the list query doesn't need DISTINCT. The date filters
+    are a `created_at` range, which the created_at index answers.
+    """
+    category = django_filters.CharFilter(method="filter_category")
+    tag = django_filters.CharFilter(method="filter_tag")
+    tag_mode = django_filters.ChoiceFilter(
+        choices=[("any", "any"), ("all", "all")], method="filter_tag_mode", empty_label=None
+    )
+    # the last year whose end is still a datetime
+    year = django_filters.NumberFilter(method="filter_year", min_value=1, max_value=MAXYEAR - 1)
+    month = django_filters.NumberFilter(method="filter_month", min_value=1, max_value=12)
 
     class Meta:
         model = Post
-        fields = ['category', 'tag']
+        fields = ['category', 'tag', 'tag_mode', 'year', 'month']
+
+    def filter_category(self, queryset, name, value):
+        # uncorrelated IN, so the planner can start from the category_id index
+        return queryset.filter(category_id__in=Category.objects.filter(slug=value.strip().lower()).values("pk"))
+
+    def filter_tag(self, queryset, name, value):
+        slugs = list(dict.fromkeys(s.strip().lower() for s in value.split(",") if s.strip()))
+        if not slugs:
+            return queryset
+        match_all = self.form.cleaned_data.get("tag_mode") == "all"
+
+        if connections[queryset.db].features.supports_json_field_contains:
+            # answered from the GIN index on tag_slugs
+            if match_all:
+                return queryset.filter(tag_slugs__contains=slugs)
+            return queryset.filter(tag_slugs__has_any_keys=slugs)
+
+        Through = Post.tags.through
+        if match_all:
+            for slug in slugs:
+                queryset = queryset.filter(Exists(Through.objects.filter(post_id=OuterRef("pk"), tag__slug=slug)))
+            return queryset
+        return queryset.filter(Exists(Through.objects.filter(post_id=OuterRef("pk"), tag__slug__in=slugs)))
+
+    def filter_tag_mode(self, queryset, name, value):
+        # read by filter_tag
+        return queryset
+
+    def filter_year(self, queryset, name, value):
+        year, month = int(value), self.form.cleaned_data.get("month")
+        if month is not None:
+            start, end = month_range(year, int(month))
+        else:
+            start, end = month_range(year, 1)[0], month_range(year + 1, 1)[0]
+        return queryset.filter(created_at__gte=start, created_at__lt=end)
+
+    def filter_month(self, queryset, name, value):
+        # read by filter_year
+        if self.form.cleaned_data.get("year") is None:
+            raise ValidationError({"month": ["Needs ?year= as well."]})
+        return queryset
+
+
+class PostSearchFilter(SearchFilter):
+    """
+    `?search=` through the full-text index from `api.search`. Falls back to
+    DRF's icontains search over `view.search_fields` when no index is installed.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+
+        backend = get_search_backend(queryset.db)
+        if backend is None:
+            return super().filter_queryset(request, queryset, view)
+
+        # only pay for the per-row rank lookup when the client sorts by it
+        ordering = request.query_params.get(OrderingFilter.ordering_param, "")
+        with_rank = "rank" in [f.strip().lstrip("-") for f in ordering.split(",")]
+        return backend.search(queryset, search_terms, with_rank=with_rank)
+
+
+class PostOrderingFilter(OrderingFilter):
+    """
+    Allows `?ordering=rank`, but only once `PostSearchFilter` has annotated a rank.
+    """
+
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        fields = super().remove_invalid_fields(queryset, fields, view, request)
+        if "rank" not in queryset.query.annotations:
+            fields = [f for f in fields if f.lstrip("-") != "rank"]
+        return fields
@@ -0,0 +1,173 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .cache import bump_content_version
+from .models import Post
+
+# Responsive renditions for Post.image.
+#
+# Every upload gets resized copies at IMAGE_RENDITION_WIDTHS (never upscaled),
+# each in the original format and as WebP, stored next to the original:
+#   post_images/cat.jpg -> post_images/cat.w320.jpg, post_images/cat.w320.webp, ...
+# What was generated is recorded in Post.image_renditions, which the API turns
+# into `srcset` strings. Generation runs on a small thread pool after the
+# saving transaction commits, so admin saves don't wait on Pillow.
+
+logger = logging.getLogger(__name__)
+
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+_executor = None
+
+
+def rendition_widths():
+    return tuple(sorted(getattr(settings, "IMAGE_RENDITION_WIDTHS", (320, 640, 1024))))
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, "IMAGE_RENDITION_WORKERS", 2)
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="renditions")
+    return _executor
+
+
+def rendition_name(name, width, ext):
+    root, _ = os.path.splitext(name)
+    return "%s.w%d.%s" % (root, width, ext)
+
+
+def _encode(image, fmt):
+    buffer = BytesIO()
+    if fmt == "WEBP":
+        image.save(buffer, "WEBP", quality=WEBP_QUALITY, method=4)
+    elif fmt == "JPEG":
+        image.convert("RGB").save(buffer, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(buffer, fmt, optimize=True)
+    return buffer.getvalue()
+
+
+def generate_renditions(name, storage=None):
+    """
+    Write the resized/WebP copies of `name` and return the
+    `Post.image_renditions` record describing them.
+    """
+    from PIL import Image, ImageOps
+
+    storage = storage or Post._meta.get_field("image").storage
+    with storage.open(name, "rb") as fh:
+        original = Image.open(fh)
+        original.load()
+    fmt = original.format or "JPEG"
+    image = ImageOps.exif_transpose(original)
+    if image.mode not in ("RGB", "RGBA"):
+        # palette/greyscale/CMYK images can't be resampled with LANCZOS as-is
+        has_alpha = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    ext = {"JPEG": "jpg", "PNG": "png", "GIF": "png", "WEBP": "webp"}.get(fmt, "jpg")
+    outputs = [("default", {"jpg": "JPEG", "png": "PNG", "webp": "WEBP"}[ext], ext)]
+    if ext != "webp":
+        outputs.append(("webp", "WEBP", "webp"))
+
+    record = {"source": name, "width": image.width, "height": image.height, "default": [], "webp": []}
+    for width in rendition_widths():
+        if width >= image.width:
+            break
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        for key, out_fmt, out_ext in outputs:
+            out_name = rendition_name(name, width, out_ext)
+            if storage.exists(out_name):
+                storage.delete(out_name)
+            record[key].append([width, storage.save(out_name, ContentFile(_encode(resized, out_fmt)))])
+
+    # full-size WebP so the largest candidate has a modern encoding too
+    if ext != "webp":
+        out_name = rendition_name(name, image.width, "webp")
+        if storage.exists(out_name):
+            storage.delete(out_name)
+        record["webp"].append([image.width, storage.save(out_name, ContentFile(_encode(image, "WEBP")))])
+    return record
+
+
+def delete_renditions(record, storage=None):
+    storage = storage or Post._meta.get_field("image").storage
+    for key in ("default", "webp"):
+        for _, name in record.get(key, []):
+            if name != record.get("source") and storage.exists(name):
+                storage.delete(name)
+
+
+def process_post_image(post_id, name, previous=None):
+    """Generate renditions for one post and record them on the row."""
+    record = generate_renditions(name)
+    # only record if the post still points at the same upload
+    updated = Post.objects.filter(pk=post_id, image=name).update(image_renditions=record, updated_at=timezone.now())
+    if previous and previous.get("source") != name:
+        delete_renditions(previous)
+    if updated:
+        from .postcache import invalidate   # imports the serializers, which import this module
+        transaction.on_commit(bump_content_version)
+        invalidate([post_id])
+    return record
+
+
+def _process_in_background(post_id, name, previous):
+    try:
+        process_post_image(post_id, name, previous)
+    except Exception:
+        logger.exception("Generating renditions for post %s (%s) failed", post_id, name)
+    finally:
+        # pool threads get their own DB connections; don't leave them open
+        connections.close_all()
+
+
+def schedule_renditions(post):
+    """Queue rendition generation for `post` once the current transaction commits."""
+    name = post.image.name if post.image else ""
+    previous = post.image_renditions or {}
+    if name == previous.get("source", ""):
+        return
+    if not name:
+        Post.objects.filter(pk=post.pk).update(image_renditions={})
+        transaction.on_commit(lambda: delete_renditions(previous))
+        return
+    if getattr(settings, "IMAGE_RENDITIONS_SYNC", False):
+        transaction.on_commit(lambda: process_post_image(post.pk, name, previous))
+    else:
+        transaction.on_commit(lambda: get_executor().submit(_process_in_background, post.pk, name, previous))
+
+
+def renditions_representation(record, image_name, url):
+    """
+    API shape for a rendition record: `srcset` strings ready for <img>/<source>,
+    plus the smallest candidate as a thumbnail. `url` turns a storage name into
+    an absolute URL. None until renditions for the current `image_name` exist.
+    """
+    if not record or not image_name or record.get("source") != image_name:
+        return None
+    default = [*record["default"], [record["width"], record["source"]]]
+    webp = record["webp"] or default
+    return {
+        "width": record["width"],
+        "height": record["height"],
+        "thumbnail": url(default[0][1]),
+        "srcset": ", ".join("%s %dw" % (url(name), width) for width, name in default),
+        "webp_srcset": ", ".join("%s %dw" % (url(name), width) for width, name in webp),
+    }
+
+
+def thumbnail_name(post):
+    record = post.image_renditions or {}
+    if record.get("source") == (post.image.name if post.image else None) and record.get("default"):
+        return record["default"][0][1]
+    return None
@@ -0,0 +1,268 @@
+from collections import Counter
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+from rest_framework.exceptions import ValidationError
+
+from . import archive, postcache, search
+from .cache import bump_content_version
+from .models import Category, Post, Tag, make_excerpt
+from .serializers import PostImportSerializer
+from .suggest import suggester
+
+# Bulk create/update of posts (`POST /api/posts/bulk/`, `manage.py import_posts`).
+#
+# A batch is written in one transaction with a fixed number of queries
+# whatever its size: categories, tags and authors are looked up (and the
+# missing categories and tags created) for all rows at once, new posts get
+# their slugs from one lookup of the taken ones, rows with a slug go through
+# one `INSERT ... ON CONFLICT (slug) DO UPDATE`, and the tag links are
+# replaced with one DELETE and one bulk INSERT. None of that sends the model
+# signals, so the search index, suggestions, tombstones, archive counts and
+# caches are updated here instead. Related posts are not: run
+# rebuild_related_posts after a large import.
+
+UPDATE_FIELDS = ["title", "body", "excerpt", "author", "category", "tag_slugs", "updated_at"]
+CHUNK_SIZE = 500
+
+
+def get_max_rows():
+    return getattr(settings, "BULK_IMPORT_MAX_ROWS", 1000)
+
+
+def chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def resolve_names(model, names, using="default"):
+    """
+    Ids of the categories or tags called `names`, creating the missing ones;
+    an existing one with the same slug counts as a match. Returns
+    ({name: id}, [created instances]).
+    """
+    manager = model.objects.using(using)
+
+    def lookup():
+        found = {}
+        for chunk in chunks(names):
+            by_slug = {}
+            for name in chunk:
+                by_slug.setdefault(slugify(name), []).append(name)
+            rows = manager.filter(Q(name__in=chunk) | Q(slug__in=list(by_slug))).values_list("id", "name", "slug")
+            for item_id, name, slug in rows:
+                for requested in by_slug.get(slug, ()):
+                    found.setdefault(requested, item_id)
+                found[name] = item_id
+        return found
+
+    names = list(dict.fromkeys(names))
+    found = lookup()
+    missing = [name for name in names if name not in found]
+    if not missing:
+        return found, []
+    manager.bulk_create([model(name=name, slug=slugify(name)) for name in missing], ignore_conflicts=True)
+    found = lookup()
+    created = []
+    for chunk in chunks(missing):
+        created.extend(manager.filter(name__in=chunk))
+    return found, created
+
+
+def numbered(base, n):
+    suffix = "-%d" % n
+    return base[:300 - len(suffix)] + suffix
+
+
+def unique_slugs(titles, reserved=(), using="default"):
+    """
+    A free slug for each of `titles`: slugify(title), or with -2, -3, ...
+    appended when that is taken, by a post or by `reserved`, or by an
+    earlier title in the list.
+    """
+    bases = [slugify(title)[:300] or "post" for title in titles]
+    copies = Counter(bases)
+    posts = Post.objects.using(using)
+    taken = set(reserved)
+
+    def fetch(slugs):
+        for chunk in chunks(slugs):
+            taken.update(posts.filter(slug__in=chunk).values_list("slug", flat=True))
+
+    fetch(copies)
+    # numbered slugs for the bases that are taken or repeat, checked a window
+    # at a time (slug__in, so the unique index answers) until each base has a
+    # free one for every row that needs it
+    free = {base: int(base not in taken) for base in copies}
+    crowded = {base: 2 for base in copies if free[base] < copies[base]}
+    while crowded:
+        windows = {base: range(n, n + max(10, copies[base])) for base, n in crowded.items()}
+        fetch(numbered(base, n) for base, window in windows.items() for n in window)
+        for base, window in windows.items():
+            free[base] += sum(numbered(base, n) not in taken for n in window)
+        crowded = {base: window.stop for base, window in windows.items() if free[base] < copies[base]}
+
+    slugs, counters = [], {}
+    for base in bases:
+        slug, n = base, counters.get(base, 1)
+        while slug in taken:
+            n += 1
+            slug = numbered(base, n)
+        counters[base] = n
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def kept_fields(data):
+    """The UPDATE_FIELDS an update from `data` leaves as they are."""
+    kept = set()
+    if not data.get("author"):
+        # neither clears the author nor hands the post to whoever runs the import
+        kept.add("author")
+    if "category" not in data:
+        kept.add("category")
+    if "tag" not in data:
+        kept.add("tag_slugs")
+    return frozenset(kept)
+
+
+def import_posts(rows, author=None, using="default"):
+    """
+    Create or update a post for each of `rows` (dicts shaped like
+    PostImportSerializer), in one transaction. `author` (a user, or None)
+    writes the new posts whose rows don't name one. An update keeps the
+    post's author unless the row names a user, and its category and tags
+    unless the row has those keys.
+
+    Returns one result per row, in order: {"status": "created" | "updated",
+    "id", "slug"}, or {"status": "error", "errors"} for a row that was skipped.
+    """
+    results = [None] * len(rows)
+    valid = []
+    # one serializer for every row: building its fields is most of the cost of is_valid()
+    serializer = PostImportSerializer()
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, serializer.run_validation(row)))
+        except ValidationError as exc:
+            results[index] = {"status": "error", "errors": exc.detail}
+
+    def reject(index, field, message):
+        results[index] = {"status": "error", "errors": {field: [message]}}
+
+    # a slug twice in one batch: the later row would silently overwrite the first
+    seen = set()
+    for index, data in valid:
+        if "slug" in data:
+            if data["slug"] in seen:
+                reject(index, "slug", "Already used by an earlier row.")
+            seen.add(data["slug"])
+
+    User = get_user_model()
+    usernames = {data["author"] for index, data in valid if data.get("author") and results[index] is None}
+    authors = {}
+    for chunk in chunks(usernames):
+        authors.update(User.objects.using(using).filter(username__in=chunk).values_list("username", "id"))
+    for index, data in valid:
+        if data.get("author") and data["author"] not in authors:
+            reject(index, "author", "No user named %r." % data["author"])
+    valid = [(index, data) for index, data in valid if results[index] is None]
+    if not valid:
+        return results
+
+    with transaction.atomic(using=using):
+        categories, new_categories = resolve_names(
+            Category, [data["category"] for _, data in valid if data.get("category")], using
+        )
+        tags, new_tags = resolve_names(Tag, [name for _, data in valid for name in data.get("tag", [])], using)
+        tag_slugs = dict(Tag.objects.using(using).filter(pk__in=set(tags.values())).values_list("id", "slug"))
+
+        upserts = [(index, data) for index, data in valid if "slug" in data]
+        inserts = [(index, data) for index, data in valid if "slug" not in data]
+        existing = {}
+        for chunk in chunks(data["slug"] for _, data in upserts):
+            existing.update(Post.objects.using(using).filter(slug__in=chunk).values_list("slug", "created_at"))
+        new_slugs = unique_slugs([data["title"] for _, data in inserts], [data["slug"] for _, data in upserts], using)
+
+        posts, links = {}, {}
+        for (index, data), slug in zip(upserts + inserts, [data["slug"] for _, data in upserts] + new_slugs):
+            tag_ids = list(dict.fromkeys(tags[name] for name in data.get("tag", [])))
+            if slug not in existing or "tag" in data:
+                links[index] = tag_ids
+            posts[index] = Post(
+                title=data["title"],
+                slug=slug,
+                body=data["body"],
+                excerpt=make_excerpt(data["body"]),
+                author_id=authors[data["author"]] if data.get("author") else getattr(author, "pk", None),
+                category_id=categories[data["category"]] if data.get("category") else None,
+                # bulk writes skip m2m_changed, so fill the denormalized column here
+                tag_slugs=sorted({tag_slugs[tag_id] for tag_id in tag_ids}),
+            )
+
+        manager = Post.objects.using(using)
+        # one upsert per set of columns to leave alone (at most eight)
+        groups = {}
+        for index, data in upserts:
+            groups.setdefault(kept_fields(data), []).append(posts[index])
+        for kept, group in groups.items():
+            # ON CONFLICT ... DO UPDATE hands back the id of the updated row as well
+            manager.bulk_create(
+                group,
+                batch_size=CHUNK_SIZE,
+                update_conflicts=True,
+                unique_fields=["slug"],
+                update_fields=[name for name in UPDATE_FIELDS if name not in kept],
+            )
+        manager.bulk_create([posts[index] for index, _ in inserts], batch_size=CHUNK_SIZE)
+        # raw executemany() from here on: no model instances or per-row SQL to build
+        connection = connections[using]
+        quote = connection.ops.quote_name
+        # created_at is auto_now_add, so a given one is written afterwards
+        field = Post._meta.get_field("created_at")
+        dated = []
+        for index, data in valid:
+            if "created_at" in data:
+                posts[index].created_at = data["created_at"]
+                dated.append((field.get_db_prep_value(data["created_at"], connection), posts[index].pk))
+
+        Through = Post.tags.through
+        updated_ids = [posts[index].pk for index, data in upserts if data["slug"] in existing]
+        retagged = [posts[index].pk for index, data in upserts if data["slug"] in existing and index in links]
+        for chunk in chunks(retagged):
+            Through.objects.using(using).filter(post_id__in=chunk).delete()
+        with connection.cursor() as cursor:
+            if dated:
+                cursor.executemany(
+                    "UPDATE %s SET %s = %%s WHERE id = %%s" % (quote(Post._meta.db_table), quote(field.column)),
+                    dated,
+                )
+            cursor.executemany(
+                "INSERT INTO %s (post_id, tag_id) VALUES (%%s, %%s)" % quote(Through._meta.db_table),
+                [(posts[index].pk, tag_id) for index, tag_ids in links.items() for tag_id in tag_ids],
+            )
+
+        for chunk in chunks(post.pk for post in posts.values()):
+            search.index_posts(chunk, alias=using)
+        # the months updated posts leave and the ones every post lands in
+        months = {archive.month_of(created_at) for created_at in existing.values()}
+        months.update(
+            archive.month_of(posts[index].created_at)
+            for index, data in valid if "created_at" in data or data.get("slug") not in existing
+        )
+        archive.refresh_months(months, using=using)
+        transaction.on_commit(bump_content_version, using=using)
+        postcache.invalidate(updated_ids, using=using)
+        for instance in [*new_categories, *new_tags, *posts.values()]:
+            transaction.on_commit(partial(suggester.update, instance), using=using)
+
+    updated = set(updated_ids)
+    for index, post in posts.items():
+        results[index] = {"status": "updated" if post.pk in updated else "created", "id": post.pk, "slug": post.slug}
+    return results
@@ -0,0 +1,197 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Per-request timing (DB, serialize, render) reported as `Server-Timing`,
+# in-process latency histograms per route for `/api/_metrics`, and a log of
+# queries slower than `SLOW_QUERY_MS`.
+
+slow_query_logger = logging.getLogger("api.slow_queries")
+
+_current = ContextVar("api_request_stats", default=None)
+
+# histogram buckets in seconds, Prometheus style
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class RequestStats:
+
+    def __init__(self, request):
+        self.request = request
+        self.db_time = 0.0
+        self.queries = 0
+        self.timers = {}
+
+    @property
+    def route(self):
+        match = getattr(self.request, "resolver_match", None)
+        return match.view_name if match else "unmatched"
+
+
+def current_stats():
+    return _current.get()
+
+
+@contextmanager
+def timer(name):
+    """Add the duration of the block to the current request's `name` timer."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.timers[name] = stats.timers.get(name, 0.0) + time.perf_counter() - start
+
+
+def query_timer(execute, sql, params, many, context):
+    # installed on every connection through `connection_created` (see api.signals)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        stats = _current.get()
+        if stats is not None:
+            stats.db_time += duration
+            stats.queries += 1
+        threshold = getattr(settings, "SLOW_QUERY_MS", None)
+        if threshold is not None and duration * 1000 >= threshold:
+            slow_query_logger.warning(
+                "slow query %.1fms route=%s path=%s db=%s sql=%s params=%r",
+                duration * 1000,
+                stats.route if stats else "-",
+                stats.request.path if stats else "-",
+                context["connection"].alias,
+                sql,
+                params,
+            )
+
+
+def install_query_timer(connection, **kwargs):
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+class Histogram:
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RouteMetrics:
+    """In-process request latency histograms keyed by (route, method, status class)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}
+            self.db_latency = {}
+            self.queries = {}
+
+    def observe(self, route, method, status, stats, duration):
+        key = (route, method, "%dxx" % (status // 100))
+        with self._lock:
+            self.latency.setdefault(key, Histogram()).observe(duration)
+            self.db_latency.setdefault(key, Histogram()).observe(stats.db_time)
+            self.queries[key] = self.queries.get(key, 0) + stats.queries
+
+    def render_prometheus(self, extra=()):
+        lines = []
+        with self._lock:
+            for name, help_text, histograms in (
+                ("api_request_duration_seconds", "Request latency by route.", self.latency),
+                ("api_request_db_seconds", "Database time per request by route.", self.db_latency),
+            ):
+                lines += ["# HELP %s %s" % (name, help_text), "# TYPE %s histogram" % name]
+                for (route, method, status), hist in sorted(histograms.items()):
+                    labels = 'route="%s",method="%s",status="%s"' % (route, method, status)
+                    cumulative = 0
+                    for bound, count in zip((*hist.buckets, "+Inf"), hist.counts):
+                        cumulative += count
+                        lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative))
+                    lines.append("%s_sum{%s} %.6f" % (name, labels, hist.sum))
+                    lines.append("%s_count{%s} %d" % (name, labels, hist.count))
+
+            lines += ["# HELP api_db_queries_total SQL queries issued by route.", "# TYPE api_db_queries_total counter"]
+            for (route, method, status), count in sorted(self.queries.items()):
+                lines.append('api_db_queries_total{route="%s",method="%s",status="%s"} %d' % (route, method, status, count))
+
+        for name, kind, help_text, value in extra:
+            lines += ["# HELP %s %s" % (name, help_text), "# TYPE %s %s" % (name, kind), "%s %s" % (name, value)]
+        return "\n".join(lines) + "\n"
+
+
+metrics = RouteMetrics()
+
+
+def server_timing(stats, total):
+    entries = ['db;dur=%.2f;desc="%d queries"' % (stats.db_time * 1000, stats.queries)]
+    entries += ["%s;dur=%.2f" % (name, duration * 1000) for name, duration in stats.timers.items()]
+    entries.append("total;dur=%.2f" % (total * 1000))
+    return ", ".join(entries)
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Times every request and adds a `Server-Timing` header with DB time and
+    query count plus any `timer()` blocks (serialize, render) that ran.
+    Place it first in MIDDLEWARE so `total` covers the whole stack.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats(request)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        stats = RequestStats(request)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - start)
+
+    def finish(self, request, response, stats, total):
+        response["Server-Timing"] = server_timing(stats, total)
+        metrics.observe(stats.route, request.method, response.status_code, stats, total)
+        return response
@@ -0,0 +1,27 @@
+# api/management/commands/_bench_gunicorn.py
+# gunicorn config used by `manage.py bench_servers` (gunicorn -c python:<this module>).
+import os
+import time
+
+
+def post_worker_init(worker):
+    from django.conf import settings
+    from django.db.backends.signals import connection_created
+
+    # measure the request path, not the response cache, unless asked to
+    if not os.environ.get("BENCH_RESPONSE_CACHE"):
+        settings.CACHES["bench"] = {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+        settings.API_CACHE_ALIAS = "bench"
+
+    # a local SQLite file answers in microseconds; add the round trip a networked
+    # database would have so blocked workers show up the way they do in production
+    latency = float(os.environ.get("BENCH_DB_LATENCY_MS") or 0) / 1000
+    if latency:
+        def delay(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def install(connection, **kwargs):
+            connection.execute_wrappers.append(delay)
+
+        connection_created.connect(install, weak=False)
@@ -0,0 +1,44 @@
+# api/management/commands/backfill_excerpts.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.cache import bump_content_version
+from api.postcache import invalidate
+from api.models import Post, make_excerpt
+
+
+class Command(BaseCommand):
+    help = "Compute Post.excerpt for existing rows (new and edited posts get it on save)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per UPDATE batch")
+        parser.add_argument("--all", action="store_true", help="Recompute every excerpt, not just empty ones")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        queryset = Post.objects.only("id", "body").order_by("id")
+        if not options["all"]:
+            queryset = queryset.filter(excerpt="").exclude(body="")
+
+        updated = 0
+        batch = []
+        for post in queryset.iterator(chunk_size=batch_size):
+            post.excerpt = make_excerpt(post.body)
+            batch.append(post)
+            if len(batch) >= batch_size:
+                updated += self._flush(batch)
+                batch = []
+        updated += self._flush(batch)
+
+        if updated:
+            bump_content_version()
+        self.stdout.write(self.style.SUCCESS(f"Done: updated {updated} excerpts."))
+
+    def _flush(self, batch):
+        if not batch:
+            return 0
+        with transaction.atomic():
+            Post.objects.bulk_update(batch, ["excerpt"])
+            invalidate([post.pk for post in batch])
+        self.stdout.write(f"  updated {len(batch)} posts (up to id {batch[-1].id})")
+        return len(batch)
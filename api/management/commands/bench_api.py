@@ -0,0 +1,246 @@
+# api/management/commands/bench_api.py
+import json
+import statistics
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+
+from api.models import Category, Tag, Post
+
+
+class QueryStats:
+    """Counts queries and fetched rows over every database alias (primary and replicas)."""
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+
+
+class CountingCursor:
+    # wraps the DB-API cursor under Django's CursorWrapper; rows are counted as they are fetched
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._stats.rows += 1
+            yield row
+
+    def execute(self, *args, **kwargs):
+        self._stats.queries += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._stats.queries += 1
+        return self._cursor.executemany(*args, **kwargs)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._stats.rows += len(rows)
+        return rows
+
+
+def counting_cursor_factory(create_cursor, stats):
+    return lambda name=None: CountingCursor(create_cursor(name), stats)
+
+
+def percentile(samples, pct):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[pct - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the API in-process through the real URL conf: latency percentiles, "
+        "SQL query count, rows fetched and response size per scenario."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=0, help="Seed until at least this many posts exist")
+        parser.add_argument("--seed", type=int, default=42, help="Seed passed to seed_posts")
+        parser.add_argument("--iterations", type=int, default=50, help="Timed requests per scenario (at least 1)")
+        parser.add_argument("--warmup", type=int, default=3, help="Untimed requests per scenario")
+        parser.add_argument("--deep-pages", type=int, default=50, help="Cursor depth for the deep-walk scenarios")
+        parser.add_argument("--scenario", action="append", default=[], help="Only run scenarios containing this text")
+        parser.add_argument("--cache", action="store_true", help="Keep the response cache on (default: bypassed)")
+        parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+        parser.add_argument("--baseline", help="Compare against a previous JSON report and fail on regressions")
+        parser.add_argument("--metric", choices=("p50_ms", "p95_ms", "p99_ms"), default="p95_ms", help="Latency metric compared to the baseline")
+        parser.add_argument("--threshold", type=float, default=0.25,
+                            help="Allowed relative slowdown vs the baseline (0.25 = 25%%)")
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1:
+            raise CommandError("--iterations must be at least 1.")
+        self.ensure_dataset(options["posts"], options["seed"])
+        if not Post.objects.exists():
+            raise CommandError("No posts to benchmark. Run with --posts N or `manage.py seed_posts` first.")
+
+        # VIEW_COUNTS: the detail scenarios would write PostStats into the measured dataset
+        overrides = {"ALLOWED_HOSTS": [*settings.ALLOWED_HOSTS, "testserver"], "VIEW_COUNTS": False}
+        if not options["cache"]:
+            overrides["CACHES"] = {**settings.CACHES, "bench": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+            overrides["API_CACHE_ALIAS"] = "bench"
+
+        with override_settings(**overrides):
+            self.client = Client()
+            scenarios = self.build_scenarios(options["deep_pages"])
+            if options["scenario"]:
+                scenarios = {
+                    name: url for name, url in scenarios.items()
+                    if any(text in name for text in options["scenario"])
+                }
+            results = {}
+            for name, url in scenarios.items():
+                results[name] = self.run_scenario(url, options["iterations"], options["warmup"])
+                self.stderr.write(
+                    f"{name:<32} p50 {results[name]['p50_ms']:8.2f}ms  p95 {results[name]['p95_ms']:8.2f}ms  "
+                    f"queries {results[name]['queries']:3}  rows {results[name]['rows']:6}  "
+                    f"bytes {results[name]['bytes']}"
+                )
+
+        report = {
+            "meta": {
+                "vendor": connection.vendor,
+                "posts": Post.objects.count(),
+                "iterations": options["iterations"],
+                "cache": options["cache"],
+            },
+            "scenarios": results,
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                fh.write(output + "\n")
+            self.stderr.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+        if options["baseline"]:
+            self.compare(report, options["baseline"], options["metric"], options["threshold"])
+
+    def ensure_dataset(self, posts, seed):
+        missing = posts - Post.objects.count()
+        if missing > 0:
+            self.stderr.write(f"Seeding {missing} posts...")
+            call_command("seed_posts", posts=missing, seed=seed, users=max(1, missing // 100), stdout=self.stderr)
+
+    def get(self, url):
+        return self.client.get(url, secure=True)
+
+    def build_scenarios(self, deep_pages):
+        post = Post.objects.order_by("id").only("id", "title").first()
+        category = Category.objects.filter(posts__isnull=False).values_list("slug", flat=True).first()
+        tags = Counter(Post.tags.through.objects.values_list("tag__slug", flat=True)[:5000]).most_common(2)
+        search = max(post.title.split(), key=len).strip(".,").lower()
+
+        scenarios = {
+            "posts_list": "/api/posts/",
+            "posts_detail": f"/api/posts/{post.id}/",
+            "posts_filter_category": f"/api/posts/?category={category}",
+            "posts_search": f"/api/posts/?search={search}",
+            "posts_search_rank": f"/api/posts/?search={search}&ordering=rank",
+        }
+        if tags:
+            scenarios["posts_filter_tag"] = f"/api/posts/?tag={tags[0][0]}"
+        if len(tags) > 1:
+            scenarios["posts_filter_tags_any"] = f"/api/posts/?tag={tags[0][0]},{tags[1][0]}"
+            scenarios["posts_filter_tags_all"] = f"/api/posts/?tag={tags[0][0]},{tags[1][0]}&tag_mode=all"
+        for ordering in ("created_at", "-created_at", "title", "-title", "author__username", "-author__username"):
+            scenarios[f"posts_ordering_{ordering}"] = f"/api/posts/?ordering={ordering}"
+        for ordering in ("-created_at", "title", "author__username"):
+            scenarios[f"posts_cursor_p{deep_pages}_{ordering}"] = self.walk(
+                f"/api/posts/?ordering={ordering}", deep_pages
+            )
+        scenarios.update({
+            "posts_facets": "/api/posts/facets/",
+            "posts_facets_filtered": f"/api/posts/facets/?category={category}&search={search}",
+            "category_list": "/api/category/",
+            "category_detail": f"/api/category/{Category.objects.values_list('id', flat=True).first()}/",
+            "tags_list": "/api/tags/",
+            "tags_detail": f"/api/tags/{Tag.objects.values_list('id', flat=True).first()}/",
+            "suggest_one_letter": f"/api/suggest/?q={search[:1]}",
+            "suggest_word": f"/api/suggest/?q={search[:4]}",
+        })
+        return scenarios
+
+    def walk(self, url, pages):
+        # follow `next` links to page N once, then time requests for that deep page
+        for _ in range(pages - 1):
+            next_url = self.get(url).json().get("next")
+            if not next_url:
+                break
+            url = next_url
+        return url
+
+    def run_scenario(self, url, iterations, warmup):
+        for _ in range(warmup):
+            self.get(url)
+
+        stats = QueryStats()
+        # reads routed to a replica (core.db_router) run on that alias's connection
+        wrapped = [connections[alias] for alias in connections]
+        for conn in wrapped:
+            conn.create_cursor = counting_cursor_factory(conn.create_cursor, stats)
+        timings = []
+        try:
+            for _ in range(iterations):
+                start = time.perf_counter()
+                response = self.get(url)
+                timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            for conn in wrapped:
+                del conn.create_cursor
+
+        if response.status_code != 200:
+            raise CommandError(f"{url} returned {response.status_code}")
+        return {
+            "url": url,
+            "p50_ms": round(percentile(timings, 50), 3),
+            "p95_ms": round(percentile(timings, 95), 3),
+            "p99_ms": round(percentile(timings, 99), 3),
+            "mean_ms": round(statistics.fmean(timings), 3),
+            "queries": round(stats.queries / iterations, 2),
+            "rows": round(stats.rows / iterations, 2),
+            "bytes": len(response.content),
+        }
+
+    def compare(self, report, baseline_path, metric, threshold):
+        with open(baseline_path) as fh:
+            baseline = json.load(fh)["scenarios"]
+
+        regressions = []
+        for name, result in report["scenarios"].items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            if before[metric] and result[metric] > before[metric] * (1 + threshold):
+                regressions.append(f"{name}: {metric} {before[metric]} -> {result[metric]}")
+            if result["queries"] > before["queries"]:
+                regressions.append(f"{name}: queries {before['queries']} -> {result['queries']}")
+
+        if regressions:
+            raise CommandError("Regressions vs %s:\n  %s" % (baseline_path, "\n  ".join(regressions)))
+        self.stderr.write(self.style.SUCCESS(f"No regressions vs {baseline_path} (threshold {threshold:.0%})."))
@@ -0,0 +1,194 @@
+# api/management/commands/bench_db.py
+import copy
+import json
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F
+
+from api.models import Category, Post
+
+from .bench_api import percentile
+
+# connection settings per mode, as changes to the default database's
+MODES = {
+    "sqlite": {
+        "rollback": {"OPTIONS": {}},   # SQLite's defaults: rollback journal, 5s busy timeout
+        "wal": {"OPTIONS": None},       # settings.SQLITE_OPTIONS
+    },
+    "postgresql": {
+        "per_request": {"CONN_MAX_AGE": 0, "OPTIONS": {}},
+        "persistent": {"CONN_MAX_AGE": 600, "OPTIONS": {}},
+        "pool": {"CONN_MAX_AGE": 0, "OPTIONS": None},   # settings.DATABASE_POOL_OPTIONS
+    },
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Read throughput and latency while other threads write, for each way of "
+        "configuring the database: SQLite rollback journal vs WAL + pragmas, or "
+        "Postgres per-request vs persistent connections vs the connection pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", action="append", default=[], help="Mode to run (default: all for the vendor)")
+        parser.add_argument("--readers", type=int, default=8, help="Reader threads (each loop is one API-like request)")
+        parser.add_argument("--writers", type=int, default=2, help="Writer threads")
+        parser.add_argument("--batch", type=int, default=20, help="Posts updated per write transaction")
+        parser.add_argument("--write-pause-ms", type=float, default=5.0, help="Pause between a writer's transactions")
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per mode")
+        parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+
+    def handle(self, *args, **options):
+        base = connections["default"].settings_dict
+        vendor = connections["default"].vendor
+        if vendor not in MODES:
+            raise CommandError(f"No modes to compare on {vendor}.")
+        modes = options["mode"] or list(MODES[vendor])
+        unknown = sorted(set(modes) - set(MODES[vendor]))
+        if unknown:
+            raise CommandError(f"Unknown mode(s) for {vendor}: {', '.join(unknown)} (choose from {', '.join(MODES[vendor])})")
+        if vendor == "sqlite" and connections["default"].is_in_memory_db():
+            raise CommandError("Benchmark needs a database file to copy; in-memory SQLite won't do.")
+
+        post_ids = list(Post.objects.values_list("id", flat=True))
+        if not post_ids:
+            raise CommandError("No posts to benchmark. Run `manage.py seed_posts` first.")
+        category_ids = list(Category.objects.values_list("id", flat=True)) or [None]
+
+        results = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            for mode in modes:
+                alias = f"bench_{mode}"
+                connections.settings[alias] = self.mode_settings(vendor, mode, base, Path(tmp))
+                self.stderr.write(f"{mode}: {options['readers']} readers, {options['writers']} writers...")
+                try:
+                    results[mode] = self.run(alias, post_ids, category_ids, options)
+                finally:
+                    if vendor == "postgresql":
+                        connections[alias].close_pool()
+                    del connections.settings[alias]
+                result = results[mode]
+                self.stderr.write(
+                    f"{mode:<12} reads {result['reads_per_s']:8.1f}/s  p50 {result['read_p50_ms']:7.2f}ms  "
+                    f"p95 {result['read_p95_ms']:7.2f}ms  p99 {result['read_p99_ms']:7.2f}ms  "
+                    f"writes {result['writes_per_s']:7.1f}/s  errors {result['read_errors']}/{result['write_errors']}"
+                )
+
+        report = {
+            "meta": {
+                "vendor": vendor,
+                "posts": len(post_ids),
+                "readers": options["readers"],
+                "writers": options["writers"],
+                "batch": options["batch"],
+                "write_pause_ms": options["write_pause_ms"],
+                "duration": options["duration"],
+            },
+            "modes": results,
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                fh.write(output + "\n")
+            self.stderr.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    def mode_settings(self, vendor, mode, base, tmp):
+        changes = MODES[vendor][mode]
+        settings_dict = copy.deepcopy(base)
+        settings_dict.update(changes)
+        if vendor == "sqlite":
+            # each mode writes to its own copy, so the real database is never touched
+            name = tmp / f"{mode}.sqlite3"
+            with sqlite3.connect(base["NAME"]) as source, sqlite3.connect(name) as target:
+                source.backup(target)
+                target.execute("PRAGMA journal_mode=%s" % ("WAL" if mode == "wal" else "DELETE"))
+            settings_dict["NAME"] = str(name)
+            if changes["OPTIONS"] is None:
+                settings_dict["OPTIONS"] = dict(settings.SQLITE_OPTIONS)
+        elif changes["OPTIONS"] is None:
+            options = {k: v for k, v in base["OPTIONS"].items() if k != "pool"}
+            settings_dict["OPTIONS"] = {**options, "pool": dict(settings.DATABASE_POOL_OPTIONS)}
+        else:
+            settings_dict["OPTIONS"] = {k: v for k, v in base["OPTIONS"].items() if k != "pool"}
+        return settings_dict
+
+    def run(self, alias, post_ids, category_ids, options):
+        deadline = time.perf_counter() + options["duration"]
+        lock = threading.Lock()
+        timings, counts = [], {"writes": 0, "read_errors": 0, "write_errors": 0}
+
+        def reader(seed):
+            rng = random.Random(seed)
+            local = []
+            errors = 0
+            try:
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        # a list page and a detail, like one browsing client
+                        page = Post.objects.using(alias).filter(category_id=rng.choice(category_ids))
+                        list(page.order_by("-created_at", "-id").values("id", "title", "excerpt", "author__username")[:11])
+                        Post.objects.using(alias).filter(pk=rng.choice(post_ids)).values("id", "title", "body").first()
+                    except DatabaseError:
+                        errors += 1
+                    else:
+                        local.append((time.perf_counter() - start) * 1000)
+                    # end of "request": what Django does after each response
+                    connections[alias].close_if_unusable_or_obsolete()
+            finally:
+                connections[alias].close()
+            with lock:
+                timings.extend(local)
+                counts["read_errors"] += errors
+
+        def writer(seed):
+            rng = random.Random(seed)
+            writes = errors = 0
+            try:
+                while time.perf_counter() < deadline:
+                    try:
+                        with transaction.atomic(using=alias):
+                            ids = rng.sample(post_ids, min(options["batch"], len(post_ids)))
+                            Post.objects.using(alias).filter(pk__in=ids).update(title=F("title"))
+                        writes += 1
+                    except DatabaseError:
+                        errors += 1
+                    connections[alias].close_if_unusable_or_obsolete()
+                    time.sleep(options["write_pause_ms"] / 1000)
+            finally:
+                connections[alias].close()
+            with lock:
+                counts["writes"] += writes
+                counts["write_errors"] += errors
+
+        threads = [threading.Thread(target=reader, args=(n,)) for n in range(options["readers"])]
+        threads += [threading.Thread(target=writer, args=(1000 + n,)) for n in range(options["writers"])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        if not timings:
+            raise CommandError(f"No successful reads on {alias} ({counts['read_errors']} errors)")
+        return {
+            "reads": len(timings),
+            "reads_per_s": round(len(timings) / elapsed, 1),
+            "read_p50_ms": round(percentile(timings, 50), 3),
+            "read_p95_ms": round(percentile(timings, 95), 3),
+            "read_p99_ms": round(percentile(timings, 99), 3),
+            "writes_per_s": round(counts["writes"] / elapsed, 1),
+            "read_errors": counts["read_errors"],
+            "write_errors": counts["write_errors"],
+        }
@@ -0,0 +1,198 @@
+# api/management/commands/bench_servers.py
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.models import Category, Post
+
+from .bench_api import percentile
+
+# (app, extra gunicorn args, extra env) per deployment profile; see Procfile
+PROFILES = {
+    "wsgi": ("core.wsgi:application", [], {}),
+    "asgi": ("core.asgi:application", ["-k", "uvicorn_worker.UvicornWorker"], {"API_ASYNC_VIEWS": "1"}),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Throughput of the API under many concurrent clients, served by real gunicorn "
+        "processes: sync WSGI workers vs uvicorn ASGI workers with the async read path."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profile", action="append", choices=sorted(PROFILES), default=[],
+                            help="Server profile to run (default: all)")
+        parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes per profile")
+        parser.add_argument("--concurrency", type=int, default=64, help="Concurrent client connections")
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per profile")
+        parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of untimed load first")
+        parser.add_argument("--db-latency-ms", type=float, default=5.0,
+                            help="Simulated network round trip added to every query (0 = raw SQLite)")
+        parser.add_argument("--cache", action="store_true", help="Keep the response cache on (default: bypassed)")
+        parser.add_argument("--url", action="append", default=[], help="Path to request (repeatable)")
+        parser.add_argument("--port", type=int, default=0, help="Port to bind (default: a free one)")
+        parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+
+    def handle(self, *args, **options):
+        if connection.vendor == "sqlite" and str(connection.settings_dict["NAME"]).startswith(":memory:"):
+            raise CommandError("The servers need a database file they can share; in-memory SQLite won't do.")
+        paths = options["url"] or self.default_paths()
+        results = {}
+        for name in options["profile"] or sorted(PROFILES, reverse=True):
+            port = options["port"] or self.free_port()
+            with self.server(name, port, options):
+                self.stderr.write(f"{name}: {options['workers']} worker(s), {options['concurrency']} clients...")
+                asyncio.run(self.load(port, paths, options["concurrency"], options["warmup"]))
+                results[name] = asyncio.run(self.load(port, paths, options["concurrency"], options["duration"]))
+            result = results[name]
+            self.stderr.write(
+                f"{name:<6} {result['rps']:8.1f} req/s  p50 {result['p50_ms']:8.2f}ms  "
+                f"p95 {result['p95_ms']:8.2f}ms  p99 {result['p99_ms']:8.2f}ms  errors {result['errors']}"
+            )
+
+        report = {
+            "meta": {
+                "vendor": connection.vendor,
+                "posts": Post.objects.count(),
+                "workers": options["workers"],
+                "concurrency": options["concurrency"],
+                "duration": options["duration"],
+                "db_latency_ms": options["db_latency_ms"],
+                "cache": options["cache"],
+                "paths": paths,
+            },
+            "profiles": results,
+        }
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                fh.write(output + "\n")
+            self.stderr.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    def default_paths(self):
+        post = Post.objects.order_by("id").values_list("id", flat=True).first()
+        if post is None:
+            raise CommandError("No posts to benchmark. Run `manage.py seed_posts` first.")
+        category = Category.objects.filter(posts__isnull=False).values_list("slug", flat=True).first()
+        tag = Counter(Post.tags.through.objects.values_list("tag__slug", flat=True)[:5000]).most_common(1)
+        paths = ["/api/posts/", f"/api/posts/{post}/", f"/api/posts/?category={category}", "/api/tags/"]
+        if tag:
+            paths.append(f"/api/posts/?tag={tag[0][0]}")
+        return paths
+
+    def free_port(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    def server(self, name, port, options):
+        app, args, env = PROFILES[name]
+        env = {**os.environ, **env, "BENCH_DB_LATENCY_MS": str(options["db_latency_ms"])}
+        if options["cache"]:
+            env["BENCH_RESPONSE_CACHE"] = "1"
+        command = [
+            sys.executable, "-m", "gunicorn", app, *args,
+            "--workers", str(options["workers"]),
+            "--bind", f"127.0.0.1:{port}",
+            "--config", "python:api.management.commands._bench_gunicorn",
+            "--log-level", "warning",
+        ]
+        return RunningServer(command, env, port, cwd=settings.BASE_DIR)
+
+    async def load(self, port, paths, concurrency, duration):
+        deadline = time.perf_counter() + duration
+        timings, statuses = [], Counter()
+        errors = 0
+
+        async def client(offset):
+            nonlocal errors
+            i = offset
+            while time.perf_counter() < deadline:
+                path = paths[i % len(paths)]
+                i += 1
+                start = time.perf_counter()
+                try:
+                    status = await asyncio.wait_for(fetch(port, path), timeout=30)
+                except (OSError, asyncio.TimeoutError, ValueError):
+                    errors += 1
+                    continue
+                statuses[status] += 1
+                if status == 200:
+                    timings.append((time.perf_counter() - start) * 1000)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        if not timings:
+            raise CommandError(f"No successful responses (statuses: {dict(statuses)}, errors: {errors})")
+        return {
+            "requests": len(timings),
+            "rps": round(len(timings) / elapsed, 1),
+            "p50_ms": round(percentile(timings, 50), 3),
+            "p95_ms": round(percentile(timings, 95), 3),
+            "p99_ms": round(percentile(timings, 99), 3),
+            "errors": errors,
+            "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        }
+
+
+async def fetch(port, path):
+    # one request per connection: gunicorn's sync workers don't keep connections alive
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        # X-Forwarded-Proto: production settings redirect plain http to https
+        writer.write((
+            f"GET {path} HTTP/1.1\r\nHost: localhost\r\nAccept: application/json\r\n"
+            "X-Forwarded-Proto: https\r\nConnection: close\r\n\r\n"
+        ).encode())
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    status_line = response.split(b"\r\n", 1)[0].split(b" ")
+    if len(status_line) < 2:
+        raise ValueError("malformed response from server")
+    return int(status_line[1])
+
+
+class RunningServer:
+    """Context manager: start gunicorn, wait until it answers, stop it afterwards."""
+
+    def __init__(self, command, env, port, cwd):
+        self.command, self.env, self.port, self.cwd = command, env, port, cwd
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, env=self.env, cwd=self.cwd)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError(f"Server exited with {self.process.returncode}: {' '.join(self.command)}")
+            try:
+                asyncio.run(fetch(self.port, "/api/tags/"))
+                return self
+            except (OSError, ValueError):
+                time.sleep(0.2)
+        self.__exit__()
+        raise CommandError(f"Server did not come up on port {self.port}")
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
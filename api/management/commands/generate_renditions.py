@@ -0,0 +1,46 @@
+# api/management/commands/generate_renditions.py
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.images import process_post_image
+from api.models import Post
+
+
+class Command(BaseCommand):
+    help = "Generate (or regenerate) responsive image renditions for posts with an image."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Regenerate even when renditions are up to date")
+        parser.add_argument("--workers", type=int, default=4, help="Threads resizing images in parallel")
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image="").exclude(image__isnull=True).only("id", "image", "image_renditions")
+        jobs = [
+            (post.id, post.image.name, post.image_renditions)
+            for post in posts.iterator()
+            if options["all"] or (post.image_renditions or {}).get("source") != post.image.name
+        ]
+        self.stdout.write(f"Generating renditions for {len(jobs)} posts...")
+
+        def run(job):
+            post_id, name, previous = job
+            try:
+                process_post_image(post_id, name, previous)
+                return None
+            except Exception as exc:
+                return f"post {post_id} ({name}): {exc}"
+            finally:
+                connections.close_all()
+
+        failures = []
+        with ThreadPoolExecutor(max_workers=max(1, options["workers"])) as pool:
+            for i, error in enumerate(pool.map(run, jobs), start=1):
+                if error:
+                    failures.append(error)
+                    self.stderr.write(self.style.WARNING(f"  failed {error}"))
+                if i % 50 == 0:
+                    self.stdout.write(f"  processed {i} posts")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {len(jobs) - len(failures)} generated, {len(failures)} failed."))
@@ -0,0 +1,64 @@
+# api/management/commands/import_posts.py
+import json
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importer import import_posts
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update posts from NDJSON, one post per line, in the export's shape "
+        "(title, body, slug, author, category, tag, created_at); the same as POST /api/posts/bulk/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="-", help="NDJSON file (default: stdin)")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Posts per transaction")
+        parser.add_argument("--author", help="Username for rows without an author")
+        parser.add_argument("--database", default="default", help="Database alias to write to")
+
+    def handle(self, *args, **options):
+        author = None
+        if options["author"]:
+            try:
+                author = get_user_model().objects.using(options["database"]).get(username=options["author"])
+            except get_user_model().DoesNotExist:
+                raise CommandError("No user named %r." % options["author"])
+        batch_size = max(1, options["batch_size"])
+
+        fh = sys.stdin if options["path"] == "-" else open(options["path"], encoding="utf-8")
+        counts = {"created": 0, "updated": 0, "error": 0}
+        start = time.perf_counter()
+        try:
+            lines = ((number, line) for number, line in enumerate(fh, 1) if line.strip())
+            while batch := list(islice(lines, batch_size)):
+                rows, numbers = [], []
+                for number, line in batch:
+                    try:
+                        rows.append(json.loads(line))
+                        numbers.append(number)
+                    except ValueError as exc:
+                        counts["error"] += 1
+                        self.stderr.write(f"line {number}: not JSON ({exc})")
+                for number, result in zip(numbers, import_posts(rows, author=author, using=options["database"])):
+                    counts[result["status"]] += 1
+                    if result["status"] == "error":
+                        self.stderr.write(f"line {number}: {json.dumps(result['errors'])}")
+                self.stdout.write(f"  {counts['created']} created, {counts['updated']} updated")
+        finally:
+            if fh is not sys.stdin:
+                fh.close()
+
+        elapsed = time.perf_counter() - start
+        done = counts["created"] + counts["updated"]
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {counts['created']} created, {counts['updated']} updated, {counts['error']} skipped "
+            f"in {elapsed:.1f}s ({done / max(elapsed, 1e-9):.0f} posts/s)."
+        ))
+        if done:
+            self.stdout.write("Related posts aren't updated by imports; run: python manage.py rebuild_related_posts")
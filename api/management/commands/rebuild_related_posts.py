@@ -0,0 +1,25 @@
+# api/management/commands/rebuild_related_posts.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.cache import bump_content_version
+from api.related import get_limit, rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every post's related posts (/api/posts/{id}/related/) from scratch; "
+        "run after bulk imports or changing the RELATED_* settings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default", help="Database alias to rebuild")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = rebuild(options["database"])
+        bump_content_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: top {get_limit()} related posts for {count} posts in {time.perf_counter() - start:.1f}s."
+        ))
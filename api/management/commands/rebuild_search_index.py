@@ -0,0 +1,25 @@
+# api/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import Post
+from api.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for all posts (run after bulk imports)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default", help="Database alias to rebuild")
+
+    def handle(self, *args, **options):
+        alias = options["database"]
+        backend = get_search_backend(alias)
+        if backend is None:
+            raise CommandError(f"No search index installed on database '{alias}'. Run `manage.py migrate` first.")
+
+        with transaction.atomic(using=alias):
+            backend.rebuild()
+
+        count = Post.objects.using(alias).count()
+        self.stdout.write(self.style.SUCCESS(f"Done: indexed {count} posts with {type(backend).__name__}."))
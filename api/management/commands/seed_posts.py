@@ -1,12 +1,64 @@
 # api/management/commands/seed_posts.py
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from django.db import connection, connections, transaction
+from django.db.models import Max
 from django.utils.text import slugify
 from django.utils import timezone
+from concurrent.futures import ProcessPoolExecutor
 from datetime import timedelta
+import multiprocessing
 import random
 
-from api.models import Category, Tag, Post
+from api import archive
+from api.cache import bump_content_version
+from api.models import ArchiveCount, Category, Tag, Post, make_excerpt
+from api.search import get_search_backend
+
+CATEGORIES = [
+    "Technology","Business","Lifestyle","Travel","Food","Health & Fitness",
+    "Science","Education","Finance","Entertainment","Sports","Development"
+]
+
+TAG_NAMES = [
+    "python","django","deployment","aws","react","javascript","productivity",
+    "remote-work","startup","marketing","seo","recipes","nutrition","wellness",
+    "mental-health","fitness","research","education","personal-finance","investing",
+    "movies","music","football","nba","travel-tips","budget-travel","photography",
+    "tutorial","testing","ci-cd","docker","kubernetes","data-science","ai","ml",
+    "cloud","security","design","ux","career"
+]
+
+_faker = None
+
+
+def generate_batch(args):
+    """
+    Build the raw content for one batch of posts. Runs in a worker process, so it
+    only touches Faker/random (no ORM). Seeded per batch, so the output depends on
+    --seed and the batch position but not on how many workers there are.
+    """
+    global _faker
+    seed, start, count, n_categories, n_tags, n_users = args
+    if _faker is None:
+        from faker import Faker
+        _faker = Faker()
+    fake = _faker
+    batch_seed = None if seed is None else seed * 1_000_003 + start
+    fake.seed_instance(batch_seed)
+    rnd = random.Random(batch_seed)
+
+    rows = []
+    for _ in range(count):
+        title = fake.sentence(nb_words=rnd.randint(5, 10)).rstrip(".")
+        body = "\n\n".join(fake.paragraphs(nb=rnd.randint(4, 8)))
+        age = (rnd.randint(0, 365), rnd.randint(0, 23), rnd.randint(0, 59), rnd.randint(0, 59))
+        category = rnd.randrange(n_categories)
+        tags = rnd.sample(range(n_tags), rnd.randint(2, 6))
+        author = rnd.randrange(n_users)
+        rows.append((title, body, age, category, tags, author))
+    return rows
+
 
 class Command(BaseCommand):
     help = "Seed the database with realistic categories, tags and N blog posts."
@@ -14,81 +66,153 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--posts", type=int, default=100, help="Number of posts to create")
         parser.add_argument("--clear", action="store_true", help="Delete existing Category/Tag/Post objects first")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Posts per bulk insert / transaction")
+        parser.add_argument("--workers", type=int, default=1, help="Processes generating Faker content")
+        parser.add_argument("--seed", type=int, default=None, help="Random seed for a reproducible dataset")
+        parser.add_argument("--users", type=int, default=None, help="Spread posts across N generated authors")
 
     def handle(self, *args, **options):
         # import Faker here to avoid failing import-time if package missing
         try:
-            from faker import Faker
+            import faker  # noqa: F401
         except Exception:
             self.stderr.write(self.style.ERROR(
                 "Faker not installed. Install it with `pip install Faker` and add to requirements.txt"
             ))
             return
 
-        fake = Faker()
-
         posts_to_create = options["posts"]
-        clear = options["clear"]
+        batch_size = max(1, options["batch_size"])
+        workers = max(1, options["workers"])
+        seed = options["seed"]
 
-        if clear:
+        if options["clear"]:
             self.stdout.write("Clearing existing Posts/Tags/Categories...")
-            Post.objects.all().delete()
-            Tag.objects.all().delete()
-            Category.objects.all().delete()
+            self.clear()
 
-        categories = [
-            "Technology","Business","Lifestyle","Travel","Food","Health & Fitness",
-            "Science","Education","Finance","Entertainment","Sports","Development"
-        ]
         category_objs = []
-        for name in categories:
-            obj, _ = Category.objects.get_or_create(name=name, defaults={"slug": slugify(name)})
+        for name in CATEGORIES:
+            obj, _ = Category.objects.get_or_create(slug=slugify(name), defaults={"name": name})
             category_objs.append(obj)
 
-        tag_names = [
-            "python","django","deployment","aws","react","javascript","productivity",
-            "remote-work","startup","marketing","seo","recipes","nutrition","wellness",
-            "mental-health","fitness","research","education","personal-finance","investing",
-            "movies","music","football","nba","travel-tips","budget-travel","photography",
-            "tutorial","testing","ci-cd","docker","kubernetes","data-science","ai","ml",
-            "cloud","security","design","ux","career"
-        ]
         tag_objs = []
-        for name in tag_names:
-            obj, _ = Tag.objects.get_or_create(name=name, defaults={"slug": slugify(name)})
+        for name in TAG_NAMES:
+            obj, _ = Tag.objects.get_or_create(slug=slugify(name), defaults={"name": name})
             tag_objs.append(obj)
 
-        # author: prefer existing user or create demo user
+        author_ids = self.get_authors(options["users"])
+
+        # slugs only need to be unique, so suffix them past the current max id
+        first_index = (Post.objects.aggregate(m=Max("id"))["m"] or 0) + 1
+        batches = [
+            (seed, start, min(batch_size, posts_to_create - start), len(category_objs), len(tag_objs), len(author_ids))
+            for start in range(0, posts_to_create, batch_size)
+        ]
+        now = timezone.now()
+        Through = Post.tags.through
+        # created_at is auto_now_add, so bulk_create stamps "now"; the generated dates are written afterwards
+        date_field = Post._meta.get_field("created_at")
+        backdate_sql = "UPDATE %s SET %s = %%s WHERE id = %%s" % (
+            connection.ops.quote_name(Post._meta.db_table), connection.ops.quote_name(date_field.column)
+        )
+
+        self.stdout.write(f"Creating {posts_to_create} posts with {workers} worker(s), {batch_size} per batch...")
+        created = 0
+        for batch_start, rows in zip((b[1] for b in batches), self.generate(batches, workers)):
+            posts, dates = [], []
+            for offset, (title, body, (days, hours, minutes, seconds), category, tags, author) in enumerate(rows):
+                i = first_index + batch_start + offset
+                dates.append(now - timedelta(days=days, hours=hours, minutes=minutes, seconds=seconds))
+                posts.append(Post(
+                    title=title,
+                    slug=f"{slugify(title)}-{i}"[:300],
+                    body=body,
+                    excerpt=make_excerpt(body),
+                    author_id=author_ids[author],
+                    category_id=category_objs[category].id,
+                    # bulk inserts skip m2m_changed, so fill the denormalized column here
+                    tag_slugs=sorted(tag_objs[t].slug for t in tags),
+                ))
+
+            with transaction.atomic():
+                Post.objects.bulk_create(posts, batch_size=batch_size)
+                with connection.cursor() as cursor:
+                    cursor.executemany(backdate_sql, [
+                        (date_field.get_db_prep_value(date, connection), post.pk) for post, date in zip(posts, dates)
+                    ])
+                links = [
+                    Through(post_id=post.id, tag_id=tag_objs[t].id)
+                    for post, row in zip(posts, rows)
+                    for t in row[4]
+                ]
+                Through.objects.bulk_create(links, batch_size=batch_size)
+
+            created += len(posts)
+            self.stdout.write(f"  created {created} posts")
+
+        backend = get_search_backend()
+        if backend is not None:
+            self.stdout.write("Rebuilding search index...")
+            with transaction.atomic():
+                backend.rebuild()
+        self.stdout.write("Recounting the archive...")
+        archive.rebuild()
+        bump_content_version()
+
+        self.stdout.write(self.style.SUCCESS(f"Done: created {created} posts."))
+        self.stdout.write("Related posts aren't computed for them; run: python manage.py rebuild_related_posts")
+        self.stdout.write("You can export them with: python manage.py dumpdata api --indent 2 > fixtures/posts_100.json")
+
+    def generate(self, batches, workers):
+        if workers == 1:
+            yield from map(generate_batch, batches)
+            return
+        # workers never touch the database; don't hand them our open connection
+        connections.close_all()
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            # map() keeps batch order, so ids and slugs are the same for any worker count
+            yield from pool.map(generate_batch, batches)
+
+    def get_authors(self, n_users):
         User = get_user_model()
+        if n_users:
+            usernames = [f"seed_author_{k}" for k in range(1, n_users + 1)]
+            User.objects.bulk_create(
+                [User(username=name, email=f"{name}@example.com", password="!") for name in usernames],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+            ids = dict(User.objects.filter(username__in=usernames).values_list("username", "id"))
+            self.stdout.write(f"Using {n_users} authors 'seed_author_1'..'seed_author_{n_users}' (no usable password)")
+            return [ids[name] for name in usernames]
+
+        # author: prefer existing user or create demo user
         if User.objects.exists():
             author = User.objects.filter(is_staff=False).first() or User.objects.first()
         else:
             author = User.objects.create_user(username="demo_author", email="demo@example.com", password="demo12345")
             self.stdout.write("Created demo user 'demo_author' with password 'demo12345'")
-
-        self.stdout.write(f"Creating {posts_to_create} posts...")
-        for i in range(1, posts_to_create + 1):
-            title = fake.sentence(nb_words=random.randint(5,10)).rstrip(".")
-            slug = f"{slugify(title)}-{i}"
-            body = "\n\n".join(fake.paragraphs(nb=random.randint(4,8)))
-            created_at = timezone.now() - timedelta(days=random.randint(0,365), hours=random.randint(0,23))
-
-            category = random.choice(category_objs)
-
-            post = Post.objects.create(
-                title=title,
-                slug=slug[:300],
-                body=body,
-                author=author,
-                created_at=created_at,
-                category=category, 
-            )
-
-            sample_tags = random.sample(tag_objs, random.randint(2,6))
-            post.tags.add(*sample_tags)
-
-            if i % 10 == 0:
-                self.stdout.write(f"  created {i} posts")
-
-        self.stdout.write(self.style.SUCCESS(f"Done: created {posts_to_create} posts."))
-        self.stdout.write("You can export them with: python manage.py dumpdata api --indent 2 > fixtures/posts_100.json")
+        return [author.id]
+
+    def clear(self):
+        # raw deletes: 1M posts through the ORM collector would mean 1M post_delete signals.
+        # Every table with a foreign key to posts (tag links, related posts, stats, ...)
+        # goes first, or the posts' DELETE fails its constraint check at commit
+        children = {
+            field.related_model for field in Post._meta.get_fields(include_hidden=True)
+            if field.auto_created and not field.concrete and (field.one_to_many or field.one_to_one)
+        }
+        with transaction.atomic(), connection.cursor() as cursor:
+            for model in sorted(children, key=lambda model: model._meta.db_table):
+                cursor.execute(f"DELETE FROM {model._meta.db_table}")
+            cursor.execute(f"DELETE FROM {ArchiveCount._meta.db_table}")
+            cursor.execute(f"DELETE FROM {Post._meta.db_table}")
+        Tag.objects.all().delete()
+        Category.objects.all().delete()
+        backend = get_search_backend()
+        if backend is not None:
+            with transaction.atomic():
+                backend.rebuild()
+        bump_content_version()
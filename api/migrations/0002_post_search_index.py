@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def document_sql(tags_agg, user_table):
+    return (
+        "SELECT p.id, p.title, p.body, COALESCE(u.username, ''), COALESCE(c.name, ''), "
+        "COALESCE((SELECT {tags_agg} FROM api_post_tags pt JOIN api_tag t ON t.id = pt.tag_id "
+        "WHERE pt.post_id = p.id), '') "
+        "FROM api_post p "
+        "LEFT JOIN {user_table} u ON u.id = p.author_id "
+        "LEFT JOIN api_category c ON c.id = p.category_id"
+    ).format(tags_agg=tags_agg, user_table=user_table)
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    user_table = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                return
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS api_post_fts USING fts5("
+                "title, body, author, category, tags, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                "INSERT INTO api_post_fts (rowid, title, body, author, category, tags) "
+                + document_sql("group_concat(t.name, ' ')", user_table)
+            )
+        elif connection.vendor == "postgresql":
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS api_post_search ("
+                "post_id bigint PRIMARY KEY REFERENCES api_post (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+                "document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS api_post_search_document_gin ON api_post_search USING gin (document)"
+            )
+            cursor.execute(
+                "INSERT INTO api_post_search (post_id, document) "
+                "SELECT d.id, "
+                "setweight(to_tsvector('simple', d.title), 'A') || "
+                "setweight(to_tsvector('simple', d.tags), 'A') || "
+                "setweight(to_tsvector('simple', d.author), 'B') || "
+                "setweight(to_tsvector('simple', d.category), 'B') || "
+                "setweight(to_tsvector('simple', d.body), 'D') "
+                "FROM (" + document_sql("string_agg(t.name, ' ')", user_table) + ") "
+                "AS d (id, title, body, author, category, tags)"
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("DROP TABLE IF EXISTS api_post_fts")
+        elif connection.vendor == "postgresql":
+            cursor.execute("DROP TABLE IF EXISTS api_post_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
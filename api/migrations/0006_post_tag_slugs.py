@@ -0,0 +1,47 @@
+from django.db import migrations, models
+
+
+def backfill_tag_slugs(apps, schema_editor):
+    Post = apps.get_model("api", "Post")
+    Through = Post.tags.through
+    alias = schema_editor.connection.alias
+
+    slugs = {}
+    rows = Through.objects.using(alias).order_by("post_id", "tag__slug").values_list("post_id", "tag__slug")
+    for post_id, slug in rows.iterator(chunk_size=5000):
+        slugs.setdefault(post_id, []).append(slug)
+    groups = {}
+    for post_id, values in slugs.items():
+        groups.setdefault(tuple(values), []).append(post_id)
+    for values, ids in groups.items():
+        for start in range(0, len(ids), 500):
+            Post.objects.using(alias).filter(pk__in=ids[start:start + 500]).update(tag_slugs=list(values))
+
+
+def create_tag_slugs_index(apps, schema_editor):
+    # jsonb containment (`@>`, `?|`) can use a GIN index; SQLite has no
+    # equivalent, so tag filters there go through the M2M table's index instead
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("CREATE INDEX IF NOT EXISTS post_tag_slugs_gin ON api_post USING gin (tag_slugs)")
+
+
+def drop_tag_slugs_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS post_tag_slugs_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_post_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='tag_slugs',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(backfill_tag_slugs, migrations.RunPython.noop),
+        migrations.RunPython(create_tag_slugs_index, drop_tag_slugs_index),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 03:55
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    # existing rows got the migration's run time; creation time is the better guess
+    Post = apps.get_model("api", "Post")
+    Post.objects.using(schema_editor.connection.alias).update(updated_at=F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_post_tag_slugs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('post_id', models.BigIntegerField(unique=True)),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['updated_at', 'id'], name='post_updated_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='posttombstone',
+            index=models.Index(fields=['deleted_at', 'post_id'], name='tombstone_deleted_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_post_updated_at_tombstones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedPost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_entries', to='api.post')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['post', '-score'], name='related_post_score_idx')],
+                'constraints': [models.UniqueConstraint(fields=('post', 'related'), name='related_post_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_related_posts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostStats',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='api.post')),
+                ('views', models.PositiveBigIntegerField(default=0)),
+                ('trending', models.FloatField(default=0.0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-trending', 'post'], name='post_stats_trending_idx'), models.Index(fields=['-views', 'post'], name='post_stats_views_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-18 04:43
+
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+
+def backfill_archive_counts(apps, schema_editor):
+    Post = apps.get_model("api", "Post")
+    ArchiveCount = apps.get_model("api", "ArchiveCount")
+    alias = schema_editor.connection.alias
+
+    counts = Counter()
+    rows = (
+        Post.objects.using(alias).order_by().annotate(month=TruncMonth("created_at"))
+        .values_list("month", "category_id").annotate(n=Count("id"))
+    )
+    for month, category_id, n in rows:
+        if timezone.is_aware(month):
+            month = timezone.localtime(month)
+        counts[month.date(), category_id] += n
+    ArchiveCount.objects.using(alias).bulk_create(
+        [ArchiveCount(month=month, category_id=category_id, count=n) for (month, category_id), n in counts.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_post_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('category__isnull', False)), fields=('month', 'category'), name='archive_month_category_unique'), models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('month',), name='archive_month_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_archive_counts, migrations.RunPython.noop),
+    ]
@@ -1,11 +1,26 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from django.utils.text import slugify
 
+EXCERPT_LENGTH = 280
+
+
+def make_excerpt(body, length=EXCERPT_LENGTH):
+    # collapse paragraphs/whitespace, then cut on a word boundary
+    text = " ".join(body.split())
+    if len(text) <= length:
+        return text
+    return text[:length - 1].rsplit(" ", 1)[0] + "…"
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=120, unique=True)
 
+    def __str__(self):
+        return self.name
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
@@ -15,6 +30,9 @@ class Tag(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=120, unique=True)
 
+    def __str__(self):
+        return self.name
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
@@ -24,18 +42,129 @@ class Post(models.Model):
     title = models.CharField(max_length=250)
     slug = models.SlugField(max_length=300, unique=True, blank=True)
     body = models.TextField()
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True, editable=False)
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name="posts"
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    # also bumped by the bulk updates that change a post's API output (tags,
+    # renditions, category/author renames); drives the `?since=` change feed
+    updated_at = models.DateTimeField(auto_now=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name="posts")
     tags = models.ManyToManyField(Tag, related_name="posts", blank=True)
     image = models.ImageField(upload_to="post_images/", blank=True, null=True)
+    # resized/WebP copies of `image`, written by api.images after upload
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+    # sorted slugs of `tags`, kept in sync by api.signals; lets tag filters skip the M2M join
+    tag_slugs = models.JSONField(default=list, blank=True, editable=False)
 
     class Meta:
-        ordering = ["-created_at"]
+        ordering = ["-created_at", "-id"]
+        indexes = [
+            # keyset pagination: every ordering ends with id as a unique tiebreaker
+            models.Index(fields=["created_at", "id"], name="post_created_id_idx"),
+            models.Index(fields=["title", "id"], name="post_title_id_idx"),
+            # an author's posts in id order; not `?ordering=author__username`, which sorts on
+            # the joined user's name and so can't be walked from an index on this table
+            models.Index(fields=["author", "id"], name="post_author_id_idx"),
+            models.Index(fields=["updated_at", "id"], name="post_updated_id_idx"),
+        ]
+
+    def __str__(self):
+        return self.title
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)[:300]
+        self.excerpt = make_excerpt(self.body)
+        update_fields = kwargs.get("update_fields")
+        if update_fields:
+            update_fields = {*update_fields, "updated_at"}
+            if "body" in update_fields:
+                update_fields.add("excerpt")
+            kwargs["update_fields"] = update_fields
         super().save(*args, **kwargs)
+
+
+class PostTombstone(models.Model):
+    """A deleted post, so the change feed can tell mirrors to drop it."""
+    post_id = models.BigIntegerField(unique=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["deleted_at", "post_id"], name="tombstone_deleted_idx"),
+        ]
+
+
+class RelatedPost(models.Model):
+    """One of a post's most similar posts, precomputed by api.related."""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="related_entries")
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["post", "related"], name="related_post_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["post", "-score"], name="related_post_score_idx"),
+        ]
+
+
+class PostStats(models.Model):
+    """A post's view count and trending score, written in batches by api.counters."""
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    views = models.PositiveBigIntegerField(default=0)
+    # log2 of the post's views, each weighted by when it happened (see api.counters)
+    trending = models.FloatField(default=0.0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-trending", "post"], name="post_stats_trending_idx"),
+            models.Index(fields=["-views", "post"], name="post_stats_views_idx"),
+        ]
+
+
+class ArchiveCount(models.Model):
+    """Posts created in a month in a category (null: no category), kept by api.archive."""
+    month = models.DateField()  # its first day
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, related_name="+")
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # NULLs never conflict in a unique index, so the uncategorized rows get their own
+            models.UniqueConstraint(
+                fields=["month", "category"], condition=models.Q(category__isnull=False), name="archive_month_category_unique"
+            ),
+            models.UniqueConstraint(
+                fields=["month"], condition=models.Q(category__isnull=True), name="archive_month_unique"
+            ),
+        ]
+
+
+def touch_posts(queryset):
+    """Mark posts changed for the feed after an update that skips `save()`."""
+    return queryset.update(updated_at=timezone.now())
+
+
+def refresh_tag_slugs(post_ids, using="default"):
+    """Recompute `Post.tag_slugs` for `post_ids` from the M2M table."""
+    Through = Post.tags.through
+    post_ids = list(post_ids)
+    for start in range(0, len(post_ids), 500):
+        chunk = post_ids[start:start + 500]
+        slugs = {post_id: [] for post_id in chunk}
+        rows = (
+            Through.objects.using(using).filter(post_id__in=chunk)
+            .order_by("post_id", "tag__slug").values_list("post_id", "tag__slug")
+        )
+        for post_id, slug in rows:
+            slugs[post_id].append(slug)
+        # one UPDATE per distinct tag set rather than per post
+        groups = {}
+        for post_id, values in slugs.items():
+            groups.setdefault(tuple(values), []).append(post_id)
+        for values, ids in groups.items():
+            Post.objects.using(using).filter(pk__in=ids).update(tag_slugs=list(values), updated_at=timezone.now())
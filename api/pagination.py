@@ -1,6 +1,186 @@
-from rest_framework.pagination import CursorPagination
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
 
 class PostCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the full (sort key, ..., id) tuple.
+
+    Whatever ordering is active gets `id` appended as a unique tiebreaker and
+    the cursor stores every key of the last row, so the next page is a plain
+    index range scan (`WHERE (key, id) > (...)`) instead of DRF's
+    position + offset scheme. Deep pages cost the same as page one and rows
+    sharing a `created_at` are never skipped or repeated.
+    """
     page_size = 10
-    ordering = "-created_at"   # default sort; cursor will be based on created_at
+    ordering = "-created_at"   # default sort; id is appended as a tiebreaker
     cursor_query_param = "cursor"
+    tiebreaker = "id"
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        keys = [term.lstrip("-") for term in ordering]
+        if self.tiebreaker not in keys and "pk" not in keys:
+            # match the direction of the last key so a single composite index can be walked
+            prefix = "-" if ordering[-1].startswith("-") else ""
+            ordering = ordering + (prefix + self.tiebreaker,)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page([row async for row in page_queryset.aiterator()])
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """The query for one page plus a row to tell whether another page follows."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.model = queryset.model
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*[self._order_expression(term) for term in ordering])
+
+        if current_position is not None:
+            queryset = queryset.filter(self._keyset_filter(ordering, json.loads(current_position)))
+
+        return queryset[offset:offset + self.page_size + 1]
+
+    def set_page(self, results):
+        (offset, reverse, current_position) = self.cursor or (0, False, None)
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None or cursor.position is None:
+            return cursor
+        try:
+            position = json.loads(cursor.position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def _get_position_from_instance(self, instance, ordering):
+        position = []
+        for term in ordering:
+            field = term.lstrip("-")
+            if isinstance(instance, dict):
+                # `.values()` rows carry related lookups under their full name
+                value = instance[field]
+            else:
+                value = instance
+                for attr in field.split("__"):
+                    if value is None:
+                        break
+                    value = getattr(value, attr)
+            if isinstance(value, (datetime, date)):
+                # isoformat keeps microseconds, which DjangoJSONEncoder would drop
+                value = value.isoformat()
+            elif value is not None and not isinstance(value, (int, float, str)):
+                value = str(value)
+            position.append(value)
+        return json.dumps(position, separators=(",", ":"))
+
+    def _is_nullable(self, field_path):
+        opts = self.model._meta
+        for name in field_path.split("__"):
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                # annotations such as the search `rank`
+                return False
+            if field.null:
+                return True
+            if field.is_relation:
+                opts = field.related_model._meta
+        return False
+
+    def _order_expression(self, term):
+        # nullable keys (author__username) sort NULLs after every value ascending
+        # and before every value descending, the same on SQLite and Postgres
+        field = term.lstrip("-")
+        if not self._is_nullable(field):
+            return term
+        if term.startswith("-"):
+            return F(field).desc(nulls_first=True)
+        return F(field).asc(nulls_last=True)
+
+    def _after(self, term, value):
+        field = term.lstrip("-")
+        descending = term.startswith("-")
+        if value is None:
+            return Q(**{field + "__isnull": False}) if descending else None
+        condition = Q(**{field + ("__lt" if descending else "__gt"): value})
+        if not descending and self._is_nullable(field):
+            condition |= Q(**{field + "__isnull": True})
+        return condition
+
+    def _keyset_filter(self, ordering, position):
+        # (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ... with per-key direction
+        condition = Q(pk__in=[])
+        equal = Q()
+        for term, value in zip(ordering, position):
+            field = term.lstrip("-")
+            after = self._after(term, value)
+            if after is not None:
+                condition |= equal & after
+            equal &= Q(**{field + "__isnull": True}) if value is None else Q(**{field: value})
+
+        # redundant leading bound so the planner can turn this into an index range scan
+        leading, value = ordering[0], position[0]
+        if value is not None and not self._is_nullable(leading.lstrip("-")):
+            lookup = "__lte" if leading.startswith("-") else "__gte"
+            condition &= Q(**{leading.lstrip("-") + lookup: value})
+        return condition
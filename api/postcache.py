@@ -0,0 +1,80 @@
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from core.db_router import replica_used
+
+from .cache import changed_within, get_cache
+from .models import Post
+from .serializers import PostListFastSerializer, PostListSerializer, post_columns
+
+# Per-post cache behind `/api/posts/by-slug/{slug}/` and `/api/posts/batch/`.
+#
+# An entry is one post as PostListFastSerializer takes it: its row with the
+# columns of every output field, plus its tag names, so it serves any
+# `?fields=`. The JSON itself isn't stored because image URLs are built from
+# the request's host; rendering a row is cheap. Misses cost one query for the
+# rows and one for their tags, however many there are.
+#
+# Entries are keyed by post id; a slug key holds the id, and is checked
+# against the row's slug on every read. api.signals deletes a post's entry,
+# once the write commits, when the post, its tags, its category or its
+# author change. Unlike the versioned response cache, writes to other posts
+# leave it alone.
+
+ROW_KEY = "api:post:%d"
+SLUG_KEY = "api:post-slug:%s"
+COLUMNS = post_columns(PostListSerializer.Meta.fields)
+
+
+def get_timeout():
+    return getattr(settings, "POST_CACHE_TIMEOUT", 3600)
+
+
+def slug_key(slug):
+    # slugs run to 300 characters; memcached keys stop at 250
+    return SLUG_KEY % hashlib.sha1(slug.encode()).hexdigest()
+
+
+def can_store():
+    # same rule as the response cache: a replica read soon after a write may predate it
+    lag = getattr(settings, "DATABASE_REPLICA_LAG", 0)
+    return not (lag and replica_used() and changed_within(lag))
+
+
+def get_posts(ids=(), slugs=()):
+    """
+    Posts by id and by slug: ({id: (row, tag names)}, {slug: id}). Posts
+    that don't exist are left out of both.
+    """
+    cache = get_cache()
+    found = cache.get_many([slug_key(slug) for slug in slugs])
+    slug_ids = {slug: found[slug_key(slug)] for slug in slugs if slug_key(slug) in found}
+    wanted = {*ids, *slug_ids.values()}
+    found = cache.get_many([ROW_KEY % post_id for post_id in wanted])
+    posts = {post_id: found[ROW_KEY % post_id] for post_id in wanted if ROW_KEY % post_id in found}
+    # a slug's entry outlives a rename; trust it only while the row agrees
+    slug_ids = {slug: post_id for slug, post_id in slug_ids.items() if post_id in posts and posts[post_id][0]["slug"] == slug}
+
+    missing_ids = [post_id for post_id in ids if post_id not in posts]
+    missing_slugs = {slug for slug in slugs if slug not in slug_ids}
+    if missing_ids or missing_slugs:
+        rows = list(Post.objects.filter(Q(pk__in=missing_ids) | Q(slug__in=list(missing_slugs))).values(*COLUMNS))
+        tags = PostListFastSerializer(None).get_tags([row["id"] for row in rows]) if rows else {}
+        fetched = {row["id"]: (row, tags.get(row["id"], [])) for row in rows}
+        posts.update(fetched)
+        slug_ids.update((row["slug"], row["id"]) for row in rows if row["slug"] in missing_slugs)
+        if fetched and can_store():
+            entries = {ROW_KEY % post_id: entry for post_id, entry in fetched.items()}
+            entries.update((slug_key(row["slug"]), row["id"]) for row in rows)
+            cache.set_many(entries, get_timeout())
+    return posts, slug_ids
+
+
+def invalidate(post_ids, using="default"):
+    """Drop the entries of `post_ids` once the current transaction commits."""
+    keys = [ROW_KEY % post_id for post_id in post_ids]
+    if keys:
+        transaction.on_commit(lambda: get_cache().delete_many(keys), using=using)
@@ -0,0 +1,330 @@
+import heapq
+import logging
+import math
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, F, Min, Q, Window
+from django.db.models.functions import RowNumber
+
+from .cache import bump_content_version, get_cache
+from .models import Post, RelatedPost
+
+# Related posts (`/api/posts/{id}/related/`), precomputed.
+#
+# A post's related posts are the RELATED_POSTS_LIMIT others with the highest
+# similarity: the summed weight of the tags they share (rarer tags weigh more,
+# log(1 + posts / posts with the tag)), times 1 + RELATED_CATEGORY_BOOST when
+# both are in the same category, halved for every RELATED_HALF_LIFE_DAYS
+# between their creation dates. The score is symmetric and doesn't depend on
+# the current time, so a stored list only goes stale when tags change.
+#
+# `rebuild_related_posts` computes every list from one pass over the post x tag
+# matrix held in memory (`PostGraph`). Tag changes (api.signals) update the
+# changed post's list and the lists it enters or leaves; tag weights drift a
+# little between rebuilds, which is fine for a recommendation.
+#
+# Those updates read every post sharing a tag with the changed ones, which for
+# a popular tag is most of the corpus, so saves don't wait for them: once the
+# transaction commits the post ids are queued, and one background thread works
+# through the queue, a batch of whatever piled up at a time. The tag weights,
+# a count over the whole M2M table, are cached for RELATED_WEIGHTS_TIMEOUT
+# seconds and recomputed by every rebuild.
+
+logger = logging.getLogger(__name__)
+
+WEIGHTS_KEY = "api:related:tag-weights:%s"
+
+_executor = None
+_pending = {}   # alias: (post ids to update, post ids to refresh)
+_pending_lock = threading.Lock()
+
+
+def get_limit():
+    return getattr(settings, "RELATED_POSTS_LIMIT", 10)
+
+
+def get_weights_timeout():
+    return getattr(settings, "RELATED_WEIGHTS_TIMEOUT", 3600)
+
+
+def get_tag_weights(using="default"):
+    """Every tag's weight, from the cache when a rebuild or an earlier update left them there."""
+    cache = get_cache()
+    weights = cache.get(WEIGHTS_KEY % using)
+    if weights is None:
+        Through = Post.tags.through
+        counts = dict(Through.objects.using(using).values_list("tag__slug").annotate(n=Count("post_id")).order_by())
+        weights = tag_weights(counts, Post.objects.using(using).count())
+        cache.set(WEIGHTS_KEY % using, weights, get_weights_timeout())
+    return weights
+
+
+class PostGraph:
+    """A sparse post x tag matrix: tag sets by post, post ids by tag, and tag weights."""
+
+    def __init__(self, rows, weights):
+        self.weights = weights
+        self.boost = 1 + getattr(settings, "RELATED_CATEGORY_BOOST", 0.5)
+        # per day: halves the score every RELATED_HALF_LIFE_DAYS
+        self.decay_rate = math.log(2) / getattr(settings, "RELATED_HALF_LIFE_DAYS", 180)
+        self.posts = {}
+        self.by_tag = {}
+        for post_id, category_id, created_at, slugs in rows:
+            self.posts[post_id] = (category_id, created_at.timestamp() / 86400, frozenset(slugs))
+            for slug in slugs:
+                self.by_tag.setdefault(slug, []).append(post_id)
+
+    @classmethod
+    def load(cls, using="default"):
+        """Every post, with tag weights taken from the same rows."""
+        rows = list(Post.objects.using(using).order_by().values_list("id", "category_id", "created_at", "tag_slugs"))
+        counts = Counter(slug for *_, slugs in rows for slug in slugs)
+        return cls(rows, tag_weights(counts, len(rows)))
+
+    @classmethod
+    def around(cls, post_ids, using="default"):
+        """`post_ids` and every post sharing a tag with one of them."""
+        Through = Post.tags.through
+        neighbours = Through.objects.using(using).filter(
+            tag_id__in=Through.objects.using(using).filter(post_id__in=post_ids).values("tag_id")
+        ).values("post_id")
+        rows = Post.objects.using(using).filter(Q(pk__in=post_ids) | Q(pk__in=neighbours)).order_by()
+        return cls(rows.values_list("id", "category_id", "created_at", "tag_slugs"), get_tag_weights(using))
+
+    def similarity(self, post_id, other_id):
+        category, day, tags = self.posts[post_id]
+        other_category, other_day, other_tags = self.posts[other_id]
+        factor = math.exp(-self.decay_rate * abs(day - other_day))
+        if category is not None and category == other_category:
+            factor *= self.boost
+        return sum(self.weights.get(slug, 0.0) for slug in tags & other_tags) * factor
+
+    def shared_counts(self, post_id):
+        counts = Counter()
+        for slug in self.posts[post_id][2]:
+            counts.update(self.by_tag[slug])
+        counts.pop(post_id, None)
+        return counts
+
+    def candidates(self, post_id):
+        """Posts sharing a tag with `post_id` as (id, shared tags), most shared first."""
+        counts = self.shared_counts(post_id)
+        # most share just one tag and `top` rarely gets to them: only sort the rest
+        yield from sorted(((other_id, n) for other_id, n in counts.items() if n > 1), key=itemgetter(1), reverse=True)
+        yield from ((other_id, n) for other_id, n in counts.items() if n == 1)
+
+    def scores(self, post_id):
+        """Similarity to every post sharing a tag."""
+        return {other_id: self.similarity(post_id, other_id) for other_id in self.shared_counts(post_id)}
+
+    def top(self, post_id, limit):
+        """The `limit` most similar posts as (id, score), best first."""
+        category, day, tags = self.posts[post_id]
+        weights, boost, rate = self.weights, self.boost, self.decay_rate
+        heaviest = max((weights.get(slug, 0.0) for slug in tags), default=0.0)
+        # a post sharing n tags scores at most n x the heaviest of them (x the boost, x
+        # its decay), so candidates go by shared-tag count until none can beat the k-th best
+        best, floor = [], 0.0
+        for other_id, shared in self.candidates(post_id):
+            if shared * heaviest * boost <= floor:
+                break
+            other_category, other_day, other_tags = self.posts[other_id]
+            factor = math.exp(-rate * abs(day - other_day))
+            if category is not None and category == other_category:
+                factor *= boost
+            if shared * heaviest * factor <= floor:
+                continue
+            item = (sum(weights.get(slug, 0.0) for slug in tags & other_tags) * factor, -other_id)
+            if len(best) < limit:
+                heapq.heappush(best, item)
+            elif item > best[0]:
+                heapq.heapreplace(best, item)
+            if len(best) == limit:
+                floor = best[0][0]
+        return [(-negative_id, score) for score, negative_id in sorted(best, reverse=True)]
+
+
+def tag_weights(counts, total):
+    return {slug: math.log(1 + total / count) for slug, count in counts.items() if count}
+
+
+def store(lists, using="default"):
+    """Replace the stored related posts of each post in `lists` ({post_id: [(id, score)]})."""
+    post_ids = list(lists)
+    with transaction.atomic(using=using):
+        for start in range(0, len(post_ids), 500):
+            chunk = post_ids[start:start + 500]
+            RelatedPost.objects.using(using).filter(post_id__in=chunk).delete()
+            RelatedPost.objects.using(using).bulk_create(
+                [
+                    RelatedPost(post_id=post_id, related_id=related_id, score=score)
+                    for post_id in chunk for related_id, score in lists[post_id]
+                ],
+                batch_size=1000,
+            )
+
+
+def rebuild(using="default"):
+    """Recompute every post's related posts. Returns the number of posts."""
+    graph = PostGraph.load(using)
+    limit = get_limit()
+    entries = (
+        RelatedPost(post_id=post_id, related_id=related_id, score=score)
+        for post_id in graph.posts for related_id, score in graph.top(post_id, limit)
+    )
+    with transaction.atomic(using=using):
+        RelatedPost.objects.using(using).all().delete()
+        while batch := list(islice(entries, 5000)):
+            RelatedPost.objects.using(using).bulk_create(batch, batch_size=1000)
+    get_cache().set(WEIGHTS_KEY % using, graph.weights, get_weights_timeout())
+    return len(graph.posts)
+
+
+def refresh_related(post_ids, using="default"):
+    """Recompute the related posts of `post_ids` from scratch."""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    graph = PostGraph.around(post_ids, using)
+    limit = get_limit()
+    store({post_id: graph.top(post_id, limit) for post_id in post_ids if post_id in graph.posts}, using)
+
+
+def list_stats(post_ids, using="default"):
+    """{post_id: (length, lowest score)} of the stored lists of `post_ids` that have entries."""
+    post_ids = list(post_ids)
+    stats = {}
+    for start in range(0, len(post_ids), 500):
+        rows = (
+            RelatedPost.objects.using(using).filter(post_id__in=post_ids[start:start + 500])
+            .values_list("post_id").annotate(n=Count("id"), low=Min("score")).order_by()
+        )
+        stats.update((post_id, (n, low)) for post_id, n, low in rows)
+    return stats
+
+
+def trim(post_ids, limit, using="default"):
+    """Cut the stored lists of `post_ids` back to their `limit` best."""
+    post_ids = list(post_ids)
+    entries = RelatedPost.objects.using(using)
+    rank = Window(RowNumber(), partition_by=[F("post_id")], order_by=[F("score").desc(), F("related_id").asc()])
+    for start in range(0, len(post_ids), 500):
+        ranked = entries.filter(post_id__in=post_ids[start:start + 500]).annotate(rank=rank)
+        entries.filter(id__in=list(ranked.filter(rank__gt=limit).values_list("id", flat=True))).delete()
+
+
+def update_related(post_ids, using="default"):
+    """
+    Bring the table up to date after the tags of `post_ids` changed: their
+    own lists, and every list they have entered, moved in or dropped out of.
+    """
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    limit = get_limit()
+    stale = set()
+    # one graph, and one read of the lists' lengths and lowest scores, for the
+    # whole batch: the tags all changed before any of this runs
+    graph = PostGraph.around(post_ids, using)
+    lists = list_stats(graph.posts, using)
+    entries = RelatedPost.objects.using(using)
+    for post_id in post_ids:
+        if post_id not in graph.posts:
+            continue
+        scores = graph.scores(post_id)
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        store({post_id: top}, using)
+        lists[post_id] = (len(top), top[-1][1]) if top else (0, 0.0)
+
+        # scores are symmetric: the post's score for another is its place in that one's list
+        listed = dict(entries.filter(related_id=post_id).values_list("post_id", "score"))
+        for other_id, old in listed.items():
+            new = scores.get(other_id, 0.0)
+            if new < old:
+                # it may have fallen below a post that isn't stored; only a recompute knows
+                stale.add(other_id)
+            elif new > old:
+                # `lists` may now hold a low that is too low, which only lets a post in to be trimmed
+                entries.filter(post_id=other_id, related_id=post_id).update(score=new)
+
+        candidates = {other_id: score for other_id, score in scores.items() if other_id not in listed}
+        entering = [
+            other_id for other_id, score in candidates.items()
+            if other_id not in lists or lists[other_id][0] < limit or score > lists[other_id][1]
+        ]
+        entries.bulk_create(
+            [RelatedPost(post_id=other_id, related_id=post_id, score=candidates[other_id]) for other_id in entering],
+            batch_size=1000,
+        )
+        full = [other_id for other_id in entering if lists.get(other_id, (0,))[0] >= limit]
+        for other_id in entering:
+            n, low = lists.get(other_id, (0, candidates[other_id]))
+            lists[other_id] = (n + 1, min(low, candidates[other_id]))
+        trim(full, limit, using)
+        lists.update(list_stats(full, using))
+    refresh_related(stale - set(post_ids), using)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # one thread: updates rewrite each other's lists, so they mustn't overlap
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="related")
+    return _executor
+
+
+def schedule(update=(), refresh=(), using="default"):
+    """
+    `update_related(update)` and `refresh_related(refresh)`, once the current
+    transaction commits: in the background, merged with whatever else is
+    queued, or right away with RELATED_UPDATES_SYNC.
+    """
+    update, refresh = set(update), set(refresh)
+    if not (update or refresh):
+        return
+    if getattr(settings, "RELATED_UPDATES_SYNC", False):
+        transaction.on_commit(lambda: run(update, refresh, using), using=using)
+    else:
+        transaction.on_commit(lambda: enqueue(update, refresh, using), using=using)
+
+
+def enqueue(update, refresh, using="default"):
+    with _pending_lock:
+        queued = using in _pending
+        updates, refreshes = _pending.setdefault(using, (set(), set()))
+        updates |= update
+        refreshes |= refresh
+    if not queued:
+        get_executor().submit(_run_in_background, using)
+
+
+def run(update, refresh, using="default"):
+    update_related(update, using)
+    refresh_related(set(refresh) - set(update), using)
+    if update or refresh:
+        # runs after the tag change committed (and bumped), so related responses
+        # cached since then hold the old lists
+        bump_content_version()
+
+
+def run_pending(using="default"):
+    """Run everything queued for `using`."""
+    with _pending_lock:
+        update, refresh = _pending.pop(using, (set(), set()))
+    run(update, refresh, using)
+
+
+def _run_in_background(using):
+    try:
+        run_pending(using)
+    except Exception:
+        logger.exception("Updating related posts failed")
+    finally:
+        # the pool thread gets its own DB connections; don't leave them open
+        connections.close_all()
@@ -0,0 +1,59 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+from .instrumentation import timer
+
+try:
+    import orjson
+except ImportError:  # optional speedup; falls back to the stdlib encoder
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in JSONRenderer that encodes with orjson when it is installed.
+
+    Output is byte-for-byte what DRF's compact renderer produces; indented
+    output (`Accept: application/json; indent=4`, the browsable API) and
+    non-compact settings go through the stock renderer.
+    """
+    _default = encoders.JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with timer("render"):
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or not self.compact or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # datetimes pass through to DRF's encoder so their format matches exactly
+        ret = orjson.dumps(data, default=self._default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        # same strict-javascript-subset escaping as JSONRenderer
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Content negotiation for `/api/posts/export/`. The view streams the body
+    itself, so these only ever render error responses, which go out as JSON.
+    """
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get("response")
+        if response is not None:
+            response["Content-Type"] = "application/json"
+        return FastJSONRenderer().render(data)
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = "text/csv"
+    format = "csv"
@@ -0,0 +1,228 @@
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+# Full-text search backends for the posts list.
+#
+# Every backend keeps a side table with one row per post (title, body, author,
+# category and tag names) so a search is a single index lookup instead of
+# `LIKE '%term%'` over five joined columns. Rows are refreshed from the signal
+# handlers in `api.signals` and can be rebuilt with `manage.py rebuild_search_index`.
+#
+# The `rank` annotation is ordered "best first", so `?ordering=rank` returns the
+# most relevant posts at the top.
+
+
+class BaseSearchBackend:
+    vendor = None
+
+    def __init__(self, alias="default"):
+        self.alias = alias
+
+    @property
+    def connection(self):
+        return connections[self.alias]
+
+    def is_available(self):
+        return self.connection.vendor == self.vendor and self.index_table in self.connection.introspection.table_names()
+
+    def search(self, queryset, terms, with_rank=False):
+        raise NotImplementedError
+
+    def index_posts(self, post_ids):
+        raise NotImplementedError
+
+    def remove_posts(self, post_ids):
+        raise NotImplementedError
+
+    def rebuild(self):
+        raise NotImplementedError
+
+    def _document_sql(self, where=""):
+        # (id, title, body, author, category, tags) for every post matching `where`
+        user_table = get_user_model()._meta.db_table
+        return (
+            "SELECT p.id, p.title, p.body, COALESCE(u.username, ''), COALESCE(c.name, ''), "
+            "COALESCE((SELECT {tags_agg} FROM api_post_tags pt JOIN api_tag t ON t.id = pt.tag_id "
+            "WHERE pt.post_id = p.id), '') "
+            "FROM api_post p "
+            "LEFT JOIN {user_table} u ON u.id = p.author_id "
+            "LEFT JOIN api_category c ON c.id = p.category_id {where}"
+        ).format(tags_agg=self.tags_agg, user_table=user_table, where=where)
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    vendor = "sqlite"
+    index_table = "api_post_fts"
+    tags_agg = "group_concat(t.name, ' ')"
+    # bm25 column weights: title, body, author, category, tags
+    weights = (10.0, 1.0, 2.0, 2.0, 5.0)
+
+    def match_expression(self, terms):
+        # quote every term so user input can't inject FTS5 syntax; prefix-match the last token
+        return " AND ".join('"%s"*' % term.replace('"', '""') for term in terms if re.search(r"\w", term))
+
+    def search(self, queryset, terms, with_rank=False):
+        match = self.match_expression(terms)
+        if not match:
+            return queryset.none()
+        queryset = queryset.filter(
+            id__in=RawSQL("SELECT rowid FROM api_post_fts WHERE api_post_fts MATCH %s", [match])
+        )
+        if with_rank:
+            bm25 = "bm25(api_post_fts, %s)" % ", ".join(str(w) for w in self.weights)
+            queryset = queryset.annotate(rank=RawSQL(
+                "SELECT %s FROM api_post_fts WHERE api_post_fts MATCH %%s AND rowid = api_post.id" % bm25,
+                [match],
+                output_field=FloatField(),
+            ))
+        return queryset
+
+    def index_posts(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        placeholders = ", ".join(["%s"] * len(post_ids))
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM api_post_fts WHERE rowid IN (%s)" % placeholders, post_ids)
+            cursor.execute(
+                "INSERT INTO api_post_fts (rowid, title, body, author, category, tags) "
+                + self._document_sql("WHERE p.id IN (%s)" % placeholders),
+                post_ids,
+            )
+
+    def remove_posts(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        placeholders = ", ".join(["%s"] * len(post_ids))
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM api_post_fts WHERE rowid IN (%s)" % placeholders, post_ids)
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM api_post_fts")
+            cursor.execute(
+                "INSERT INTO api_post_fts (rowid, title, body, author, category, tags) " + self._document_sql()
+            )
+            cursor.execute("INSERT INTO api_post_fts (api_post_fts) VALUES ('optimize')")
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    vendor = "postgresql"
+    index_table = "api_post_search"
+    tags_agg = "string_agg(t.name, ' ')"
+    document = (
+        "setweight(to_tsvector('simple', d.title), 'A') || "
+        "setweight(to_tsvector('simple', d.tags), 'A') || "
+        "setweight(to_tsvector('simple', d.author), 'B') || "
+        "setweight(to_tsvector('simple', d.category), 'B') || "
+        "setweight(to_tsvector('simple', d.body), 'D')"
+    )
+
+    def tsquery(self, terms):
+        # 'tok1':* & 'tok2':* -- only word characters survive, so the query can't be malformed
+        tokens = [tok for term in terms for tok in re.findall(r"\w+", term)]
+        return " & ".join("'%s':*" % tok for tok in tokens)
+
+    def search(self, queryset, terms, with_rank=False):
+        query = self.tsquery(terms)
+        if not query:
+            return queryset.none()
+        queryset = queryset.filter(id__in=RawSQL(
+            "SELECT post_id FROM api_post_search WHERE document @@ to_tsquery('simple', %s)", [query]
+        ))
+        if with_rank:
+            queryset = queryset.annotate(rank=RawSQL(
+                "SELECT -ts_rank(document, to_tsquery('simple', %s)) FROM api_post_search "
+                "WHERE post_id = api_post.id",
+                [query],
+                output_field=FloatField(),
+            ))
+        return queryset
+
+    def _upsert_sql(self, where=""):
+        return (
+            "INSERT INTO api_post_search (post_id, document) "
+            "SELECT d.id, {document} FROM ({source}) AS d (id, title, body, author, category, tags) "
+            "ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document"
+        ).format(document=self.document, source=self._document_sql(where))
+
+    def index_posts(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute(self._upsert_sql("WHERE p.id = ANY(%s)"), [post_ids])
+
+    def remove_posts(self, post_ids):
+        post_ids = list(post_ids)
+        if not post_ids:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM api_post_search WHERE post_id = ANY(%s)", [post_ids])
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("TRUNCATE api_post_search")
+            cursor.execute(self._upsert_sql())
+
+
+SEARCH_BACKENDS = {
+    "sqlite": SQLiteFTSBackend,
+    "postgresql": PostgresSearchBackend,
+}
+
+_backends = {}
+
+
+def get_search_backend(alias="default"):
+    """
+    Return the search backend for a database alias, or None when no index is
+    installed there (callers then fall back to DRF's icontains search).
+
+    `POST_SEARCH_BACKEND` may name a backend class to use instead of the
+    vendor default, or be set to None to disable indexed search entirely.
+    """
+    if alias not in _backends:
+        backend_path = getattr(settings, "POST_SEARCH_BACKEND", "auto")
+        if backend_path is None:
+            backend = None
+        elif backend_path == "auto":
+            backend_cls = SEARCH_BACKENDS.get(connections[alias].vendor)
+            backend = backend_cls(alias) if backend_cls else None
+        else:
+            backend = import_string(backend_path)(alias)
+        if backend is not None and not backend.is_available():
+            backend = None
+        _backends[alias] = backend
+    return _backends[alias]
+
+
+async def aget_search_backend(alias="default"):
+    # the first lookup per alias inspects the schema, which can't run on the event loop
+    if alias in _backends:
+        return _backends[alias]
+    return await sync_to_async(get_search_backend)(alias)
+
+
+def reset_search_backends():
+    _backends.clear()
+
+
+def index_posts(post_ids, alias="default"):
+    backend = get_search_backend(alias)
+    if backend is not None:
+        backend.index_posts(post_ids)
+
+
+def remove_posts(post_ids, alias="default"):
+    backend = get_search_backend(alias)
+    if backend is not None:
+        backend.remove_posts(post_ids)
@@ -1,31 +1,100 @@
+from collections import defaultdict
+
+from django.utils.encoding import iri_to_uri
+from django.utils.text import slugify
 from rest_framework import serializers
+from .images import renditions_representation
+from .instrumentation import timer
 from .models import *
 
-class CategorySerializer(serializers.ModelSerializer):
+
+class TimedDataMixin:
+    # reports serializer `.data` time to the request's Server-Timing header
+    @property
+    def data(self):
+        with timer('serialize'):
+            return super().data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    pass
+
+class CategorySerializer(TimedDataMixin, serializers.ModelSerializer):
      class Meta:
         model = Category
         fields = ['id','name']
+        list_serializer_class = TimedListSerializer
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedDataMixin, serializers.ModelSerializer):
      class Meta:
         model = Tag
         fields = ['id','name']
+        list_serializer_class = TimedListSerializer
         
 
 
 
 
-class PostListSerializer(serializers.ModelSerializer):
+POST_DEFAULT_FIELDS = ['id','title','body','author','created_at','category','tag','image','images']
+
+# model columns each output field reads; drives `.only()` and `.values()`
+POST_FIELD_COLUMNS = {
+    'id': ['id'],
+    'title': ['title'],
+    'slug': ['slug'],
+    'excerpt': ['excerpt'],
+    'body': ['body'],
+    'author': ['author__username'],
+    'created_at': ['created_at'],
+    'updated_at': ['updated_at'],
+    'category': ['category__name'],
+    'tag': [],
+    'image': ['image'],
+    'images': ['image', 'image_renditions'],
+}
+
+
+def get_requested_fields(request, available, default, param='fields'):
+    """
+    Parse a sparse fieldset (`?fields=id,title,excerpt`) into field names in
+    `available` order. Returns `default` when the parameter is absent.
+    """
+    raw = request.query_params.get(param) if request is not None else None
+    if not raw:
+        return list(default)
+    names = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = sorted(names - set(available))
+    if unknown:
+        raise serializers.ValidationError({param: ['Unknown field(s): %s' % ', '.join(unknown)]})
+    return [name for name in available if name in names]
+
+
+def post_columns(fields):
+    columns = ['id']
+    for name in fields:
+        columns += [c for c in POST_FIELD_COLUMNS[name] if c not in columns]
+    return columns
+
+
+class PostListSerializer(TimedDataMixin, serializers.ModelSerializer):
     author = serializers.SerializerMethodField()
     category = serializers.SerializerMethodField()
     tag = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
-        fields = ['id','title','body','author','created_at','category','tag','image']
+        fields = ['id','title','slug','excerpt','body','author','created_at','updated_at','category','tag','image','images']
         read_only_fields = fields
+        list_serializer_class = TimedListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.context.get('fields', POST_DEFAULT_FIELDS)
+        for name in set(self.fields) - set(requested):
+            self.fields.pop(name)
 
     def get_author(self, obj):
         if obj.author:
@@ -49,3 +118,126 @@ class PostListSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(url)
             return url
         return None
+
+    def get_images(self, obj):
+        request = self.context.get('request')
+        storage = Post._meta.get_field('image').storage
+
+        def url(name):
+            return request.build_absolute_uri(storage.url(name)) if request else storage.url(name)
+        return renditions_representation(obj.image_renditions, obj.image.name if obj.image else None, url)
+
+
+class PostListFastSerializer:
+    """
+    Row-based twin of PostListSerializer for list pages.
+
+    Works on `.values(*value_fields)` rows and fetches the tags of the whole
+    page in one query, skipping DRF's per-field machinery. The output is
+    identical to PostListSerializer(many=True) for the same rows and fields.
+    """
+    value_fields = post_columns(POST_DEFAULT_FIELDS)
+    created_at_field = serializers.DateTimeField()
+
+    def __init__(self, rows, context=None):
+        self.rows = rows
+        self.context = context or {}
+        self.fields = self.context.get('fields', POST_DEFAULT_FIELDS)
+
+    @classmethod
+    def get_value_fields(cls, context):
+        return post_columns(context.get('fields', POST_DEFAULT_FIELDS))
+
+    def get_tags_queryset(self, post_ids):
+        # values() rather than values_list(): the latter's aiterator() runs its query on the event loop
+        through = Post.tags.through.objects.filter(post_id__in=post_ids).order_by('post_id', 'tag_id')
+        return through.values('post_id', 'tag__name')
+
+    def get_tags(self, post_ids):
+        tags = defaultdict(list)
+        for row in self.get_tags_queryset(post_ids):
+            tags[row['post_id']].append(row['tag__name'])
+        return tags
+
+    async def aget_tags(self, post_ids):
+        tags = defaultdict(list)
+        async for row in self.get_tags_queryset(post_ids).aiterator():
+            tags[row['post_id']].append(row['tag__name'])
+        return tags
+
+    def get_image_url(self):
+        storage = Post._meta.get_field('image').storage
+        request = self.context.get('request')
+        host = request.build_absolute_uri('/')[:-1] if request else None
+
+        def image_url(name):
+            if not name:
+                return None
+            url = storage.url(name)
+            if request is None:
+                return url
+            if url.startswith('/') and not url.startswith('//'):
+                return iri_to_uri(host + url)   # what build_absolute_uri does, minus the per-row work
+            return request.build_absolute_uri(url)
+        return image_url
+
+    @property
+    def data(self):
+        with timer('serialize'):
+            return self.to_representation(list(self.rows))
+
+    async def adata(self):
+        """`.data` for async views: rows and tags come through the async ORM."""
+        with timer('serialize'):
+            rows = self.rows if isinstance(self.rows, list) else [row async for row in self.rows.aiterator()]
+            tags = await self.aget_tags([row['id'] for row in rows]) if 'tag' in self.fields else {}
+            return self.to_representation(rows, tags)
+
+    def to_representation(self, rows, tags=None):
+        if tags is None:
+            tags = self.get_tags([row['id'] for row in rows]) if 'tag' in self.fields else {}
+        image_url = self.get_image_url()
+        timestamp = self.created_at_field.to_representation
+        getters = {
+            'id': lambda row: row['id'],
+            'title': lambda row: row['title'],
+            'slug': lambda row: row['slug'],
+            'excerpt': lambda row: row['excerpt'],
+            'body': lambda row: row['body'],
+            'author': lambda row: row['author__username'],
+            'created_at': lambda row: timestamp(row['created_at']),
+            'updated_at': lambda row: timestamp(row['updated_at']),
+            'category': lambda row: row['category__name'],
+            'tag': lambda row: tags.get(row['id'], []),
+            'image': lambda row: image_url(row['image']),
+            'images': lambda row: renditions_representation(row['image_renditions'], row['image'], image_url),
+        }
+        getters = [(name, getters[name]) for name in self.fields]
+        return [{name: get(row) for name, get in getters} for row in rows]
+
+
+class PostImportSerializer(serializers.Serializer):
+    """
+    One row of a bulk import (`api.importer`), in the shape the export writes:
+    `author` is a username, `category` and `tag` are names. Rows with a `slug`
+    update the post that has it (see `api.importer.kept_fields` for what they
+    leave alone); the others are new posts. Other keys (`id`, `excerpt`, ...)
+    are ignored.
+    """
+    slug = serializers.SlugField(max_length=300, required=False)
+    title = serializers.CharField(max_length=250)
+    body = serializers.CharField(trim_whitespace=False)
+    author = serializers.CharField(max_length=150, required=False, allow_null=True)
+    created_at = serializers.DateTimeField(required=False)
+    category = serializers.CharField(max_length=100, required=False, allow_null=True, allow_blank=True)
+    tag = serializers.ListField(child=serializers.CharField(max_length=100), required=False, max_length=50)
+
+    def validate_category(self, value):
+        if value and not slugify(value):
+            raise serializers.ValidationError('Needs a letter or a digit.')
+        return value or None
+
+    def validate_tag(self, value):
+        if not all(slugify(name) for name in value):
+            raise serializers.ValidationError('Each tag needs a letter or a digit.')
+        return list(dict.fromkeys(value))
@@ -0,0 +1,221 @@
+from collections import Counter
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import archive, cache, images, postcache, related, search
+from .suggest import suggester
+from .instrumentation import install_query_timer
+from .models import ArchiveCount, Category, Tag, Post, PostTombstone, RelatedPost, refresh_tag_slugs, touch_posts
+
+
+connection_created.connect(install_query_timer)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Tag)
+@receiver(m2m_changed, sender=Post.tags.through)
+def content_changed(sender, using="default", **kwargs):
+    # any write to posts/categories/tags invalidates every cached API response,
+    # once it commits: a bump before then lets a reader cache the old rows under the new version
+    transaction.on_commit(cache.bump_content_version, using=using)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+def suggest_saved(sender, instance, raw=False, using="default", **kwargs):
+    # the in-memory index can't roll back, so it changes once the write is committed
+    if not raw:
+        transaction.on_commit(partial(suggester.update, instance), using=using)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Tag)
+def suggest_deleted(sender, instance, using="default", **kwargs):
+    transaction.on_commit(partial(suggester.remove, instance, instance.pk), using=using)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, using="default", **kwargs):
+    if raw:
+        return
+    if created:
+        # ids are AUTOINCREMENT and never reused, but a post saved with an explicit id can revive a deleted one
+        PostTombstone.objects.using(using).filter(post_id=instance.pk).delete()
+    search.index_posts([instance.pk], alias=using)
+    images.schedule_renditions(instance)
+    postcache.invalidate([instance.pk], using=using)
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, using="default", update_fields=None, **kwargs):
+    # the archive count moves with the post's month and category; note what they were
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not {"created_at", "category", "category_id"} & set(update_fields):
+        return
+    instance._archived_as = (
+        Post.objects.using(using).filter(pk=instance.pk).values_list("created_at", "category_id").first()
+    )
+
+
+@receiver(post_save, sender=Post)
+def post_archived(sender, instance, created, raw=False, using="default", **kwargs):
+    before = instance.__dict__.pop("_archived_as", None)
+    if raw or not (created or before):
+        return
+    changes = Counter({(archive.month_of(instance.created_at), instance.category_id): 1})
+    if before:
+        changes[archive.month_of(before[0]), before[1]] -= 1
+    archive.add_counts(changes, using=using)
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, using="default", **kwargs):
+    # its rows in other posts' related lists cascade away; those lists get refilled
+    instance._related_to = list(
+        RelatedPost.objects.using(using).filter(related=instance).values_list("post_id", flat=True)
+    )
+    # the month and category stored, which a stale instance (its category since deleted) may not hold
+    instance._archived_as = (
+        Post.objects.using(using).filter(pk=instance.pk).values_list("created_at", "category_id").first()
+    )
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, using="default", **kwargs):
+    search.remove_posts([instance.pk], alias=using)
+    PostTombstone.objects.using(using).update_or_create(post_id=instance.pk, defaults={"deleted_at": timezone.now()})
+    postcache.invalidate([instance.pk], using=using)
+    related.schedule(refresh=getattr(instance, "_related_to", []), using=using)
+    archived_as = instance.__dict__.pop("_archived_as", None)
+    if archived_as:
+        archive.add_counts({(archive.month_of(archived_as[0]), archived_as[1]): -1}, using=using)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_changed(sender, instance, action, reverse, pk_set, using="default", **kwargs):
+    if reverse:
+        # tag.posts.add(...) / tag.posts.clear(): pk_set holds post ids
+        if action == "pre_clear":
+            instance._cleared_post_ids = list(instance.posts.values_list("id", flat=True))
+            return
+        if action == "post_clear":
+            post_ids = getattr(instance, "_cleared_post_ids", [])
+        elif action in ("post_add", "post_remove"):
+            post_ids = pk_set or []
+        else:
+            return
+    else:
+        if action not in ("post_add", "post_remove", "post_clear"):
+            return
+        post_ids = [instance.pk]
+    refresh_tag_slugs(post_ids, using=using)
+    search.index_posts(post_ids, alias=using)
+    postcache.invalidate(post_ids, using=using)
+    related.schedule(update=post_ids, using=using)
+
+
+# the fields of a category, tag or author that its posts' documents and API output carry
+RENAME_FIELDS = {Category: ("name",), Tag: ("name", "slug"), get_user_model(): ("username",)}
+
+
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=Tag)
+@receiver(pre_save, sender=get_user_model())
+def renaming(sender, instance, raw=False, using="default", update_fields=None, **kwargs):
+    # saves that leave those fields alone (a password change, a login) mustn't touch every post
+    fields = RENAME_FIELDS[sender]
+    if raw or instance.pk is None or (update_fields is not None and not set(fields) & set(update_fields)):
+        return
+    stored = sender._default_manager.using(using).filter(pk=instance.pk).values_list(*fields).first()
+    instance._renamed = stored is not None and stored != tuple(getattr(instance, name) for name in fields)
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, raw=False, using="default", **kwargs):
+    # a rename changes the indexed document of every post in the category
+    if raw or created or not instance.__dict__.pop("_renamed", False):
+        return
+    post_ids = list(instance.posts.values_list("id", flat=True))
+    touch_posts(instance.posts.all())
+    search.index_posts(post_ids, alias=using)
+    postcache.invalidate(post_ids, using=using)
+
+
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=get_user_model())
+def posts_detaching(sender, instance, using="default", **kwargs):
+    # deleting a category or author nulls the posts' FK with a bulk update
+    post_ids = instance._detached_post_ids = list(instance.posts.values_list("id", flat=True))
+    if post_ids and sender is not Category:
+        # content_changed doesn't hear about users; their posts' author goes null
+        transaction.on_commit(cache.bump_content_version, using=using)
+    postcache.invalidate(post_ids, using=using)
+    touch_posts(instance.posts.all())
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=get_user_model())
+def posts_detached(sender, instance, using="default", **kwargs):
+    # the FK is null by now; drop the old name from the posts' indexed documents
+    search.index_posts(getattr(instance, "_detached_post_ids", []), alias=using)
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, using="default", **kwargs):
+    # its archive rows cascade away and its posts become uncategorized
+    instance._archive_months = list(
+        ArchiveCount.objects.using(using).filter(category=instance).values_list("month", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, using="default", **kwargs):
+    archive.refresh_months(getattr(instance, "_archive_months", []), using=using)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, raw=False, using="default", **kwargs):
+    if raw or created or not instance.__dict__.pop("_renamed", False):
+        return
+    post_ids = list(instance.posts.values_list("id", flat=True))
+    refresh_tag_slugs(post_ids, using=using)
+    search.index_posts(post_ids, alias=using)
+    postcache.invalidate(post_ids, using=using)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, using="default", **kwargs):
+    # the M2M rows go with the tag without an m2m_changed signal
+    instance._deleted_post_ids = list(instance.posts.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, using="default", **kwargs):
+    post_ids = getattr(instance, "_deleted_post_ids", [])
+    refresh_tag_slugs(post_ids, using=using)
+    search.index_posts(post_ids, alias=using)
+    postcache.invalidate(post_ids, using=using)
+
+
+@receiver(post_save, sender=get_user_model())
+def author_saved(sender, instance, created, raw=False, using="default", **kwargs):
+    if raw or created or not instance.__dict__.pop("_renamed", False):
+        return
+    transaction.on_commit(cache.bump_content_version, using=using)
+    post_ids = list(instance.posts.values_list("id", flat=True))
+    touch_posts(instance.posts.all())
+    search.index_posts(post_ids, alias=using)
+    postcache.invalidate(post_ids, using=using)
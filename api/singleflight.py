@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+# In-process single flight: the first caller for a key does the work, callers
+# arriving while it runs wait for its result instead of repeating it. Waiters
+# can be threads (WSGI/threaded workers) or coroutines (ASGI) alike.
+
+
+class Flight:
+    def __init__(self):
+        self.result = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._futures = []
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def finish(self, result):
+        with self._lock:
+            self.result = result
+            self._done.set()
+            futures, self._futures = self._futures, []
+        for future in futures:
+            future.get_loop().call_soon_threadsafe(_resolve, future)
+
+    def wait(self, timeout):
+        """The leader's result, or None if it failed or took longer than `timeout`."""
+        self._done.wait(timeout)
+        return self.result
+
+    async def await_result(self, timeout):
+        with self._lock:
+            if self._done.is_set():
+                return self.result
+            future = asyncio.get_running_loop().create_future()
+            self._futures.append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.result
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def join(self, key):
+        """(flight, True) for the caller that should do the work, (flight, False) for waiters."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def finish(self, key, flight, result):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.finish(result)
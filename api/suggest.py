@@ -0,0 +1,194 @@
+import logging
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right, insort
+
+from django.conf import settings
+from django.db import connections
+
+from .models import Category, Post, Tag
+
+# Typeahead suggestions (`/api/suggest/?q=`) from an in-process prefix index.
+#
+# Every word of a post title, tag name or category name starts a key (the
+# normalized text from that word on, cut to SUGGEST_KEY_LENGTH characters),
+# kept in one sorted list per kind. A query is a bisect to the first key with
+# its prefix plus a short scan, so it never touches the database.
+#
+# The index is built on first use, from the SUGGEST_MAX_POSTS newest posts and
+# every tag and category, and kept current by the save/delete signals in
+# api.signals. Those only reach the process that made the write, so each
+# process also rebuilds its index in the background every SUGGEST_REFRESH
+# seconds to pick up the others'.
+
+logger = logging.getLogger(__name__)
+
+KINDS = {"category": (Category, "name"), "tag": (Tag, "name"), "post": (Post, "title")}
+MAX_WORDS = 12   # keys per title; later words rarely start a search
+
+
+def normalize(text):
+    """Lowercased, accents stripped, whitespace collapsed."""
+    text = "".join(char for char in unicodedata.normalize("NFKD", text) if not unicodedata.combining(char))
+    return " ".join(text.casefold().split())
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.key_length = getattr(settings, "SUGGEST_KEY_LENGTH", 32)
+        self.max_posts = getattr(settings, "SUGGEST_MAX_POSTS", 100_000)
+        # per kind, sorted keys and the id each one belongs to; parallel arrays
+        # rather than (key, id) tuples take about half the memory
+        self.keys = {kind: [] for kind in KINDS}
+        self.ids = {kind: array("q") for kind in KINDS}
+        self.items = {kind: {} for kind in KINDS}     # id -> (label, slug)
+        self.post_ids = []                            # sorted, to drop the oldest past max_posts
+        self.built_at = time.monotonic()
+
+    def make_keys(self, label):
+        words = normalize(label).split(" ")[:MAX_WORDS]
+        return {" ".join(words[n:])[:self.key_length] for n in range(len(words)) if words[n]}
+
+    def add(self, kind, item_id, label, slug):
+        if item_id in self.items[kind]:
+            self.remove(kind, item_id)
+        self.items[kind][item_id] = (label, slug)
+        keys, ids = self.keys[kind], self.ids[kind]
+        for key in self.make_keys(label):
+            position = bisect_right(keys, key)
+            keys.insert(position, key)
+            ids.insert(position, item_id)
+        if kind == "post":
+            insort(self.post_ids, item_id)
+            if len(self.post_ids) > self.max_posts:
+                self.remove("post", self.post_ids[0])
+
+    def remove(self, kind, item_id):
+        item = self.items[kind].pop(item_id, None)
+        if item is None:
+            return
+        keys, ids = self.keys[kind], self.ids[kind]
+        for key in self.make_keys(item[0]):
+            position = bisect_left(keys, key)
+            while position < len(keys) and keys[position] == key:
+                if ids[position] == item_id:
+                    del keys[position], ids[position]
+                    break
+                position += 1
+        if kind == "post":
+            del self.post_ids[bisect_left(self.post_ids, item_id)]
+
+    def search(self, kind, query, limit):
+        """Up to `limit` (id, label, slug) whose label has a word starting with `query`."""
+        keys, ids, items = self.keys[kind], self.ids[kind], self.items[kind]
+        prefix = query[:self.key_length]
+        found = {}
+        position = bisect_left(keys, prefix)
+        while position < len(keys) and len(found) < limit and keys[position].startswith(prefix):
+            item_id = ids[position]
+            position += 1
+            if item_id in found:
+                continue
+            label, slug = items[item_id]
+            # keys are cut short; a longer query is checked against the label itself
+            if len(query) > self.key_length and " " + query not in " " + normalize(label):
+                continue
+            found[item_id] = (item_id, label, slug)
+        return list(found.values())
+
+    @classmethod
+    def build(cls, using="default"):
+        index = cls()
+        for kind, (model, field) in KINDS.items():
+            rows = model.objects.using(using).order_by("-id").values_list("id", field, "slug")
+            if kind == "post":
+                rows = rows[:index.max_posts]
+            entries = []
+            for item_id, label, slug in rows:
+                index.items[kind][item_id] = (label, slug)
+                entries.extend((key, item_id) for key in index.make_keys(label))
+            entries.sort()
+            index.keys[kind] = [key for key, _ in entries]
+            index.ids[kind] = array("q", (item_id for _, item_id in entries))
+        index.post_ids = sorted(index.items["post"])
+        return index
+
+
+class Suggester:
+    """The process's PrefixIndex: built on first use, refreshed in the background."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._refreshing = False
+
+    def get_index(self):
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = PrefixIndex.build()
+                return self._index
+        refresh = getattr(settings, "SUGGEST_REFRESH", 300)
+        if refresh and time.monotonic() - index.built_at > refresh and not self._refreshing:
+            self._refreshing = True
+            threading.Thread(target=self.refresh, name="suggest-index", daemon=True).start()
+        return index
+
+    def refresh(self):
+        try:
+            index = PrefixIndex.build()
+            with self._lock:
+                self._index = index
+        except Exception:
+            logger.exception("Rebuilding the suggest index failed")
+        finally:
+            self._refreshing = False
+            connections.close_all()
+
+    def clear(self):
+        """Drop the index; the next query builds a fresh one."""
+        with self._lock:
+            self._index = None
+
+    def suggest(self, query, limit):
+        query = normalize(query)
+        if not query:
+            return {"categories": [], "tags": [], "posts": []}
+        index = self.get_index()
+        with self._lock:
+            categories = index.search("category", query, limit)
+            tags = index.search("tag", query, limit)
+            posts = index.search("post", query, limit)
+        return {
+            "categories": [{"id": item_id, "name": name, "slug": slug} for item_id, name, slug in categories],
+            "tags": [{"id": item_id, "name": name, "slug": slug} for item_id, name, slug in tags],
+            "posts": [{"id": item_id, "title": title, "slug": slug} for item_id, title, slug in posts],
+        }
+
+    def update(self, instance):
+        """Add or re-add a saved post, tag or category."""
+        # before the first query there is nothing to keep current
+        if self._index is None:
+            return
+        kind, field = kind_of(instance)
+        with self._lock:
+            self._index.add(kind, instance.pk, getattr(instance, field), instance.slug)
+
+    def remove(self, instance, pk):
+        if self._index is None:
+            return
+        with self._lock:
+            self._index.remove(kind_of(instance)[0], pk)
+
+
+def kind_of(instance):
+    for kind, (model, field) in KINDS.items():
+        if isinstance(instance, model):
+            return kind, field
+    raise TypeError("No suggestions for %r" % instance)
+
+
+suggester = Suggester()
@@ -1,3 +1,1232 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import OperationalError, connection, connections
+from django.utils import timezone
+from django.test import AsyncRequestFactory, Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+
+from core.db_router import PIN_COOKIE, pool as replica_pool
+
+from .models import ArchiveCount, Category, Tag, Post, PostStats, RelatedPost
+from . import archive, related
+from .counters import flush_counts, view_counter
+from .suggest import suggester
+from .related import rebuild as rebuild_related
+from .renderers import FastJSONRenderer
+from .serializers import PostListSerializer, PostListFastSerializer
+from .cache import flights, get_content_version, stats as cache_stats
+from .instrumentation import metrics
+from .async_views import AsyncViewSetView
+from .views import FastListMixin, PostReadOnlyViewSet
+from .importer import import_posts
+from .export import parse_since
+from .search import reset_search_backends
+
+
+class PostListFastSerializerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = get_user_model().objects.create_user(username="ålice", password="x")
+        category = Category.objects.create(name="Technology")
+        tags = [Tag.objects.create(name=name) for name in ("python", "django", "naïve")]
+
+        first = Post.objects.create(
+            title="Unicode   \"quotes\" and ✓", body="line one\nline two \ttab",
+            author=author, category=category, image="post_images/a photo é.jpg",
+        )
+        first.tags.add(tags[2], tags[0], tags[1])
+        Post.objects.filter(pk=first.pk).update(image_renditions={
+            "source": "post_images/a photo é.jpg", "width": 800, "height": 600,
+            "default": [[320, "post_images/a photo é.w320.jpg"]],
+            "webp": [[320, "post_images/a photo é.w320.webp"], [800, "post_images/a photo é.w800.webp"]],
+        })
+        second = Post.objects.create(title="No relations", body="")
+        third = Post.objects.create(title="Same instant", body="x", author=author, category=category)
+        third.tags.add(tags[1])
+        Post.objects.filter(pk__in=[second.pk, third.pk]).update(
+            created_at=datetime(2025, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fast_path_emits_identical_json(self):
+        request = APIRequestFactory().get("/api/posts/")
+        queryset = PostReadOnlyViewSet.queryset.order_by("-created_at", "-id")
+
+        slow = PostListSerializer(queryset, many=True, context={"request": request}).data
+        fast = PostListFastSerializer(
+            queryset.prefetch_related(None).values(*PostListFastSerializer.value_fields),
+            context={"request": request},
+        ).data
+
+        self.assertEqual(JSONRenderer().render(slow), FastJSONRenderer().render(fast))
+        self.assertEqual(JSONRenderer().render(slow), JSONRenderer().render(fast))
+
+    def test_list_endpoint_matches_model_serializer(self):
+        client = APIClient()
+        fast = client.get("/api/posts/", {"ordering": "author__username"})
+        cache.clear()
+        with mock.patch.object(PostReadOnlyViewSet, "fast_serializer_class", None):
+            slow = client.get("/api/posts/", {"ordering": "author__username"})
+
+        self.assertEqual(fast.status_code, 200)
+        self.assertEqual(fast.content, slow.content)
+
+
+class PostExportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Technology")
+        self.posts = [Post.objects.create(title=f"Post {n}", body="x", category=self.category) for n in range(3)]
+
+    def export(self, **params):
+        response = self.client.get("/api/posts/export/", params)
+        self.assertEqual(response.status_code, 200)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        return response["X-Changes-Until"], [json.loads(line) for line in lines]
+
+    @override_settings(EXPORT_COMMIT_MARGIN=0)
+    def test_full_export_then_changes_since(self):
+        until, records = self.export(fields="id,title")
+        self.assertEqual(records, [{"id": post.pk, "title": post.title} for post in self.posts])
+
+        self.posts[0].title = "Renamed"
+        self.posts[0].save(update_fields=["title"])
+        self.posts[1].tags.add(Tag.objects.create(name="python"))
+        deleted = self.posts[2].pk
+        self.posts[2].delete()
+
+        _, records = self.export(since=until, fields="id,title,tag")
+        self.assertEqual([record["id"] for record in records], [self.posts[0].pk, self.posts[1].pk, deleted])
+        self.assertEqual(records[0]["title"], "Renamed")
+        self.assertEqual(records[1]["tag"], ["python"])
+        self.assertTrue(records[2]["deleted"])
+
+    @override_settings(EXPORT_COMMIT_MARGIN=0.5)
+    def test_until_trails_by_the_commit_margin(self):
+        start = timezone.now()
+        until, _ = self.export(fields="id")
+        self.assertLess(parse_since(until), timezone.now() - timedelta(seconds=0.5))
+        # stamped before the export began, committed after it had read
+        Post.objects.filter(pk=self.posts[0].pk).update(updated_at=start - timedelta(seconds=0.25))
+        time.sleep(0.5)
+        _, records = self.export(since=until, fields="id")
+        self.assertIn({"id": self.posts[0].pk}, records)
+
+    @override_settings(EXPORT_COMMIT_MARGIN=0)
+    def test_category_rename_is_a_change(self):
+        until, _ = self.export()
+        self.category.name = "Tech"
+        self.category.save()
+        _, records = self.export(since=until, fields="id,category")
+        self.assertEqual([record["category"] for record in records], ["Tech"] * 3)
+
+    def test_csv_and_bad_since(self):
+        response = self.client.get("/api/posts/export.csv", {"fields": "id,title"})
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(rows[0], "id,title")
+        self.assertEqual(len(rows), 4)
+
+        response = self.client.get("/api/posts/export/", {"since": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("since", response.json())
+
+
+@override_settings(RELATED_POSTS_LIMIT=2, RELATED_UPDATES_SYNC=True)
+class RelatedPostsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        news, sport = Category.objects.create(name="News"), Category.objects.create(name="Sport")
+        self.tags = {name: Tag.objects.create(name=name) for name in ("python", "django", "ai", "music")}
+        start = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+        self.posts = {}
+        for title, category, days, tags in [
+            ("a", news, 0, "python django ai"),
+            ("b", news, 10, "python django"),
+            ("c", sport, 20, "python django"),
+            ("d", news, 5, "music"),
+        ]:
+            post = Post.objects.create(title=title, body="x", category=category)
+            Post.objects.filter(pk=post.pk).update(created_at=start + timedelta(days=days))
+            with self.captureOnCommitCallbacks(execute=True):
+                post.tags.set([self.tags[name] for name in tags.split()])
+            self.posts[title] = post
+
+    def related(self, title):
+        response = self.client.get(f"/api/posts/{self.posts[title].pk}/related/", {"fields": "title"})
+        self.assertEqual(response.status_code, 200)
+        return [result["title"] for result in response.json()["results"]]
+
+    def stored(self):
+        return list(RelatedPost.objects.order_by("post_id", "-score", "related_id").values_list("post_id", "related_id"))
+
+    def test_related_posts_best_first(self):
+        self.assertEqual(self.related("a"), ["b", "c"])   # b shares a's category
+        self.assertEqual(self.related("c"), ["b", "a"])   # and is closer in time
+        self.assertEqual(self.related("d"), [])
+        self.assertEqual(self.client.get("/api/posts/0/related/").status_code, 404)
+
+    def test_tag_changes_update_other_posts_lists(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts["d"].tags.set([self.tags["python"], self.tags["django"], self.tags["ai"]])
+        self.assertEqual(self.related("d"), ["a", "b"])
+        self.assertEqual(self.related("a"), ["d", "b"])   # c pushed out
+        self.assertEqual(self.related("c"), ["b", "d"])
+        incremental = self.stored()
+        rebuild_related()
+        self.assertEqual(self.stored(), incremental)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts["d"].tags.clear()
+        self.assertEqual(self.related("a"), ["b", "c"])   # refilled
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts["b"].delete()
+        self.assertEqual(self.related("a"), ["c"])
+        self.assertEqual(self.related("c"), ["a"])
+
+    @override_settings(RELATED_UPDATES_SYNC=False)
+    def test_updates_run_after_commit_in_one_batch(self):
+        with mock.patch("api.related.get_executor") as executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.posts["d"].tags.set([self.tags["python"], self.tags["django"], self.tags["ai"]])
+                self.tags["music"].posts.add(self.posts["a"], self.posts["b"])
+                self.assertFalse(executor.called)
+            executor.return_value.submit.assert_called_once()
+        self.assertEqual(self.related("d"), [])
+        cache.delete(related.WEIGHTS_KEY % "default")
+        with mock.patch("api.related.tag_weights", wraps=related.tag_weights) as weights:
+            related.run_pending()
+        weights.assert_called_once()
+        incremental = self.stored()
+        rebuild_related()
+        self.assertEqual(self.stored(), incremental)
+
+
+    @override_settings(RELATED_UPDATES_SYNC=False)
+    def test_background_updates_invalidate_cached_lists(self):
+        self.assertEqual(self.related("a"), ["b", "c"])
+        with mock.patch("api.related.get_executor"):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.posts["d"].tags.set([self.tags["python"], self.tags["django"], self.tags["ai"]])
+        # read between the commit and the background run: the old list, cached again
+        self.assertEqual(self.related("a"), ["b", "c"])
+        related.run_pending()
+        self.assertEqual(self.related("a"), ["d", "b"])
+
+@override_settings(VIEW_FLUSH_INTERVAL=0)
+class ViewCountTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.posts = [Post.objects.create(title=f"Post {n}", body="x") for n in range(3)]
+
+    def tearDown(self):
+        view_counter.take()
+
+    def test_views_are_counted_in_memory_then_flushed(self):
+        for _ in range(3):   # the second and third come from the response cache
+            self.assertEqual(self.client.get(f"/api/posts/{self.posts[0].pk}/").status_code, 200)
+        self.client.get(f"/api/posts/{self.posts[1].pk}/")
+        self.client.get("/api/posts/0/")
+        self.assertFalse(PostStats.objects.exists())
+
+        view_counter.flush()
+        self.assertEqual(dict(PostStats.objects.values_list("post_id", "views")), {self.posts[0].pk: 3, self.posts[1].pk: 1})
+        view_counter.record(self.posts[1].pk)
+        view_counter.flush()
+        self.assertEqual(PostStats.objects.get(post_id=self.posts[1].pk).views, 2)
+
+    def test_flush_thread_survives_errors(self):
+        class Stop(BaseException):
+            pass
+
+        flush = mock.Mock(side_effect=[ValueError("boom"), None, Stop])
+        with mock.patch.object(view_counter, "flush", flush), mock.patch("api.counters.time.sleep"), \
+                self.assertLogs("api.counters", "ERROR") as logs, self.assertRaises(Stop):
+            view_counter.run(1)
+        self.assertEqual(flush.call_count, 3)
+        self.assertIn("ValueError: boom", logs.output[0])
+
+    def test_trending_favours_recent_views(self):
+        old, recent, unseen = self.posts
+        with mock.patch("api.counters.timezone.now", return_value=datetime(2025, 6, 1, tzinfo=dt_timezone.utc)):
+            flush_counts({old.pk: 8})
+        with mock.patch("api.counters.timezone.now", return_value=datetime(2025, 6, 4, tzinfo=dt_timezone.utc)):
+            flush_counts({recent.pk: 2})
+            # 8 views three half-lives ago count as one now
+            response = self.client.get("/api/posts/trending/", {"fields": "id"})
+        self.assertEqual(response.json()["results"], [
+            {"id": recent.pk, "views": 2, "trending": 2.0},
+            {"id": old.pk, "views": 8, "trending": 1.0},
+        ])
+        response = self.client.get("/api/posts/trending/", {"fields": "id", "by": "views"})
+        self.assertEqual([result["id"] for result in response.json()["results"]], [old.pk, recent.pk])
+
+
+class SeedPostsTests(TestCase):
+
+    def seed(self, **options):
+        call_command("seed_posts", seed=1, stdout=io.StringIO(), **options)
+
+    def test_seeded_posts_keep_their_generated_dates(self):
+        start = timezone.now()
+        self.seed(posts=20)
+        dates = list(Post.objects.values_list("created_at", flat=True))
+        self.assertGreater(len(set(dates)), 1)
+        self.assertLess(min(dates), start - timedelta(days=1))
+        self.assertEqual(
+            {(month, category_id): n for month, category_id, n in ArchiveCount.objects.values_list("month", "category_id", "count")},
+            archive.count_all(),
+        )
+        # the model field is left alone: other writes still get "now"
+        self.assertGreaterEqual(Post.objects.create(title="Later", body="x").created_at, start)
+
+    def test_clear_after_views_were_counted(self):
+        self.seed(posts=3)
+        post_ids = list(Post.objects.values_list("id", flat=True))
+        flush_counts({post_id: 2 for post_id in post_ids})
+        rebuild_related()
+        self.seed(posts=2, clear=True)
+        # the foreign keys are checked at commit, which a TestCase never reaches
+        connection.check_constraints()
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertFalse(PostStats.objects.filter(post_id__in=post_ids).exists())
+        self.assertEqual(sum(ArchiveCount.objects.values_list("count", flat=True)), 2)
+
+
+class BenchApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Food")
+        tags = [Tag.objects.create(name=name) for name in ("soup", "bread")]
+        for n in range(25):
+            post = Post.objects.create(title=f"Benchmark post {n}", body="x", category=category)
+            post.tags.set(tags[:n % 3])
+
+    def bench(self, *args, **options):
+        stdout = io.StringIO()
+        call_command(
+            "bench_api", *args, iterations=1, warmup=0, deep_pages=2, stdout=stdout, stderr=io.StringIO(), **options
+        )
+        return stdout.getvalue()
+
+    def test_report_and_baseline(self):
+        report = json.loads(self.bench())
+        scenarios = report["scenarios"]
+        self.assertEqual(report["meta"]["posts"], 25)
+        self.assertIn("posts_cursor_p2_-created_at", scenarios)
+        self.assertIn("cursor=", scenarios["posts_cursor_p2_-created_at"]["url"])
+        self.assertEqual(scenarios["posts_list"]["queries"], 2)   # the page and its tags
+        self.assertEqual(scenarios["posts_list"]["rows"], 11 + 9)   # a page plus one, and those ten's tag links
+        self.assertGreater(scenarios["posts_detail"]["queries"], 0)
+        # the detail scenarios don't count views into the dataset
+        self.assertFalse(PostStats.objects.exists())
+        self.assertEqual(view_counter.take(), Counter())
+
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, "baseline.json")
+            scenarios["posts_list"]["queries"] = 1
+            with open(baseline, "w") as fh:
+                json.dump(report, fh)
+            with self.assertRaisesMessage(CommandError, "posts_list: queries 1 -> 2"):
+                self.bench(scenario=["posts_list"], baseline=baseline, threshold=1000)
+
+        with self.assertRaisesMessage(CommandError, "--iterations must be at least 1."):
+            call_command("bench_api", iterations=0)
+
+
+class SuggestTests(TestCase):
+
+    def setUp(self):
+        suggester.clear()
+        self.client = APIClient()
+        Category.objects.create(name="Technology")
+        Tag.objects.create(name="python")
+        self.post = Post.objects.create(title="Python tips for Django", body="x")
+
+    def suggest(self, q):
+        response = self.client.get("/api/suggest/", {"q": q})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [item["name"] for item in data["categories"] + data["tags"]] + [item["title"] for item in data["posts"]]
+
+    def test_prefixes_of_any_word(self):
+        self.assertEqual(self.suggest("PY"), ["python", "Python tips for Django"])
+        self.assertEqual(self.suggest("tech"), ["Technology"])
+        self.assertEqual(self.suggest("for dj"), ["Python tips for Django"])
+        self.assertEqual(self.suggest("django tips"), [])
+        self.assertEqual(self.suggest(""), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.suggest("x")   # builds the index
+        with self.assertNumQueries(0):
+            self.suggest("py")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.title = "Rust tips"
+            self.post.save()
+            Tag.objects.create(name="pytest")
+        self.assertEqual(self.suggest("py"), ["pytest", "python"])
+        self.assertEqual(self.suggest("rus"), ["Rust tips"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.delete()
+        self.assertEqual(self.suggest("tips"), [])
+
+
+class BulkImportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.admin = get_user_model().objects.create_superuser(username="admin", password="x")
+        Tag.objects.create(name="Python")
+
+    def test_export_reimports_as_updates(self):
+        author = get_user_model().objects.create_user(username="writer", password="x")
+        first = Post.objects.create(title="First", body="one", author=author, category=Category.objects.create(name="Tech"))
+        first.tags.add(Tag.objects.get(name="Python"))
+        Post.objects.create(title="Second", body="two")
+        Post.objects.filter(pk=first.pk).update(created_at=datetime(2024, 1, 2, tzinfo=dt_timezone.utc))
+        before = list(Post.objects.order_by("id").values_list("id", "slug", "author", "category", "created_at", "tag_slugs"))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "posts.ndjson")
+            call_command("export_posts", output=path, stdout=io.StringIO())
+            stdout = io.StringIO()
+            call_command("import_posts", path, stdout=stdout)
+        self.assertIn("Done: 0 created, 2 updated, 0 skipped", stdout.getvalue())
+        after = list(Post.objects.order_by("id").values_list("id", "slug", "author", "category", "created_at", "tag_slugs"))
+        self.assertEqual(after, before)
+
+    def test_bulk_endpoint_creates_posts_with_names_resolved(self):
+        rows = [
+            {"title": "Hello world", "body": "one", "category": "Tech", "tag": ["python", "new tag"]},
+            {"title": "Hello world", "body": "two", "tag": ["new tag"], "created_at": "2024-01-02T03:04:05Z"},
+            {"title": "", "body": "three"},
+            {"title": "Bad author", "body": "four", "author": "nobody"},
+        ]
+        self.assertEqual(self.client.post("/api/posts/bulk/", rows, format="json").status_code, 403)
+        self.client.force_authenticate(self.admin)
+        response = self.client.post("/api/posts/bulk/", rows, format="json")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data["created"], data["updated"], data["errors"]), (2, 0, 2))
+        self.assertEqual([result["status"] for result in data["results"]], ["created", "created", "error", "error"])
+        self.assertEqual([data["results"][n]["slug"] for n in (0, 1)], ["hello-world", "hello-world-2"])
+        self.assertIn("title", data["results"][2]["errors"])
+        self.assertIn("author", data["results"][3]["errors"])
+
+        first, second = Post.objects.order_by("id")
+        self.assertEqual((first.author, first.category.name, first.excerpt), (self.admin, "Tech", "one"))
+        self.assertEqual(first.tag_slugs, ["new-tag", "python"])
+        self.assertEqual(sorted(first.tags.values_list("name", flat=True)), ["Python", "new tag"])
+        self.assertEqual(second.created_at, datetime(2024, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc))
+        self.assertEqual(Tag.objects.count(), 2)
+        found = self.client.get("/api/posts/", {"search": "new tag", "fields": "id"}).json()["results"]
+        self.assertEqual(sorted(result["id"] for result in found), [first.pk, second.pk])
+
+    def test_rows_with_a_slug_replace_that_post(self):
+        post = Post.objects.create(title="Old", slug="kept", body="old body")
+        post.tags.add(Tag.objects.get())
+        results = import_posts([
+            {"slug": "kept", "title": "New", "body": "new body", "tag": ["django"]},
+            {"slug": "fresh", "title": "Fresh", "body": "x"},
+            {"slug": "fresh", "title": "Twice", "body": "x"},
+        ])
+        self.assertEqual([result["status"] for result in results], ["updated", "created", "error"])
+        self.assertEqual(results[0]["id"], post.pk)
+        post.refresh_from_db()
+        self.assertEqual((post.title, post.excerpt, post.tag_slugs), ("New", "new body", ["django"]))
+        self.assertEqual(list(post.tags.values_list("name", flat=True)), ["django"])
+        self.assertGreater(post.updated_at, post.created_at)
+
+    def test_updates_keep_what_the_row_leaves_out(self):
+        writer = get_user_model().objects.create_user(username="writer")
+        tech = Category.objects.create(name="Tech")
+        post = Post.objects.create(title="Old", slug="kept", body="x", author=writer, category=tech)
+        post.tags.add(Tag.objects.get())
+
+        import_posts([{"slug": "kept", "title": "New", "body": "y"}], author=self.admin)
+        post.refresh_from_db()
+        self.assertEqual((post.title, post.author, post.category, post.tag_slugs), ("New", writer, tech, ["python"]))
+        self.assertEqual(list(post.tags.values_list("name", flat=True)), ["Python"])
+
+        # the export writes null for a post without an author
+        import_posts([{"slug": "kept", "title": "New", "body": "y", "author": None, "category": None, "tag": []}])
+        post.refresh_from_db()
+        self.assertEqual((post.author, post.category, post.tag_slugs), (writer, None, []))
+        self.assertFalse(post.tags.exists())
+        import_posts([{"slug": "kept", "title": "New", "body": "y", "author": "admin"}])
+        post.refresh_from_db()
+        self.assertEqual(post.author, self.admin)
+
+    def test_import_command_reads_ndjson(self):
+        lines = ['{"title": "From a file", "body": "x", "author": "admin"}', "", "not json", '{"body": "no title"}']
+        with mock.patch("sys.stdin", io.StringIO("\n".join(lines))):
+            stdout, stderr = io.StringIO(), io.StringIO()
+            call_command("import_posts", stdout=stdout, stderr=stderr)
+        self.assertIn("1 created, 0 updated, 2 skipped", stdout.getvalue())
+        self.assertIn("line 3: not JSON", stderr.getvalue())
+        self.assertIn("line 4: ", stderr.getvalue())
+        self.assertEqual(Post.objects.get().author, self.admin)
+
+
+@override_settings(RELATED_UPDATES_SYNC=True)
+class PostCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Tech")
+        self.posts = [Post.objects.create(title=f"Post {n}", body="x", category=self.category) for n in range(3)]
+        self.posts[0].tags.add(Tag.objects.create(name="python"))
+
+    def tearDown(self):
+        view_counter.take()
+
+    def batch(self, **params):
+        response = self.client.get("/api/posts/batch/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_slug_lookup_and_batch_from_the_cache(self):
+        first, second, third = self.posts
+        response = self.client.get(f"/api/posts/by-slug/{first.slug}/")
+        self.assertEqual(response.json(), self.client.get(f"/api/posts/{first.pk}/").json())
+        self.assertEqual(self.client.get("/api/posts/by-slug/nope/").status_code, 404)
+
+        data = self.batch(ids=f"{third.pk},0", slugs=f"{first.slug},{third.slug},nope", fields="id,tag")
+        self.assertEqual(data["results"], [{"id": third.pk, "tag": []}, {"id": first.pk, "tag": ["python"]}])
+        self.assertEqual(data["missing"], {"ids": [0], "slugs": ["nope"]})
+        with self.assertNumQueries(0):
+            self.batch(ids=third.pk, slugs=first.slug)
+        with self.assertNumQueries(2):   # rows, then tags, for the misses only
+            self.batch(ids=f"{first.pk},{second.pk}")
+        self.assertEqual(self.client.get("/api/posts/batch/", {"ids": "x"}).status_code, 400)
+
+    def test_entries_follow_writes(self):
+        post = self.posts[0]
+        self.batch(ids=post.pk, slugs=post.slug)
+        with self.captureOnCommitCallbacks(execute=True):
+            post.title, post.slug = "Renamed", "renamed"
+            post.save()
+            post.tags.add(Tag.objects.create(name="django"))
+            self.category.name = "Science"
+            self.category.save()
+        data = self.batch(slugs=f"{post.slug},post-0", fields="title,category,tag")
+        self.assertEqual(data["results"], [{"title": "Renamed", "category": "Science", "tag": ["python", "django"]}])
+        self.assertEqual(data["missing"]["slugs"], ["post-0"])
+        post_id = post.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertEqual(self.batch(ids=post_id)["missing"]["ids"], [post_id])
+
+
+class PostAdminTests(TestCase):
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(username="admin", password="x")
+        self.client.force_login(self.admin)
+        python = Tag.objects.create(name="python")
+        for n in range(3):
+            post = Post.objects.create(title=f"Post {n}", body="x", author=self.admin if n else None)
+            if n != 1:
+                post.tags.add(python)
+
+    def changelist(self, **params):
+        response = self.client.get("/admin/api/post/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.context["cl"]
+
+    def test_filters_and_search(self):
+        self.assertEqual(self.changelist(tag="python").result_count, 2)
+        self.assertEqual(self.changelist(tag="python", author="admin").result_count, 1)
+        self.assertEqual(self.changelist(q="post 1").result_count, 1)
+        self.assertContains(self.client.get("/admin/api/post/", {"tag": "python"}), 'value="python"')
+        response = self.client.get("/admin/autocomplete/", {"app_label": "api", "model_name": "post", "field_name": "tags", "term": "py"})
+        self.assertEqual(response.json()["results"], [{"id": str(Tag.objects.get().pk), "text": "python"}])
+        post = Post.objects.first()
+        self.assertEqual(self.client.get(f"/admin/api/post/{post.pk}/change/").status_code, 200)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=2)
+    def test_large_counts_are_estimated(self):
+        with mock.patch("api.admin.estimate_count", return_value=5000):
+            self.assertEqual(self.changelist().result_count, 5000)
+        # no estimate: an exact count after all
+        with mock.patch("api.admin.estimate_count", return_value=None):
+            self.assertEqual(self.changelist().result_count, 3)
+        self.assertEqual(self.changelist(tag="python").result_count, 2)
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.tech = Category.objects.create(name="Tech")
+        self.food = Category.objects.create(name="Food")
+
+    def make_post(self, title, day, category=None):
+        post = Post.objects.create(title=title, body="x", category=category)
+        post.created_at = datetime(*day, 12, tzinfo=dt_timezone.utc)   # auto_now_add: moved by a second save
+        post.save()
+        return post
+
+    def counts(self):
+        rows = ArchiveCount.objects.values_list("month", "category_id", "count")
+        return {(month, category_id): n for month, category_id, n in rows if n}
+
+    def test_counts_follow_post_writes(self):
+        first = self.make_post("One", (2025, 1, 31), self.tech)
+        second = self.make_post("Two", (2025, 1, 1), self.food)
+        self.make_post("Three", (2025, 3, 1), self.tech)
+        self.make_post("Four", (2025, 3, 2))
+        second.category = self.tech
+        second.save()
+        first.delete()
+        self.assertEqual(self.counts(), archive.count_all())
+
+        data = self.client.get("/api/archive/").json()
+        self.assertEqual(data["months"], [{"year": 2025, "month": 3, "count": 2}, {"year": 2025, "month": 1, "count": 1}])
+        self.assertEqual(data["categories"], [
+            {"slug": "tech", "name": "Tech", "count": 2}, {"slug": None, "name": None, "count": 1},
+        ])
+        self.assertEqual(len(data["months_by_category"]), 3)
+        data = self.client.get("/api/archive/", {"category": "tech"}).json()
+        self.assertEqual([month["count"] for month in data["months"]], [1, 1])
+
+        self.tech.delete()
+        self.assertEqual(self.counts(), {(date(2025, 1, 1), None): 1, (date(2025, 3, 1), None): 2})
+        # `second` still holds its deleted category; the count comes off the stored row
+        second.delete()
+        self.assertEqual(self.counts(), {(date(2025, 3, 1), None): 2})
+        connection.check_constraints()
+
+    def test_month_filter_rebuild_and_imports(self):
+        self.make_post("January", (2024, 1, 31))
+        self.make_post("February", (2024, 2, 1), self.food)
+        self.make_post("Next year", (2025, 2, 1))
+        titles = lambda **params: [post["title"] for post in self.client.get("/api/posts/", params).json()["results"]]
+        self.assertEqual(titles(year=2024, month=2), ["February"])
+        self.assertEqual(titles(year=2024), ["February", "January"])
+        self.assertEqual(self.client.get("/api/posts/", {"month": 2}).status_code, 400)
+        self.assertEqual(self.client.get("/api/posts/", {"year": 2024, "month": 13}).status_code, 400)
+
+        import_posts([
+            {"slug": "january", "title": "Moved", "body": "x", "category": "Food", "created_at": "2024-02-10T00:00:00Z"},
+        ])
+        self.assertEqual(self.counts(), archive.count_all())
+        ArchiveCount.objects.all().delete()
+        stdout = io.StringIO()
+        call_command("rebuild_archive", stdout=stdout)
+        self.assertIn("counted 3 posts", stdout.getvalue())
+        self.assertEqual(self.counts(), {
+            (date(2024, 2, 1), self.food.pk): 2, (date(2025, 2, 1), None): 1,
+        })
+
+
+class PaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [get_user_model().objects.create_user(username=name, password="x") for name in ("bo", "al")]
+        category = Category.objects.create(name="Food")
+        for i in range(25):
+            # every post shares one created_at; a third have no author, half no category
+            Post.objects.create(
+                title=f"Post {i}", body="x", author=(users + [None])[i % 3], category=category if i % 2 else None,
+            )
+        Post.objects.update(created_at=datetime(2025, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc))
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, response, link="next"):
+        """The ids of every page, following `link` from `response`."""
+        pages = [[row["id"] for row in response.json()["results"]]]
+        while response.json()[link]:
+            response = self.client.get(response.json()[link])
+            pages.append([row["id"] for row in response.json()["results"]])
+        return pages, response
+
+    def test_tied_keys_page_without_skips_or_repeats(self):
+        pages, last = self.walk(self.client.get("/api/posts/", {"fields": "id"}))
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        ids = sum(pages, [])
+        self.assertEqual(ids, sorted(Post.objects.values_list("id", flat=True), reverse=True))
+        # and back again from the last page
+        backwards, _ = self.walk(last, "previous")
+        self.assertEqual(sum(reversed(backwards), []), ids)
+
+    def test_nullable_sort_keys(self):
+        posts = Post.objects.select_related("author")
+        for ordering, nulls_first in (("author__username", False), ("-author__username", True)):
+            with self.subTest(ordering=ordering):
+                pages, _ = self.walk(self.client.get("/api/posts/", {"fields": "id", "ordering": ordering}))
+                ids = sum(pages, [])
+                named = sorted(
+                    (post for post in posts if post.author), key=lambda post: (post.author.username, post.id),
+                    reverse=nulls_first,
+                )
+                unnamed = sorted((post for post in posts if not post.author), key=lambda post: post.id, reverse=nulls_first)
+                expected = unnamed + named if nulls_first else named + unnamed
+                self.assertEqual(ids, [post.id for post in expected])
+
+
+class SparseFieldsetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(title="Sparse", body="A long body.", category=Category.objects.create(name="C"))
+
+    def tearDown(self):
+        view_counter.take()
+
+    def test_fields_pick_keys_and_columns(self):
+        for url in ("/api/posts/", f"/api/posts/{self.post.pk}/"):
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {"fields": "title, id,excerpt"})
+                data = response.json()
+                # keys come back in the serializer's order, and unrequested columns aren't read
+                row = data["results"][0] if "results" in data else data
+                self.assertEqual(list(row.items()), [("id", self.post.pk), ("title", "Sparse"), ("excerpt", "A long body.")])
+                sql = " ".join(query["sql"] for query in queries)
+                self.assertNotIn('"body"', sql)
+                self.assertNotIn("api_category", sql)
+
+    def test_unknown_fields_are_rejected(self):
+        for url in ("/api/posts/", f"/api/posts/{self.post.pk}/"):
+            with self.subTest(url=url):
+                response = self.client.get(url, {"fields": "id,bogus,nope"})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {"fields": ["Unknown field(s): bogus, nope"]})
+
+
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        Post.objects.create(title="Timed", body="x")
+
+    def test_server_timing_and_metrics(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/posts/")
+        count = len(queries)   # read now: the next request resets the connection's query log
+        self.assertGreater(count, 0)
+        timing = dict(entry.split(";", 1) for entry in response["Server-Timing"].split(", "))
+        self.assertRegex(timing["db"], r'^dur=[0-9.]+;desc="%d queries"$' % count)
+        self.assertEqual(list(timing)[0], "db")
+        self.assertEqual(list(timing)[-1], "total")
+
+        self.assertEqual(self.client.get("/api/_metrics").status_code, 403)
+        staff = get_user_model().objects.create_user(username="ops", password="x", is_staff=True)
+        self.client.force_login(staff)
+        body = self.client.get("/api/_metrics").content.decode()
+        self.assertIn('api_request_duration_seconds_count{route="post-list",method="GET",status="2xx"} 1\n', body)
+        self.assertIn('api_request_duration_seconds_bucket{route="metrics",method="GET",status="4xx",le="+Inf"} 1\n', body)
+        self.assertIn('api_db_queries_total{route="post-list",method="GET",status="2xx"} %d\n' % count, body)
+        self.assertIn("api_response_cache_misses_total %d\n" % cache_stats.as_dict()["misses"], body)
+
+
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        author = get_user_model().objects.create_user(username="ana", password="x")
+        category = Category.objects.create(name="Food")
+        tag = Tag.objects.create(name="soup")
+        self.posts = [
+            Post.objects.create(title=f"Post {n}", body="x", author=author, category=category) for n in range(12)
+        ]
+        self.posts[0].tags.add(tag)
+
+    def tearDown(self):
+        view_counter.take()
+
+    async def get(self, path, params=None, **kwargs):
+        # the async routes are only mounted under API_ASYNC_VIEWS, so call the view itself
+        await sync_to_async(cache.clear)()
+        view = AsyncViewSetView.as_view(viewset_class=PostReadOnlyViewSet)
+        response = await view(AsyncRequestFactory().get(path, params), **kwargs)
+        # cached entries come back as plain HttpResponses
+        return response.render() if hasattr(response, "render") else response
+
+    async def test_alist_and_aretrieve_answer_like_the_sync_views(self):
+        for params in ({}, {"fields": "id,title,tag", "tag": "soup"}, {"ordering": "title", "search": "post"}):
+            with self.subTest(params=params):
+                response = await self.get("/api/posts/", params)
+                self.assertEqual((response.status_code, response["X-Cache"]), (200, "MISS"))
+                await sync_to_async(cache.clear)()
+                expected = await sync_to_async(self.client.get)("/api/posts/", params)
+                self.assertEqual(json.loads(response.content), expected.json())
+
+        pk = self.posts[0].pk
+        response = await self.get(f"/api/posts/{pk}/", pk=str(pk))
+        await sync_to_async(cache.clear)()
+        expected = await sync_to_async(self.client.get)(f"/api/posts/{pk}/")
+        self.assertEqual((response.status_code, json.loads(response.content)), (200, expected.json()))
+        self.assertEqual((await self.get("/api/posts/0/", pk="0")).status_code, 404)
+        self.assertEqual((await self.get("/api/posts/", {"fields": "bogus"})).status_code, 400)
+
+
+class TagFilterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.python, self.django, self.rust = (Tag.objects.create(name=name) for name in ("python", "django", "rust"))
+        self.both = Post.objects.create(title="Both", body="x")
+        self.both.tags.add(self.python, self.django)
+        self.one = Post.objects.create(title="One", body="x")
+        self.one.tags.add(self.python)
+        self.other = Post.objects.create(title="Other", body="x")
+        self.other.tags.add(self.rust)
+        Post.objects.create(title="Untagged", body="x")
+
+    def titles(self, **params):
+        return [post["title"] for post in self.client.get("/api/posts/", {"fields": "title", **params}).json()["results"]]
+
+    def slugs(self, post):
+        post.refresh_from_db(fields=["tag_slugs"])
+        return post.tag_slugs
+
+    def test_any_and_all(self):
+        # a post carrying several of the tags is listed once
+        self.assertEqual(self.titles(tag="python,django"), ["One", "Both"])
+        self.assertEqual(self.titles(tag=" Python , django,", tag_mode="any"), ["One", "Both"])
+        self.assertEqual(self.titles(tag="python,django", tag_mode="all"), ["Both"])
+        self.assertEqual(self.titles(tag="python,rust", tag_mode="all"), [])
+        self.assertEqual(self.titles(tag="python,missing"), ["One", "Both"])
+        self.assertEqual(self.titles(tag="missing", tag_mode="all"), [])
+        self.assertEqual(len(self.titles(tag=",")), 4)
+        self.assertEqual(self.client.get("/api/posts/", {"tag": "python", "tag_mode": "some"}).status_code, 400)
+
+    def test_facets_count_the_filtered_posts(self):
+        food = Category.objects.create(name="Food")
+        tech = Category.objects.create(name="Tech")
+        Post.objects.filter(pk__in=[self.both.pk, self.one.pk]).update(category=tech)
+        Post.objects.filter(pk=self.other.pk).update(category=food)
+        self.assertEqual(self.client.get("/api/posts/facets/").json(), {
+            "categories": [
+                {"slug": "tech", "name": "Tech", "count": 2}, {"slug": "food", "name": "Food", "count": 1},
+            ],
+            "tags": [
+                {"slug": "python", "name": "python", "count": 2},
+                {"slug": "django", "name": "django", "count": 1},
+                {"slug": "rust", "name": "rust", "count": 1},
+            ],
+        })
+        self.assertEqual(self.client.get("/api/posts/facets/", {"tag": "django,rust"}).json(), {
+            "categories": [
+                {"slug": "food", "name": "Food", "count": 1}, {"slug": "tech", "name": "Tech", "count": 1},
+            ],
+            "tags": [
+                {"slug": "django", "name": "django", "count": 1},
+                {"slug": "python", "name": "python", "count": 1},
+                {"slug": "rust", "name": "rust", "count": 1},
+            ],
+        })
+        self.assertEqual(self.client.get("/api/posts/facets/", {"category": "nope"}).json(), {"categories": [], "tags": []})
+
+    def test_tag_slugs_follow_tag_writes(self):
+        self.assertEqual(self.slugs(self.both), ["django", "python"])
+        self.both.tags.remove(self.python)
+        self.assertEqual(self.slugs(self.both), ["django"])
+        self.both.tags.clear()
+        self.assertEqual(self.slugs(self.both), [])
+
+        self.rust.posts.add(self.one, self.both)
+        self.assertEqual((self.slugs(self.one), self.slugs(self.both)), (["python", "rust"], ["rust"]))
+        self.rust.posts.remove(self.both)
+        self.assertEqual(self.slugs(self.both), [])
+        self.python.posts.clear()
+        self.assertEqual(self.slugs(self.one), ["rust"])
+
+        self.rust.slug = "rustlang"
+        self.rust.save()
+        self.assertEqual((self.slugs(self.one), self.slugs(self.other)), (["rustlang"], ["rustlang"]))
+        self.rust.delete()
+        self.assertEqual((self.slugs(self.one), self.slugs(self.other)), ([], []))
+
+
+@override_settings(RELATED_UPDATES_SYNC=True)
+class SearchTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = get_user_model().objects.create_user(username="carol", password="x")
+        self.category = Category.objects.create(name="Gardening")
+        self.tag = Tag.objects.create(name="compost")
+        self.titled = Post.objects.create(title="Tomato growing guide", body="Sun and water.")
+        self.mentioned = Post.objects.create(
+            title="Spring notes", body="Planted a tomato.", author=self.author, category=self.category,
+        )
+        self.mentioned.tags.add(self.tag)
+
+    def found(self, term, **params):
+        response = self.client.get("/api/posts/", {"search": term, "fields": "id", **params})
+        return [row["id"] for row in response.json()["results"]]
+
+    def edit(self):
+        # writes bump the response cache's version on commit
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def test_rank_puts_title_matches_first(self):
+        self.assertEqual(self.found("tomato", ordering="rank"), [self.titled.pk, self.mentioned.pk])
+        self.assertEqual(self.found("tomato", ordering="-rank"), [self.mentioned.pk, self.titled.pk])
+        # prefix match on the last term; FTS syntax in the input is quoted away
+        self.assertEqual(self.found("tomat"), [self.mentioned.pk, self.titled.pk])
+        self.assertEqual(self.found('guide" OR "spring'), [])
+
+    def test_index_follows_edits(self):
+        mentioned = self.mentioned.pk
+        self.assertEqual(self.found("carol"), [mentioned])
+        self.assertEqual(self.found("gardening"), [mentioned])
+        self.assertEqual(self.found("compost"), [mentioned])
+
+        with self.edit():
+            self.titled.title = "Pepper growing guide"
+            self.titled.save()
+        self.assertEqual((self.found("tomato"), self.found("pepper")), ([mentioned], [self.titled.pk]))
+
+        with self.edit():
+            self.titled.tags.add(self.tag)
+        self.assertEqual(self.found("compost"), [mentioned, self.titled.pk])
+        with self.edit():
+            self.tag.name = "mulch"
+            self.tag.save()
+        self.assertEqual((self.found("compost"), self.found("mulch")), ([], [mentioned, self.titled.pk]))
+        with self.edit():
+            self.tag.delete()
+        self.assertEqual(self.found("mulch"), [])
+
+        with self.edit():
+            self.category.name = "Allotment"
+            self.category.save()
+        self.assertEqual((self.found("gardening"), self.found("allotment")), ([], [mentioned]))
+        with self.edit():
+            self.category.delete()
+        self.assertEqual(self.found("allotment"), [])
+
+        with self.edit():
+            self.author.username = "dave"
+            self.author.save()
+        self.assertEqual((self.found("carol"), self.found("dave")), ([], [mentioned]))
+        with self.edit():
+            self.author.delete()
+        self.assertEqual(self.found("dave"), [])
+
+        with self.edit():
+            self.mentioned.delete()
+        self.assertEqual(self.found("tomato"), [])
+
+    @override_settings(POST_SEARCH_BACKEND=None)
+    def test_falls_back_to_search_fields_without_an_index(self):
+        reset_search_backends()
+        self.addCleanup(reset_search_backends)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.found("tomato"), [self.mentioned.pk, self.titled.pk])
+        self.assertNotIn("api_post_fts", " ".join(query["sql"] for query in queries))
+        self.assertIn("LIKE", " ".join(query["sql"] for query in queries))
+        self.assertEqual(self.found("carol"), [self.mentioned.pk])
+        self.assertEqual(self.found("compost"), [self.mentioned.pk])
+        self.assertEqual(self.found("tomato", ordering="rank"), [self.mentioned.pk, self.titled.pk])
+
+
+def image_file(name, width, height, fmt="PNG"):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 80, 40)).save(buffer, fmt)
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+class MediaRootMixin:
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media)
+            for root, _, names in os.walk(self.media) for name in names
+        )
+
+
+@override_settings(IMAGE_RENDITIONS_SYNC=True, IMAGE_RENDITION_WIDTHS=(320, 640, 1024))
+class ImageRenditionTests(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def tearDown(self):
+        view_counter.take()
+
+    def test_renditions_follow_the_image(self):
+        from PIL import Image
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(title="Cat", body="x", image=image_file("cat.png", 700, 350))
+        post.refresh_from_db()
+        record = post.image_renditions
+        # 1024 would be an upscale of the 700px source
+        self.assertEqual([width for width, _ in record["default"]], [320, 640])
+        self.assertEqual([width for width, _ in record["webp"]], [320, 640, 700])
+        self.assertEqual(self.files(), [
+            "post_images/cat.png",
+            "post_images/cat.w320.png", "post_images/cat.w320.webp",
+            "post_images/cat.w640.png", "post_images/cat.w640.webp",
+            "post_images/cat.w700.webp",
+        ])
+        with Image.open(os.path.join(self.media, "post_images/cat.w320.webp")) as webp:
+            self.assertEqual((webp.format, webp.size), ("WEBP", (320, 160)))
+        images = self.client.get(f"/api/posts/{post.pk}/", {"fields": "images"}).json()["images"]
+        self.assertEqual((images["width"], images["height"]), (700, 350))
+        self.assertTrue(images["webp_srcset"].endswith("/media/post_images/cat.w700.webp 700w"))
+
+        # a replacement's renditions take over and the old ones go
+        with self.captureOnCommitCallbacks(execute=True):
+            post.image = image_file("dog.jpg", 400, 400, "JPEG")
+            post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.image_renditions["source"], "post_images/dog.jpg")
+        self.assertEqual(self.files(), [
+            "post_images/cat.png",
+            "post_images/dog.jpg", "post_images/dog.w320.jpg", "post_images/dog.w320.webp", "post_images/dog.w400.webp",
+        ])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post.image = None
+            post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.image_renditions, {})
+        self.assertEqual(self.files(), ["post_images/cat.png", "post_images/dog.jpg"])
+
+
+@override_settings(IMAGE_RENDITION_WIDTHS=(100,))
+class GenerateRenditionsCommandTests(MediaRootMixin, TransactionTestCase):
+    # the command works from a thread pool, whose connections only see committed rows
+
+    def test_generates_missing_renditions(self):
+        name = Post._meta.get_field("image").storage.save("post_images/old.png", image_file("old.png", 200, 100))
+        post = Post.objects.create(title="Old", body="x")
+        Post.objects.filter(pk=post.pk).update(image=name)   # as if uploaded before renditions existed
+        stdout = io.StringIO()
+        call_command("generate_renditions", workers=1, stdout=stdout)
+        self.assertIn("Done: 1 generated, 0 failed.", stdout.getvalue())
+        post.refresh_from_db()
+        self.assertEqual(post.image_renditions["default"], [[100, "post_images/old.w100.png"]])
+        self.assertIn("post_images/old.w200.webp", self.files())
+        call_command("generate_renditions", stdout=stdout)
+        self.assertIn("Generating renditions for 0 posts", stdout.getvalue())
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(title="Cached", body="x")
+
+    def tearDown(self):
+        view_counter.take()
+
+    def test_etag_answers_if_none_match_with_304(self):
+        first = self.client.get("/api/posts/")
+        self.assertEqual((first.status_code, first["X-Cache"]), (200, "MISS"))
+        again = self.client.get("/api/posts/")
+        self.assertEqual((again["X-Cache"], again["ETag"], again.content), ("HIT", first["ETag"], first.content))
+        not_modified = self.client.get("/api/posts/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual((not_modified.status_code, not_modified.content), (304, b""))
+        self.assertEqual(self.client.get("/api/posts/", HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_writes_invalidate_once_committed(self):
+        before = self.client.get(f"/api/posts/{self.post.pk}/")
+        version = get_content_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.title = "Edited"
+            self.post.save()
+            # readers still see the old rows until the commit, so they keep the old version
+            self.assertEqual(get_content_version(), version)
+        self.assertNotEqual(get_content_version(), version)
+        after = self.client.get(f"/api/posts/{self.post.pk}/", HTTP_IF_NONE_MATCH=before["ETag"])
+        self.assertEqual((after.status_code, after["X-Cache"], after.json()["title"]), (200, "MISS", "Edited"))
+        self.assertNotEqual(after["ETag"], before["ETag"])
+
+    def test_only_renames_touch_the_posts(self):
+        author = get_user_model().objects.create_user(username="writer", password="x")
+        category, tag = Category.objects.create(name="Food"), Tag.objects.create(name="soup")
+        Post.objects.filter(pk=self.post.pk).update(author=author, category=category)
+        self.post.tags.add(tag)
+        stamp = lambda: Post.objects.values_list("updated_at", flat=True).get(pk=self.post.pk)
+        touched = stamp()
+
+        def save(instance, **changes):
+            version = get_content_version()
+            for name, value in changes.items():
+                setattr(instance, name, value)
+            with self.captureOnCommitCallbacks(execute=True):
+                instance.save()
+            return get_content_version() != version
+
+        author.set_password("changed")
+        self.assertFalse(save(author, email="w@example.com", is_staff=True))
+        category.slug = "food"
+        save(category)
+        save(tag)
+        self.assertEqual(stamp(), touched)
+
+        self.assertTrue(save(author, username="author"))
+        self.assertGreater(stamp(), touched)
+        touched = stamp()
+        save(category, name="Cooking")
+        self.assertGreater(stamp(), touched)
+        touched = stamp()
+        save(tag, slug="soups")
+        self.assertGreater(stamp(), touched)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).tag_slugs, ["soups"])
+
+    def test_deleting_an_author_invalidates(self):
+        author = get_user_model().objects.create_user(username="gone", password="x")
+        Post.objects.filter(pk=self.post.pk).update(author=author)
+        cache.clear()
+        self.assertEqual(self.client.get("/api/posts/").json()["results"][0]["author"], "gone")
+        with self.captureOnCommitCallbacks(execute=True):
+            author.delete()
+        self.assertIsNone(self.client.get("/api/posts/").json()["results"][0]["author"])
+
+
+@override_settings(
+    DATABASE_REPLICAS=["replica_test"], DATABASE_ROUTERS=["core.db_router.ReplicaRouter"], DATABASE_REPLICA_LAG=5,
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    # replica_test (core/test_settings.py) is a second connection to the primary's test
+    # database (TEST MIRROR), so it only sees committed rows: hence no TestCase
+    databases = {"default", "replica_test"}
+
+    def setUp(self):
+        cache.clear()
+        replica_pool.down_until.clear()
+        replica_pool.checked_at.clear()
+        self.post = Post.objects.create(title="Replicated", body="x")
+
+    def request(self, client, method, path, *args, **kwargs):
+        """The response, and how many queries went to the primary and to the replica."""
+        with CaptureQueriesContext(connections["default"]) as primary:
+            with CaptureQueriesContext(connections["replica_test"]) as replica:
+                response = getattr(client, method)(path, *args, **kwargs)
+        return response, len(primary), len(replica)
+
+    def test_api_reads_go_to_the_replica(self):
+        response, primary, replica = self.request(Client(), "get", "/api/posts/")
+        self.assertEqual([post["title"] for post in response.json()["results"]], ["Replicated"])
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_writers_are_pinned_to_the_primary(self):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_superuser(username="admin", password="x"))
+        rows = [{"title": "New", "body": "x"}]
+        response, primary, replica = self.request(client, "post", "/api/posts/bulk/", rows, format="json")
+        self.assertEqual((response.status_code, replica), (200, 0))
+        self.assertGreater(primary, 0)
+        self.assertEqual(response.cookies[PIN_COOKIE]["max-age"], 5)
+
+        # the client sends the cookie back: its reads see its own write
+        response, primary, replica = self.request(client, "get", "/api/posts/", {"fields": "title"})
+        self.assertEqual(len(response.json()["results"]), 2)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_down_replica_falls_back_to_the_primary(self):
+        down = mock.patch.object(connections["replica_test"], "cursor", side_effect=OperationalError("unreachable"))
+        with down, self.assertLogs("core.db_router", "WARNING"):
+            response, primary, replica = self.request(Client(), "get", "/api/posts/")
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        self.assertIn("replica_test", replica_pool.down_until)
+        # skipped without another check until DATABASE_REPLICA_RETRY has passed
+        with mock.patch.object(connections["replica_test"], "cursor") as cursor:
+            self.request(Client(), "get", "/api/posts/", {"fields": "id"})
+        cursor.assert_not_called()
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        cache_stats.reset()
+
+    def test_concurrent_identical_misses_render_once(self):
+        started, calls = threading.Event(), []
+
+        def slow_list(view, request, *args, **kwargs):
+            calls.append(request.path)
+            started.set()
+            time.sleep(0.3)
+            return Response([{"id": 1}])
+
+        responses = {}
+
+        def get(name):
+            responses[name] = Client().get("/api/posts/")
+
+        with mock.patch.object(FastListMixin, "list", slow_list):
+            leader = threading.Thread(target=get, args=("leader",))
+            leader.start()
+            started.wait(5)
+            followers = [threading.Thread(target=get, args=(n,)) for n in range(3)]
+            for thread in followers:
+                thread.start()
+            for thread in [leader, *followers]:
+                thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(responses["leader"]["X-Cache"], "MISS")
+        self.assertEqual({responses[n]["X-Cache"] for n in range(3)}, {"COALESCED"})
+        self.assertEqual({responses[n].content for n in range(3)}, {responses["leader"].content})
+        self.assertEqual(cache_stats.coalesced, 3)
+
+    def test_waiters_give_up_after_the_bound(self):
+        flight, leader = flights.join("key")
+        self.assertTrue(leader)
+        waiter, leader = flights.join("key")
+        self.assertFalse(leader)
+        started = time.monotonic()
+        self.assertIsNone(waiter.wait(0.05))
+        self.assertLess(time.monotonic() - started, 1)
+        flights.finish("key", flight, "entry")
+        self.assertEqual(waiter.wait(0), "entry")
+        again, leader = flights.join("key")
+        self.assertTrue(leader)
+        flights.finish("key", again, None)
@@ -1,21 +1,144 @@
+from asgiref.sync import sync_to_async
 from rest_framework import viewsets
-from rest_framework.permissions import AllowAny
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import AllowAny, BasePermission, IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Prefetch
+from django.http import Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from core.db_router import replica_reads
 from .models import *
 from .serializers import *
-from .filters import PostFilter
+from .filters import PostFilter, PostSearchFilter, PostOrderingFilter
 from .pagination import PostCursorPagination
+from .export import EXPORT_FIELDS, PostExport, aiterate, parse_since
+from .renderers import CSVRenderer, NDJSONRenderer
+from .cache import CachedResponseMixin, get_content_version, stats as cache_stats
+from .instrumentation import metrics
+from .search import aget_search_backend
+from .related import get_limit as get_related_limit
+from .counters import decayed_views, get_trending_limit, view_counter
+from .suggest import suggester
+from .importer import get_max_rows as get_import_max_rows, import_posts
+from .postcache import get_posts as get_cached_posts
+from .archive import get_archive
 
-class CategoryReadOnlyViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Category.objects.all().distinct()
+
+class CanImportPosts(BasePermission):
+    """A bulk import both adds and changes posts."""
+
+    def has_permission(self, request, view):
+        return request.user.has_perms(('api.add_post', 'api.change_post'))
+
+
+class ReplicaReadMixin:
+    """Runs `replica_actions` inside `replica_reads()`: their queries may go to a read replica."""
+    replica_actions = ('list', 'retrieve')
+
+    def dispatch(self, request, *args, **kwargs):
+        # `self.action` is only set once dispatch has started
+        action = self.action_map.get(request.method.lower())
+        with replica_reads(action in self.replica_actions):
+            return super().dispatch(request, *args, **kwargs)
+
+
+class AsyncReadOnlyMixin:
+    """
+    `alist`/`aretrieve`: `list`/`retrieve` on the async ORM, for the ASGI
+    routes in `api.async_views`. Everything that doesn't touch the database
+    (querysets, filters, serializers) is the viewset's own.
+    """
+
+    async def afilter_queryset(self, queryset):
+        return self.filter_queryset(queryset)
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        if hasattr(self.paginator, 'apaginate_queryset'):
+            return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+        return await sync_to_async(self.paginator.paginate_queryset)(queryset, self.request, view=self)
+
+    async def aget_object(self):
+        queryset = await self.afilter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        # same errors as DRF's get_object_or_404
+        try:
+            obj = await queryset.aget(**filter_kwargs)
+        except queryset.model.DoesNotExist:
+            raise Http404('No %s matches the given query.' % queryset.model._meta.object_name)
+        except (TypeError, ValueError, DjangoValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = await self.afilter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer([obj async for obj in queryset], many=True).data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return Response(self.get_serializer(await self.aget_object()).data)
+
+
+class FastListMixin:
+    """
+    Serves `list` through `fast_serializer_class` (a `.values()` row
+    serializer) instead of model instances and `serializer_class`.
+    """
+    fast_serializer_class = None
+
+    def get_fast_rows(self, queryset, context):
+        queryset = queryset.prefetch_related(None)
+        fields = list(self.fast_serializer_class.get_value_fields(context))
+        # the paginator reads its sort keys off each row, so those have to come along
+        sort_keys = [term.lstrip('-') for term in queryset.query.order_by if isinstance(term, str)]
+        fields += [name for name in (*sort_keys, *queryset.query.annotations) if name not in fields]
+        return queryset.values(*fields)
+
+    def list(self, request, *args, **kwargs):
+        if self.fast_serializer_class is None:
+            return super().list(request, *args, **kwargs)
+
+        context = self.get_serializer_context()
+        rows = self.get_fast_rows(self.filter_queryset(self.get_queryset()), context)
+        page = self.paginate_queryset(rows)
+        serializer = self.fast_serializer_class(rows if page is None else page, context=context)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    async def alist(self, request, *args, **kwargs):
+        if self.fast_serializer_class is None:
+            return await super().alist(request, *args, **kwargs)
+
+        context = self.get_serializer_context()
+        rows = self.get_fast_rows(await self.afilter_queryset(self.get_queryset()), context)
+        page = await self.apaginate_queryset(rows)
+        serializer = self.fast_serializer_class(rows if page is None else page, context=context)
+        if page is not None:
+            return self.get_paginated_response(await serializer.adata())
+        return Response(await serializer.adata())
+
+
+class CategoryReadOnlyViewSet(ReplicaReadMixin, CachedResponseMixin, AsyncReadOnlyMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
     pagination_class = None   # <--- disable cursor pagination here
 
 
-class TagReadOnlyViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Tag.objects.all().distinct()
+class TagReadOnlyViewSet(ReplicaReadMixin, CachedResponseMixin, AsyncReadOnlyMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [AllowAny]
     pagination_class = None   # <--- disable cursor pagination here
@@ -25,13 +148,295 @@ class TagReadOnlyViewSet(viewsets.ReadOnlyModelViewSet):
 
 
 
-class PostReadOnlyViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Post.objects.all().select_related('category','author').prefetch_related('tags').distinct()
+class PostReadOnlyViewSet(ReplicaReadMixin, CachedResponseMixin, FastListMixin, AsyncReadOnlyMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Post.objects.all().select_related('category','author').prefetch_related(
+        Prefetch('tags', queryset=Tag.objects.order_by('id'))
+    )
     serializer_class = PostListSerializer
+    fast_serializer_class = PostListFastSerializer
     permission_classes = [AllowAny]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, PostSearchFilter, PostOrderingFilter]
     filterset_class = PostFilter
-    search_fields = ['title', 'body', 'author__username', 'category__name', 'tags__name']
-    ordering_fields = ['created_at', 'title', 'author__username']
+    search_fields = ['title', 'body', 'author__username', 'category__name', 'tags__name']  # fallback when no search index
+    ordering_fields = ['created_at', 'title', 'author__username', 'rank']
     ordering = ['-created_at']
     pagination_class = PostCursorPagination
+    # not `export`: a change feed read from a lagging replica would skip changes for good
+    replica_actions = ('list', 'retrieve', 'facets', 'related', 'trending', 'by_slug', 'batch')
+
+    def get_requested_fields(self):
+        if not hasattr(self, '_requested_fields'):
+            self._requested_fields = get_requested_fields(
+                self.request, PostListSerializer.Meta.fields, POST_DEFAULT_FIELDS
+            )
+        return self._requested_fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.get_requested_fields()
+        return context
+
+    def get_queryset(self):
+        # load only the columns the requested fields need (`body` is most of the row)
+        queryset = super().get_queryset()
+        fields = self.get_requested_fields()
+        columns = post_columns(fields) + ['created_at']
+        relations = sorted({column.split('__')[0] for column in columns if '__' in column})
+        queryset = queryset.select_related(None)
+        if relations:
+            queryset = queryset.select_related(*relations)
+        if 'tag' not in fields:
+            queryset = queryset.prefetch_related(None)
+        return queryset.only(*columns)
+
+    async def afilter_queryset(self, queryset):
+        await aget_search_backend(queryset.db)   # PostSearchFilter's first lookup reads the schema
+        return self.filter_queryset(queryset)
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request, *args, **kwargs):
+        return self.cached_response(self.get_facets, request, *args, **kwargs)
+
+    def get_facets(self, request, *args, **kwargs):
+        """
+        Per-category and per-tag post counts for the posts matching the same
+        `?category=`/`?tag=`/`?search=` filters as the list, in two grouped queries.
+        """
+        post_ids = self.filter_queryset(self.get_queryset()).order_by().values('id')
+
+        categories = (
+            Post.objects.filter(id__in=post_ids, category__isnull=False)
+            .values('category__slug', 'category__name')
+            .annotate(count=Count('id'))
+            .order_by('-count', 'category__name')
+        )
+        tags = (
+            Post.tags.through.objects.filter(post_id__in=post_ids)
+            .values('tag__slug', 'tag__name')
+            .annotate(count=Count('post_id'))
+            .order_by('-count', 'tag__name')
+        )
+        return Response({
+            'categories': [
+                {'slug': row['category__slug'], 'name': row['category__name'], 'count': row['count']}
+                for row in categories
+            ],
+            'tags': [
+                {'slug': row['tag__slug'], 'name': row['tag__name'], 'count': row['count']}
+                for row in tags
+            ],
+        })
+
+
+    @action(detail=True, methods=['get'])
+    def related(self, request, *args, **kwargs):
+        return self.cached_response(self.get_related, request, *args, **kwargs)
+
+    def get_related(self, request, *args, **kwargs):
+        """
+        The post's most similar posts, best first, from the table kept by
+        `api.related`, each with its `score`. Takes the list's `?fields=`.
+        """
+        try:
+            post_id = int(self.kwargs['pk'])
+        except ValueError:
+            raise Http404
+        related = list(
+            RelatedPost.objects.filter(post_id=post_id).order_by('-score', 'related_id')
+            .values_list('related_id', 'score')[:get_related_limit()]
+        )
+        if not related and not Post.objects.filter(pk=post_id).exists():
+            raise Http404('No Post matches the given query.')
+
+        return Response({'results': self.ranked_posts((related_id, {'score': round(score, 4)}) for related_id, score in related)})
+
+    @action(detail=False, methods=['get'])
+    def trending(self, request, *args, **kwargs):
+        return self.cached_response(self.get_trending, request, *args, **kwargs)
+
+    def get_trending(self, request, *args, **kwargs):
+        """
+        The most viewed posts, recent views counting most; `?by=views` for
+        views of all time. Read off the PostStats counts kept by `api.counters`,
+        so views from the last flush interval aren't in yet.
+        """
+        by = request.query_params.get('by', 'trending')
+        if by not in ('trending', 'views'):
+            raise ValidationError({'by': ["Must be 'trending' or 'views'."]})
+        stats = (
+            PostStats.objects.order_by('-' + by, 'post_id')
+            .values_list('post_id', 'views', 'trending')[:get_trending_limit()]
+        )
+        now = timezone.now()
+        return Response({'results': self.ranked_posts(
+            (post_id, {'views': views, 'trending': round(decayed_views(trending, now), 2)})
+            for post_id, views, trending in stats
+        )})
+
+    def ranked_posts(self, ranked):
+        """
+        Serialized posts in the order of `ranked` ((post_id, extra fields)
+        pairs), with the list's `?fields=`.
+        """
+        extras = dict(ranked)
+        position = {post_id: n for n, post_id in enumerate(extras)}
+        context = self.get_serializer_context()
+        # ordered by id so the rows carry it whatever `?fields=` asks for
+        queryset = self.get_queryset().filter(pk__in=list(position)).order_by('id')
+        rows = sorted(self.get_fast_rows(queryset, context), key=lambda row: position[row['id']])
+        results = self.fast_serializer_class(rows, context=context).data
+        for row, result in zip(rows, results):
+            result.update(extras[row['id']])
+        return results
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.count_view(super().retrieve(request, *args, **kwargs))
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return self.count_view(await super().aretrieve(request, *args, **kwargs))
+
+    def count_view(self, response, post_id=None):
+        # cached and 304 responses are views too
+        if response.status_code in (200, 304) and getattr(settings, 'VIEW_COUNTS', True):
+            view_counter.record(post_id or int(self.kwargs['pk']))
+        return response
+
+    @action(detail=False, methods=['get'], url_path=r'by-slug/(?P<slug>[-\w]+)')
+    def by_slug(self, request, slug, *args, **kwargs):
+        """The post with this slug, as `retrieve` has it, from the per-post cache (`api.postcache`)."""
+        posts, slug_ids = get_cached_posts(slugs=[slug])
+        if slug not in slug_ids:
+            raise Http404('No Post matches the given query.')
+        post_id = slug_ids[slug]
+        return self.count_view(Response(self.cached_posts([posts[post_id]])[0]), post_id)
+
+    @action(detail=False, methods=['get'])
+    def batch(self, request, *args, **kwargs):
+        """
+        Up to POST_BATCH_MAX posts by `?ids=` and `?slugs=` (comma-separated),
+        in the order asked for, from the per-post cache (`api.postcache`).
+        `missing` lists the ids and slugs of posts that don't exist.
+        """
+        ids = self.get_batch_param('ids')
+        try:
+            ids = list(dict.fromkeys(int(value) for value in ids))
+        except ValueError:
+            raise ValidationError({'ids': ['Expected comma-separated post ids.']})
+        slugs = list(dict.fromkeys(self.get_batch_param('slugs')))
+        limit = getattr(settings, 'POST_BATCH_MAX', 100)
+        if len(ids) + len(slugs) > limit:
+            raise ValidationError({'non_field_errors': ['At most %d ids and slugs together.' % limit]})
+
+        posts, slug_ids = get_cached_posts(ids, slugs)
+        order = [post_id for post_id in ids if post_id in posts] + [slug_ids[slug] for slug in slugs if slug in slug_ids]
+        return Response({
+            'results': self.cached_posts([posts[post_id] for post_id in dict.fromkeys(order)]),
+            'missing': {
+                'ids': [post_id for post_id in ids if post_id not in posts],
+                'slugs': [slug for slug in slugs if slug not in slug_ids],
+            },
+        })
+
+    def get_batch_param(self, name):
+        return [value.strip() for param in self.request.query_params.getlist(name) for value in param.split(',') if value.strip()]
+
+    def cached_posts(self, entries):
+        """Serialize (row, tag names) entries from `api.postcache` with the list's `?fields=`."""
+        rows = [row for row, _ in entries]
+        tags = {row['id']: names for row, names in entries}
+        return self.fast_serializer_class(rows, context=self.get_serializer_context()).to_representation(rows, tags)
+
+    @action(detail=False, methods=['post'], permission_classes=[CanImportPosts])
+    def bulk(self, request, *args, **kwargs):
+        """
+        Create or update up to BULK_IMPORT_MAX_ROWS posts in one transaction
+        (`api.importer`). The body is a JSON list of rows shaped like the
+        export's records; a row with a `slug` updates the post that has it,
+        keeping its author, category and tags where the row leaves them out.
+        Answers with one result per row, in order; invalid rows are skipped.
+        """
+        rows = request.data
+        if not isinstance(rows, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of posts.']})
+        if len(rows) > get_import_max_rows():
+            raise ValidationError({'non_field_errors': ['At most %d posts per request.' % get_import_max_rows()]})
+        results = import_posts(rows, author=request.user)
+        counts = {'created': 0, 'updated': 0, 'error': 0}
+        for result in results:
+            counts[result['status']] += 1
+        return Response({
+            'created': counts['created'], 'updated': counts['updated'], 'errors': counts['error'], 'results': results,
+        })
+
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request, *args, **kwargs):
+        """
+        Every post as NDJSON (default) or CSV (`?format=csv`, `Accept: text/csv`),
+        streamed. `?since=<X-Changes-Until of the last run>` turns it into a
+        change feed: posts changed since then, plus `{"id", "deleted": true}`
+        records for posts deleted since then. Consecutive runs can repeat a
+        post (see api.export); apply records by id.
+        """
+        export = PostExport(
+            fields=get_requested_fields(request, EXPORT_FIELDS, EXPORT_FIELDS),
+            since=parse_since(request.query_params.get('since')),
+            request=request,
+        )
+        renderer = request.accepted_renderer
+        content = export.stream(renderer.format)
+        if isinstance(request._request, ASGIRequest):
+            content = aiterate(content)
+        response = StreamingHttpResponse(content, content_type='%s; charset=utf-8' % renderer.media_type)
+        response['X-Changes-Until'] = export.until_value
+        return response
+
+
+class SuggestView(APIView):
+    """
+    Typeahead: categories, tags and posts with a word starting with `?q=`
+    (up to `?limit=`, default 5, each), from the in-memory index in `api.suggest`.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 5)), 1), 20)
+        except ValueError:
+            raise ValidationError({'limit': ['A whole number is required.']})
+        return Response(suggester.suggest(request.query_params.get('q', ''), limit))
+
+
+class ArchiveView(APIView):
+    """
+    Post counts per month, per category and per month and category, for the
+    archive sidebar; `?category=slug` counts only that category. Read from
+    the counts kept in `api.archive`; `/api/posts/?year=&month=` lists a month.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        category = request.query_params.get('category', '').strip().lower() or None
+        with replica_reads():
+            return Response(get_archive(category))
+
+
+class ResponseCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({"content_version": get_content_version(), **cache_stats.as_dict()})
+
+
+def metrics_view(request):
+    """Prometheus text exposition of the in-process request metrics (staff only)."""
+    if not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponseForbidden("Staff only.")
+    cache = cache_stats.as_dict()
+    body = metrics.render_prometheus(extra=[
+        ("api_response_cache_hits_total", "counter", "Response cache hits.", cache["hits"]),
+        ("api_response_cache_misses_total", "counter", "Response cache misses.", cache["misses"]),
+        ("api_response_cache_not_modified_total", "counter", "Responses answered with 304.", cache["not_modified"]),
+        ("api_response_cache_coalesced_total", "counter", "Misses served from a concurrent identical request's render.", cache["coalesced"]),
+        ("api_response_cache_coalesce_timeouts_total", "counter", "Coalesced misses that stopped waiting and rendered themselves.", cache["coalesce_timeouts"]),
+    ])
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -9,8 +9,26 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from asgiref.sync import sync_to_async
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    if scope['type'] != 'lifespan':
+        return await django_application(scope, receive, send)
+    # Django doesn't speak lifespan. uvicorn's worker dies by the SIGTERM it was
+    # stopped with, so atexit never runs: flush the view counts here instead.
+    from api.counters import view_counter
+
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await sync_to_async(view_counter.flush)()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
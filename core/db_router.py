@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, InterfaceError, OperationalError, connections
+from django.db.backends.signals import connection_created
+
+# Read replicas (settings.DATABASE_REPLICAS).
+#
+# Only `api` models read inside `replica_reads()` come from a replica: the
+# read-only API views wrap their requests in it. Everything else (admin, auth,
+# sessions, management commands) stays on "default". So does a client that wrote
+# recently: PrimaryPinMiddleware notes any write during a request and sets a
+# cookie that keeps the client's reads on the primary for DATABASE_REPLICA_LAG
+# seconds, so it sees its own changes. A replica that fails to connect or to
+# run a query is skipped for DATABASE_REPLICA_RETRY seconds; with none left,
+# reads go to the primary.
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = "db_primary_pin"
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+_replica_reads = ContextVar("replica_reads", default=False)
+_request_state = ContextVar("db_request_state", default=None)
+
+
+class RequestState:
+    __slots__ = ("pinned", "wrote", "replica")
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.replica = None   # one replica per request, so its queries see one snapshot
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Let reads inside the block go to a replica."""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_used():
+    """Whether the current request has read from a replica."""
+    state = _request_state.get()
+    return state is not None and state.replica is not None
+
+
+def in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class ReplicaPool:
+    """Per-process replica selection and health."""
+    check_interval = 5.0   # seconds before an idle replica's connection is checked again
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next = 0
+        self.last_used = {}
+        self.down_until = {}
+        self.checked_at = {}
+
+    def choose(self):
+        aliases = settings.DATABASE_REPLICAS
+        selection = settings.DATABASE_REPLICA_SELECTION
+        if selection == "round_robin":
+            with self._lock:
+                start, self._next = self._next, self._next + 1
+            candidates = [aliases[(start + i) % len(aliases)] for i in range(len(aliases))]
+        elif selection == "least_recent":
+            candidates = sorted(aliases, key=lambda alias: self.last_used.get(alias, 0))
+        else:
+            raise ImproperlyConfigured(
+                "DATABASE_REPLICA_SELECTION must be 'round_robin' or 'least_recent', not %r" % selection
+            )
+        for alias in candidates:
+            if self.is_healthy(alias):
+                self.last_used[alias] = time.monotonic()
+                return alias
+        return None
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        if self.down_until.get(alias, 0) > now:
+            return False
+        if now - self.checked_at.get(alias, -self.check_interval) < self.check_interval:
+            return True
+        if in_event_loop():
+            # no blocking check from async code; a failing query still marks it down
+            return True
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT 1")
+        except DatabaseError as exc:
+            self.mark_down(alias, exc)
+            # drop this thread's connection so the next attempt reconnects
+            connections[alias].close()
+            return False
+        self.checked_at[alias] = now
+        return True
+
+    def mark_down(self, alias, exc):
+        logger.warning("Database replica %r unavailable, skipping it for %ss: %s", alias, settings.DATABASE_REPLICA_RETRY, exc)
+        self.down_until[alias] = time.monotonic() + settings.DATABASE_REPLICA_RETRY
+
+
+pool = ReplicaPool()
+
+
+def install_failure_watch(sender, connection, **kwargs):
+    # a replica that starts failing queries mid-request is taken out of rotation
+    if connection.alias not in settings.DATABASE_REPLICAS:
+        return
+
+    def watch(execute, sql, params, many, context):
+        try:
+            return execute(sql, params, many, context)
+        except (InterfaceError, OperationalError) as exc:
+            pool.mark_down(connection.alias, exc)
+            raise
+
+    connection.execute_wrappers.append(watch)
+
+
+connection_created.connect(install_failure_watch)
+
+
+def install_write_watch(sender, connection, **kwargs):
+    # writes that name their database (`.using("default")`) never ask the router
+    if connection.alias in settings.DATABASE_REPLICAS:
+        return
+
+    def watch(execute, sql, params, many, context):
+        state = _request_state.get()
+        if state is not None and not state.wrote and sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+            state.wrote = True
+        return execute(sql, params, many, context)
+
+    connection.execute_wrappers.append(watch)
+
+
+connection_created.connect(install_write_watch)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # auth and sessions stay on the primary even inside the API views
+        if not _replica_reads.get() or model._meta.app_label != "api":
+            return None
+        state = _request_state.get()
+        if state is None:
+            return pool.choose()
+        if state.pinned or state.wrote:
+            return None
+        if state.replica is None:
+            state.replica = pool.choose()
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema through replication
+        return db not in settings.DATABASE_REPLICAS
+
+
+class PrimaryPinMiddleware:
+    """
+    Tracks writes per request for ReplicaRouter and pins clients that wrote
+    to the primary (see module comment). Does nothing without replicas.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        state = RequestState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.finish(state, response)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        state = RequestState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _request_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_state.reset(token)
+        return self.finish(state, response)
+
+    def finish(self, state, response):
+        if state.wrote and settings.DATABASE_REPLICA_LAG:
+            response.set_cookie(
+                PIN_COOKIE, "1", max_age=math.ceil(settings.DATABASE_REPLICA_LAG), httponly=True,
+                samesite="Lax", secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
@@ -58,8 +58,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.instrumentation.RequestInstrumentationMiddleware",  # first: Server-Timing covers the whole stack
+    "core.db_router.PrimaryPinMiddleware",         # before anything that writes (sessions): pins writers to the primary
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",  # serve static in prod
+    "core.middleware.StaticFilesMiddleware",       # WhiteNoise (async-capable): serve static in prod
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",       # must be before CommonMiddleware
     "django.middleware.common.CommonMiddleware",
@@ -103,16 +105,156 @@ WSGI_APPLICATION = "core.wsgi.application"
 # Database: use DATABASE_URL if present (Postgres on Render), otherwise fallback to sqlite
 DATABASE_URL = env_str(os.environ.get("DATABASE_URL") or os.environ.get("DATABASE"))
 
-if DATABASE_URL:
+# Read replicas: DATABASE_REPLICA_URLS is a comma-separated list of URLs that become
+# "replica1", "replica2", ... (locally, two SQLite files will do:
+# `cp db.sqlite3 replica.sqlite3`, then DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3)
+DATABASE_REPLICA_URLS = [u.strip() for u in env_str(os.environ.get("DATABASE_REPLICA_URLS")).split(",") if u.strip()]
+
+if DATABASE_URL or DATABASE_REPLICA_URLS:
     try:
         import dj_database_url
     except Exception as e:
         raise RuntimeError("dj-database-url is required to parse DATABASE_URL. Install it (pip install dj-database-url).") from e
 
+if DATABASE_URL:
     DATABASES = {"default": dj_database_url.parse(DATABASE_URL, conn_max_age=600)}
 else:
     DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": BASE_DIR / "db.sqlite3"}}
 
+for _n, _url in enumerate(DATABASE_REPLICA_URLS, start=1):
+    # tests run against the primary's test database
+    DATABASES[f"replica{_n}"] = {**dj_database_url.parse(_url, conn_max_age=600), "TEST": {"MIRROR": "default"}}
+
+# SQLite: WAL lets readers carry on while a write commits (the default rollback
+# journal locks them out), and the pragmas below run on every new connection.
+# SQLITE_TUNED=0 keeps SQLite's defaults. IMMEDIATE transactions take the write
+# lock up front, so the busy timeout applies instead of failing on lock upgrade.
+SQLITE_TUNED = env_bool(os.environ.get("SQLITE_TUNED"), True)
+SQLITE_OPTIONS = {
+    "init_command": "; ".join([
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA mmap_size=%d" % int(env_str(os.environ.get("SQLITE_MMAP_SIZE") or 256 * 1024 * 1024)),
+        "PRAGMA cache_size=-%d" % int(env_str(os.environ.get("SQLITE_CACHE_KB") or 64 * 1024)),
+    ]),
+    "timeout": float(env_str(os.environ.get("SQLITE_BUSY_TIMEOUT") or 10)),
+    "transaction_mode": "IMMEDIATE",
+}
+
+# Postgres: DATABASE_POOL=1 uses Django's connection pool (psycopg 3 + psycopg_pool)
+# instead of one persistent connection per worker thread. Connections go back to
+# the pool at the end of each request, so CONN_MAX_AGE is 0 with it.
+DATABASE_POOL = env_bool(os.environ.get("DATABASE_POOL"), False)
+DATABASE_POOL_OPTIONS = {
+    "min_size": int(env_str(os.environ.get("DATABASE_POOL_MIN_SIZE") or 2)),
+    "max_size": int(env_str(os.environ.get("DATABASE_POOL_MAX_SIZE") or 10)),
+    "timeout": float(env_str(os.environ.get("DATABASE_POOL_TIMEOUT") or 10)),   # wait for a free connection
+    "max_idle": float(env_str(os.environ.get("DATABASE_POOL_MAX_IDLE") or 300)),
+    "max_lifetime": float(env_str(os.environ.get("DATABASE_POOL_MAX_LIFETIME") or 3600)),
+}
+
+for _db in DATABASES.values():
+    if _db["ENGINE"] == "django.db.backends.sqlite3" and SQLITE_TUNED:
+        _db["OPTIONS"] = {**SQLITE_OPTIONS, **_db.get("OPTIONS", {})}
+    elif _db["ENGINE"] == "django.db.backends.postgresql" and DATABASE_POOL:
+        _db["CONN_MAX_AGE"] = 0
+        _db["OPTIONS"] = {**_db.get("OPTIONS", {}), "pool": DATABASE_POOL_OPTIONS}
+
+# The read-only API views read from the replicas (core/db_router.py): picked
+# "round_robin" or "least_recent", skipped while they fail to connect. A client
+# that wrote stays on the primary for DATABASE_REPLICA_LAG seconds, about how
+# far the replicas may trail it.
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_REPLICA_SELECTION = env_str(os.environ.get("DATABASE_REPLICA_SELECTION")) or "round_robin"
+DATABASE_REPLICA_LAG = float(env_str(os.environ.get("DATABASE_REPLICA_LAG") or 5))
+DATABASE_REPLICA_RETRY = float(env_str(os.environ.get("DATABASE_REPLICA_RETRY") or 30))
+DATABASE_ROUTERS = ["core.db_router.ReplicaRouter"] if DATABASE_REPLICAS else []
+
+# Cache: in-process locmem by default; set CACHE_DIR to share the cache between
+# workers through the filesystem (no Redis required). The API's content version
+# is kept in this cache, so with more than one worker process it has to be
+# shared: in locmem a write only invalidates the worker that handled it
+# (`manage.py check --deploy` warns, api.W001).
+CACHE_DIR = env_str(os.environ.get("CACHE_DIR"))
+if CACHE_DIR:
+    CACHES = {"default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": CACHE_DIR,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }}
+else:
+    CACHES = {"default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "blog-api",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }}
+
+# Response cache for the read-only API (api/cache.py)
+API_CACHE_ALIAS = "default"
+API_CACHE_TIMEOUT = int(env_str(os.environ.get("API_CACHE_TIMEOUT") or 300))
+# Identical concurrent misses share one render (single flight), waiting at most
+# API_COALESCE_WAIT seconds for it. API_COALESCE_LOCK coordinates across worker
+# processes through the cache; only useful with a shared cache (CACHE_DIR), and
+# best-effort there since the file cache's add() is not atomic.
+API_COALESCE = env_bool(os.environ.get("API_COALESCE"), True)
+API_COALESCE_WAIT = float(env_str(os.environ.get("API_COALESCE_WAIT") or 2))
+API_COALESCE_LOCK = env_bool(os.environ.get("API_COALESCE_LOCK"), False)
+
+# Serve the read-only post/category/tag routes from async views (api/async_views.py).
+# Turn on under an ASGI server (see the `asgi` entry in Procfile); under WSGI
+# every async view would spin up its own event loop.
+API_ASYNC_VIEWS = env_bool(os.environ.get("API_ASYNC_VIEWS"), False)
+
+# Related posts (api/related.py): how many are kept per post, the score multiplier
+# for sharing a category, and the gap in creation dates that halves a score.
+# Changes take effect after `manage.py rebuild_related_posts`.
+RELATED_POSTS_LIMIT = int(env_str(os.environ.get("RELATED_POSTS_LIMIT") or 10))
+RELATED_CATEGORY_BOOST = float(env_str(os.environ.get("RELATED_CATEGORY_BOOST") or 0.5))
+RELATED_HALF_LIFE_DAYS = float(env_str(os.environ.get("RELATED_HALF_LIFE_DAYS") or 180))
+# Tag edits update the affected lists on a background thread once they commit
+# (RELATED_UPDATES_SYNC: right after the commit, in the request), with tag
+# weights cached for RELATED_WEIGHTS_TIMEOUT seconds between rebuilds.
+RELATED_UPDATES_SYNC = env_bool(os.environ.get("RELATED_UPDATES_SYNC"), False)
+RELATED_WEIGHTS_TIMEOUT = int(env_str(os.environ.get("RELATED_WEIGHTS_TIMEOUT") or 3600))
+
+# Post view counts (api/counters.py): buffered per process and flushed every
+# VIEW_FLUSH_INTERVAL seconds (0: only at exit). A view's weight in the trending
+# score halves every TRENDING_HALF_LIFE_HOURS; changing it rescales the scores
+# already stored, so expect the ranking to settle over a few half-lives.
+VIEW_COUNTS = env_bool(os.environ.get("VIEW_COUNTS"), True)
+VIEW_FLUSH_INTERVAL = float(env_str(os.environ.get("VIEW_FLUSH_INTERVAL") or 10))
+TRENDING_HALF_LIFE_HOURS = float(env_str(os.environ.get("TRENDING_HALF_LIFE_HOURS") or 24))
+TRENDING_POSTS_LIMIT = int(env_str(os.environ.get("TRENDING_POSTS_LIMIT") or 20))
+
+# Typeahead index (api/suggest.py), one per process: titles of the newest
+# SUGGEST_MAX_POSTS posts plus every tag and category name, keys cut to
+# SUGGEST_KEY_LENGTH characters, rebuilt every SUGGEST_REFRESH seconds. Takes
+# about 1KB per post with the defaults.
+SUGGEST_MAX_POSTS = int(env_str(os.environ.get("SUGGEST_MAX_POSTS") or 100_000))
+SUGGEST_KEY_LENGTH = int(env_str(os.environ.get("SUGGEST_KEY_LENGTH") or 32))
+SUGGEST_REFRESH = float(env_str(os.environ.get("SUGGEST_REFRESH") or 300))
+
+# Per-post cache behind /api/posts/by-slug/{slug}/ and /api/posts/batch/
+# (api/postcache.py), in the API_CACHE_ALIAS cache; entries are deleted when
+# their post changes, so the timeout only bounds what a missed delete costs.
+POST_CACHE_TIMEOUT = int(env_str(os.environ.get("POST_CACHE_TIMEOUT") or 3600))
+POST_BATCH_MAX = int(env_str(os.environ.get("POST_BATCH_MAX") or 100))
+
+# Change feed (/api/posts/export/?since=, api/export.py): X-Changes-Until trails
+# the export by this many seconds, so writes still in a transaction when the
+# export reads aren't skipped. Keep it above the longest write transaction.
+EXPORT_COMMIT_MARGIN = float(env_str(os.environ.get("EXPORT_COMMIT_MARGIN") or 60))
+
+# Bulk import (POST /api/posts/bulk/, api/importer.py): posts per request. A
+# full batch of long posts is more than Django's default 2.5MB request body,
+# hence the larger DATA_UPLOAD_MAX_MEMORY_SIZE.
+BULK_IMPORT_MAX_ROWS = int(env_str(os.environ.get("BULK_IMPORT_MAX_ROWS") or 1000))
+DATA_UPLOAD_MAX_MEMORY_SIZE = int(env_str(os.environ.get("DATA_UPLOAD_MAX_MEMORY_SIZE") or 20 * 1024 * 1024))
+
+# Post admin changelist (api/admin.py): counts up to this many rows exactly,
+# then takes the database's row estimate rather than a COUNT(*) of every post.
+ADMIN_EXACT_COUNT_LIMIT = int(env_str(os.environ.get("ADMIN_EXACT_COUNT_LIMIT") or 10_000))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -135,6 +277,11 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = Path(os.environ.get("MEDIA_ROOT", BASE_DIR / "media"))
 
+# Responsive renditions of Post.image (api/images.py)
+IMAGE_RENDITION_WIDTHS = (320, 640, 1024)
+IMAGE_RENDITION_WORKERS = int(env_str(os.environ.get("IMAGE_RENDITION_WORKERS") or 2))
+IMAGE_RENDITIONS_SYNC = env_bool(os.environ.get("IMAGE_RENDITIONS_SYNC"), False)
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -142,6 +289,10 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "api.pagination.PostCursorPagination",
     "PAGE_SIZE": 10,
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.FastJSONRenderer",   # orjson when installed, same bytes as JSONRenderer
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     "DEFAULT_FILTER_BACKENDS": [
         "django_filters.rest_framework.DjangoFilterBackend",
         "rest_framework.filters.SearchFilter",
@@ -161,10 +312,28 @@ if not DEBUG:
     SECURE_HSTS_PRELOAD = True
     SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
 
-# Logging - basic console output
+# Queries slower than this (ms) are logged to "api.slow_queries" with their SQL and route
+SLOW_QUERY_MS = int(env_str(os.environ.get("SLOW_QUERY_MS") or 200))
+SLOW_QUERY_LOG = env_str(os.environ.get("SLOW_QUERY_LOG"))  # optional file path
+
+# Logging - console output, plus the slow-query log
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
-    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "formatters": {
+        "verbose": {"format": "%(asctime)s %(levelname)s %(name)s %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+        "slow_queries": {"class": "logging.StreamHandler", "formatter": "verbose"},
+    },
     "root": {"handlers": ["console"], "level": "INFO"},
+    "loggers": {
+        "api.slow_queries": {"handlers": ["slow_queries"], "level": "WARNING", "propagate": False},
+    },
 }
+
+if SLOW_QUERY_LOG:
+    LOGGING["handlers"]["slow_queries"] = {
+        "class": "logging.FileHandler", "filename": SLOW_QUERY_LOG, "formatter": "verbose",
+    }
@@ -0,0 +1,16 @@
+"""
+core/test_settings.py — the settings the test suite runs under. `manage.py test`
+picks them by default; other runners set DJANGO_SETTINGS_MODULE=core.test_settings.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+# A second connection to the primary's test database (TEST MIRROR), for the
+# replica routing tests. It isn't in DATABASE_REPLICAS unless a test puts it there.
+TEST_REPLICA_ALIAS = "replica_test"
+DATABASES = {**DATABASES, TEST_REPLICA_ALIAS: {**DATABASES["default"], "TEST": {"MIRROR": "default"}}}
+
+# no background flush thread: it would outlive the test database and write view
+# counts to the real one. Tests flush (or take) the counts themselves.
+VIEW_FLUSH_INTERVAL = 0
@@ -6,12 +6,29 @@ from django.conf.urls.static import static
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from api.views import *
+from api.async_views import async_urlpatterns
 
 router = DefaultRouter()
 router.register(r'posts', PostReadOnlyViewSet, basename='post')
 router.register(r'category', CategoryReadOnlyViewSet, basename='category')
 router.register(r'tags', TagReadOnlyViewSet, basename='tags')
+
+# ASGI deployments answer the read routes from the async ORM; anything those
+# patterns don't match (facets, format suffixes) falls through to the router
+async_routes = []
+if settings.API_ASYNC_VIEWS:
+    async_routes = (
+        async_urlpatterns('posts', PostReadOnlyViewSet, 'post')
+        + async_urlpatterns('category', CategoryReadOnlyViewSet, 'category')
+        + async_urlpatterns('tags', TagReadOnlyViewSet, 'tags')
+    )
+
 urlpatterns = [
+    path('api/', include(async_routes)),
+    path('api/suggest/', SuggestView.as_view(), name='suggest'),
+    path('api/archive/', ArchiveView.as_view(), name='archive'),
+    path('api/_cache/', ResponseCacheStatsView.as_view(), name='response-cache-stats'),
+    path('api/_metrics', metrics_view, name='metrics'),
     path('api/', include(router.urls)),
     path('admin/', admin.site.urls),
 ]